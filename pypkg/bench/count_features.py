@@ -0,0 +1,67 @@
+"""
+Benchmark of evaluating event count features: one function call per
+feature (a plain mapping of keys to functions) versus the batched event
+counts family (`features.FeaturePlan`)
+
+Run from the `pypkg` directory like:
+
+    python3 -m bench.count_features
+"""
+
+# Copyright (c) 2026 Aubrey Barnard.
+#
+# This is free, open software licensed under the [MIT License](
+# https://choosealicense.com/licenses/mit/).
+
+
+import random
+import timeit
+
+import esal
+
+from cdmdata import features
+
+
+def mk_feature_records(n_types):
+    return [
+        [id, '{}-{}-{}'.format(cat, typ, func), cat, str(typ), None,
+         'int' if func != 'proportion_events' else 'float', func, None]
+        for (id, (cat, typ, func)) in enumerate((
+            (cat, typ, func)
+            for cat in ('dx', 'px', 'rx') for typ in range(n_types)
+            for func in ('count_events', 'has_event',
+                         'proportion_events')), 1)]
+
+
+def mk_event_sequence(n_events, n_types, seed=0xc0de):
+    rng = random.Random(seed)
+    evs = sorted(
+        (esal.Event(esal.Interval(lo, lo), (
+            rng.choice(('dx', 'px', 'rx')),
+            str(rng.randrange(n_types))), None)
+         for lo in (rng.randrange(3650) for _ in range(n_events))),
+        key=lambda ev: ev.when.lo)
+    return esal.EventSequence(evs, {}, 1)
+
+
+def main(n_types=1000, n_events=200, n_vectors=1000, n_repeats=3):
+    feat_recs = mk_feature_records(n_types)
+    funcs = features.mk_functions(feat_recs)
+    key2idsfuncs = features.map_to_functions(feat_recs, funcs)
+    plan = features.FeaturePlan(key2idsfuncs)
+    ev_seq = mk_event_sequence(n_events, n_types)
+    print('{} features, {} events'.format(len(feat_recs), n_events))
+    print('evaluation   vectors/s  speedup')
+    rates = {}
+    for (name, mapping) in (('per-feature', key2idsfuncs),
+                            ('batched', plan)):
+        secs = min(timeit.repeat(
+            lambda: features.vector(mapping, None, ev_seq),
+            number=n_vectors, repeat=n_repeats))
+        rates[name] = n_vectors / secs
+        print('{:11} {:>10,.0f}  {:.2f}'.format(
+            name, rates[name], rates[name] / rates['per-feature']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Benchmark of record parsers: specialized (`records.mk_parser`) versus
+generic (the original closure)
+
+Run from the `pypkg` directory like:
+
+    python3 -m bench.mk_parser
+"""
+
+# Copyright (c) 2026 Aubrey Barnard.
+#
+# This is free, open software licensed under the [MIT License](
+# https://choosealicense.com/licenses/mit/).
+
+
+import datetime
+import string
+import timeit
+
+from cdmdata import events
+from cdmdata import records
+
+
+headers = {
+    'mixed': list(zip(string.ascii_lowercase, (
+        int, datetime.date.fromisoformat, datetime.date.fromisoformat,
+        str, str, int, float, float))),
+    'events': events.header(datetime.date.fromisoformat),
+}
+
+raw_records = {
+    'mixed': ['123456789', '2013-11-13', '2019-04-30', 'cluster',
+              'penumbra', '987654321', '1.23456789', '9.87654321'],
+    'events': ['123456789', '2013-11-13', '2019-04-30', 'dx', '250.00',
+               '', '{"src": "condition_occurrence"}'],
+}
+
+
+def main(n_records=10 ** 6, n_repeats=3):
+    print('header  parser       records/s  speedup')
+    for (name, header) in headers.items():
+        raw_record = raw_records[name]
+        rates = {}
+        for (prsr_nm, mk_parser) in (
+                ('generic', records._mk_generic_parser),
+                ('specialized', records.mk_parser),
+        ):
+            parse = mk_parser(header)
+            secs = min(timeit.repeat(
+                lambda: parse(raw_record),
+                number=n_records, repeat=n_repeats))
+            rates[prsr_nm] = n_records / secs
+            print('{:7} {:11} {:>10,.0f}  {:.2f}'.format(
+                name, prsr_nm, rates[prsr_nm],
+                rates[prsr_nm] / rates['generic']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Benchmark of converting a long drug history into periods
+(`events.periods`): total time and time to the first period
+
+Run from the `pypkg` directory like:
+
+    python3 -m bench.periods
+"""
+
+# Copyright (c) 2026 Aubrey Barnard.
+#
+# This is free, open software licensed under the [MIT License](
+# https://choosealicense.com/licenses/mit/).
+
+
+import random
+import time
+
+import esal
+
+from cdmdata import events
+
+
+def mk_drug_events(n_events, n_doses, seed=0xd05e):
+    # Overlapping fills that mostly continue the current dose
+    rng = random.Random(seed)
+    evs = []
+    lo = 0
+    dose = 1
+    for _ in range(n_events):
+        lo += rng.randrange(3)
+        if rng.random() < 0.05:
+            dose = rng.randrange(n_doses + 1)
+        evs.append(esal.Event(
+            esal.Interval(lo, lo + rng.randrange(1, 30)), ('rx', 'a'),
+            dose))
+    return evs
+
+
+def main(n_events=10 ** 5, n_doses=4, n_repeats=3):
+    evs = mk_drug_events(n_events, n_doses)
+    span_hi = evs[-1].when.hi
+    print('{:,} events'.format(n_events))
+    for (name, kwds) in (
+            ('plain', {}),
+            ('min_len=7, backoff=2', dict(min_len=7, backoff=2)),
+    ):
+        totals = []
+        firsts = []
+        for _ in range(n_repeats):
+            start = time.perf_counter()
+            prds = events.periods(evs, 0, span_hi, **kwds)
+            next(prds)
+            firsts.append(time.perf_counter() - start)
+            n_prds = 1 + sum(1 for _ in prds)
+            totals.append(time.perf_counter() - start)
+        print('{:22} {:>7,} periods  {:.3f} s total  {:.6f} s to first'
+              .format(name, n_prds, min(totals), min(firsts)))
+
+
+if __name__ == '__main__':
+    main()
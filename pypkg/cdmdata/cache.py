@@ -0,0 +1,216 @@
+"""
+Persistent cache of tables of records as column stores
+
+Converting a CSV file of events into a column store (see `colstore`)
+means later reads skip CSV parsing entirely.  A cache directory holds
+one column store per source file, keyed by a fingerprint of the source
+(its size, modification time, and a hash of a sample of its contents)
+and the format and header used to read it.  When the source changes,
+its fingerprint changes and its stale column store is replaced.  A
+source that cannot be converted gets a marker file (under the same key)
+instead, so the failure is not repeated until the source changes.  The
+cache is limited in size by evicting the least recently used column
+stores, where use is recorded in the modification times of the column
+store files.
+"""
+
+# Copyright (c) 2026 Aubrey Barnard.
+#
+# This is free, open software licensed under the [MIT License](
+# https://choosealicense.com/licenses/mit/).
+
+
+import builtins
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+
+from . import colstore
+from . import events
+
+
+"""Suffix of cached column store files"""
+suffix = '.cols'
+
+"""Suffix of files that mark sources that failed to convert"""
+failed_suffix = '.failed'
+
+_sample_size = 2 ** 16
+_n_samples = 16
+
+
+def fingerprint(filename):
+    """
+    Return a fingerprint of the given file as a hexadecimal string.
+
+    The fingerprint covers the size and modification time of the file
+    and a hash of up to `_n_samples` blocks of its contents spread
+    evenly from its start to its end.  Hashing samples keeps
+    fingerprinting large files quick while still detecting most
+    changes that preserve the size and modification time.
+    """
+    stat = os.stat(filename)
+    hash = hashlib.blake2b(digest_size=16)
+    hash.update('{}|{}|'.format(stat.st_size, stat.st_mtime_ns).encode())
+    with builtins.open(filename, 'rb') as file:
+        if stat.st_size <= _sample_size * _n_samples:
+            hash.update(file.read())
+        else:
+            for idx in range(_n_samples):
+                file.seek((stat.st_size - _sample_size) * idx //
+                          (_n_samples - 1))
+                hash.update(file.read(_sample_size))
+    return hash.hexdigest()
+
+
+class Cache:
+    """
+    Directory of column stores converted from CSV files.
+
+    Column stores are named by a hash of the absolute path of their
+    source followed by a hash of the source fingerprint, format, and
+    header, so that each source has at most one column store.
+    """
+
+    def __init__(self, directory, max_bytes=None, max_entries=None):
+        """
+        directory:
+            Name of the cache directory.  Created if it does not exist.
+        max_bytes:
+            Maximum total size of the column stores in the cache, or
+            `None` for no limit.  The most recently used column store
+            is kept even if it alone exceeds the limit.
+        max_entries:
+            Maximum number of column stores in the cache, or `None` for
+            no limit.
+        """
+        self.directory = pathlib.Path(directory)
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def entries(self):
+        """
+        Return the paths of the column stores in the cache, from least
+        to most recently used.
+        """
+        paths = []
+        for path in self.directory.glob('*' + suffix):
+            try:
+                paths.append((path.stat().st_mtime_ns, path))
+            except FileNotFoundError:
+                # Evicted concurrently
+                continue
+        paths.sort()
+        return [path for (_, path) in paths]
+
+    def column_store(
+            self,
+            csv_filename,
+            csv_format=events.csv_format,
+            header=events.header(),
+            header_detector=True,
+            id_name='id',
+    ):
+        """
+        Return the path of the column store of the given CSV file,
+        converting the file if it is not already cached.
+
+        The arguments are as for `colstore.convert_csv`.  The cache key
+        does not cover the header detector, which must not change
+        between uses of the same cache.  Raises `ValueError` if the file
+        cannot be converted (e.g. because its IDs are not grouped or
+        are not integers).  The failure is recorded, so later calls
+        raise the same error without reading the file again (until it
+        changes).
+        """
+        source = os.path.abspath(csv_filename)
+        source_key = hashlib.blake2b(
+            source.encode(), digest_size=8).hexdigest()
+        key = hashlib.blake2b(json.dumps([
+            fingerprint(source),
+            sorted((name, str(value)) for (name, value)
+                   in csv_format.items()),
+            [field[0] for field in header],
+            id_name,
+        ]).encode(), digest_size=16).hexdigest()
+        path = self.directory / '{}-{}{}'.format(source_key, key, suffix)
+        failed_path = path.with_suffix(failed_suffix)
+        if path.exists():
+            # Record the use
+            os.utime(path)
+        elif failed_path.exists():
+            raise ValueError(failed_path.read_text())
+        else:
+            # Convert into a temporary file and rename it so that a
+            # partial column store is never used
+            fd, tmp_name = tempfile.mkstemp(
+                suffix='.tmp', dir=self.directory)
+            os.close(fd)
+            try:
+                colstore.convert_csv(csv_filename, tmp_name, csv_format,
+                                     header, header_detector, id_name)
+                os.replace(tmp_name, path)
+            except ValueError as error:
+                os.remove(tmp_name)
+                self._remove_stale(source_key, path)
+                failed_path.write_text(str(error))
+                raise
+            except BaseException:
+                os.remove(tmp_name)
+                raise
+            self._remove_stale(source_key, path)
+        self.evict(keep=path)
+        return path
+
+    def _remove_stale(self, source_key, path):
+        # Remove the column stores and failure markers of the given
+        # source, except those with the key of the given path
+        for stale in self.directory.glob('{}-*'.format(source_key)):
+            if (stale.suffix in (suffix, failed_suffix) and
+                    stale.stem != path.stem):
+                _remove(stale)
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used column stores until the cache is
+        within its limits.  Never removes `keep`.
+        """
+        if self.max_bytes is None and self.max_entries is None:
+            return
+        entries = []
+        for path in self.entries():
+            try:
+                entries.append((path, path.stat().st_size))
+            except FileNotFoundError:
+                continue
+        n_bytes = sum(size for (_, size) in entries)
+        n_entries = len(entries)
+        for (path, size) in entries:
+            if ((self.max_bytes is None or n_bytes <= self.max_bytes) and
+                    (self.max_entries is None or
+                     n_entries <= self.max_entries)):
+                break
+            if path == keep:
+                continue
+            _remove(path)
+            n_bytes -= size
+            n_entries -= 1
+
+    def clear(self):
+        """
+        Remove all the column stores and failure markers in the cache.
+        """
+        for path in self.entries():
+            _remove(path)
+        for path in self.directory.glob('*' + failed_suffix):
+            _remove(path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
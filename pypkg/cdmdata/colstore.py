@@ -0,0 +1,481 @@
+"""
+Columnar storage of tables of records that are grouped by ID
+
+A column store is a single binary file that can be memory mapped and
+read without parsing any text.  It holds the records of a table, such
+as a table of events, in columns.  The ID column is stored as a typed
+array of 64-bit integers with an index of the offset of each group of
+records that share an ID.  Columns with few distinct values are
+dictionary encoded: an array of 32-bit codes per column plus a
+dictionary of the distinct text values.  Recently used distinct values
+are cached after they are parsed (according to the header given when
+reading).  Columns whose values are mostly distinct (such as the
+values and JSON of events) are stored plainly: the concatenated text
+of every value plus an array of their end offsets, so that converting
+them needs no dictionary.
+
+File layout (all integers in native byte order, which is recorded):
+
+    magic (8 bytes) | metadata length (8 bytes) | metadata (JSON) |
+    padding | section | padding | section | ...
+
+where each section is an array whose location and type are described in
+the metadata.
+"""
+
+# Copyright (c) 2026 Aubrey Barnard.
+#
+# This is free, open software licensed under the [MIT License](
+# https://choosealicense.com/licenses/mit/).
+
+
+import array
+import builtins
+import functools
+import itertools as itools
+import json
+import mmap
+import os
+import pathlib
+import shutil
+import struct
+import sys
+import tempfile
+
+from . import events
+from . import records
+
+
+"""Identifies a file as a column store"""
+magic = b'CDMCOLS1'
+
+_length_format = struct.Struct('=Q')
+_alignment = 8
+_flush_size = 2 ** 16
+_cache_size = 2 ** 16
+
+
+def is_column_store(filename):
+    """
+    Return whether the given file is a column store.  Anything that is
+    not a filename or path is not a column store.
+    """
+    if not isinstance(filename, (str, pathlib.Path)) or filename == '-':
+        return False
+    # Do not read from pipes and the like, which would lose the data
+    if not os.path.isfile(filename):
+        return False
+    try:
+        with builtins.open(filename, 'rb') as file:
+            return file.read(len(magic)) == magic
+    except OSError:
+        return False
+
+
+class _ColumnWriter:
+    """Dictionary encodes a column into a temporary file of codes"""
+
+    def __init__(self, null_values):
+        self.null_values = null_values
+        # Code 0 is reserved for null
+        self.text2code = {}
+        self.codes = array.array('I')
+        self.file = tempfile.TemporaryFile()
+
+    def append(self, text):
+        if text in self.null_values:
+            self.codes.append(0)
+            return
+        code = self.text2code.get(text)
+        if code is None:
+            code = len(self.text2code) + 1
+            self.text2code[text] = code
+        self.codes.append(code)
+
+    def flush(self):
+        self.codes.tofile(self.file)
+        del self.codes[:]
+
+    def dictionary(self):
+        # Concatenate the encoded texts and make an array of their
+        # offsets.  The dictionary preserves insertion order, so the
+        # texts are in code order.
+        texts = [text.encode() for text in self.text2code]
+        offsets = array.array('q', [0])
+        offsets.extend(itools.accumulate(len(text) for text in texts))
+        return offsets, b''.join(texts)
+
+
+class _PlainColumnWriter:
+    """
+    Writes the texts of a column and their end offsets into temporary
+    files.  Each end offset is doubled and its low bit marks null.
+    """
+
+    def __init__(self, null_values):
+        self.null_values = null_values
+        self.n_bytes = 0
+        self.texts = []
+        self.ends = array.array('q', [0])
+        self.texts_file = tempfile.TemporaryFile()
+        self.ends_file = tempfile.TemporaryFile()
+
+    def append(self, text):
+        if text in self.null_values:
+            self.ends.append(2 * self.n_bytes + 1)
+            return
+        text = text.encode()
+        self.texts.append(text)
+        self.n_bytes += len(text)
+        self.ends.append(2 * self.n_bytes)
+
+    def flush(self):
+        self.texts_file.write(b''.join(self.texts))
+        del self.texts[:]
+        self.ends.tofile(self.ends_file)
+        del self.ends[:]
+
+
+def write(
+        records,
+        filename,
+        header,
+        id_name='id',
+        null_values=('',),
+        plain_names=('val', 'jsn'),
+):
+    """
+    Write the given text records to a column store file.
+
+    records:
+        Iterable of list<str>, as from `csv.reader`.  Records must be
+        grouped by ID (as they are when a file is sorted by ID).
+    filename:
+        Name of the file to create.
+    header:
+        Sequence of (name, type) pairs that describe the fields of each
+        record.  Only the names are used.
+    id_name:
+        Name of the ID field.  IDs must be integers.
+    null_values:
+        Set of texts to store as null.
+    plain_names:
+        Names of the fields to store plainly instead of dictionary
+        encoding them.  Conversion keeps every distinct value of a
+        dictionary encoded field in memory, so this should include all
+        fields with many distinct values.  The default is the fields of
+        events that have many distinct values.
+    """
+    names = [field[0] for field in header]
+    id_idx = names.index(id_name)
+    col_idxs = [idx for idx in range(len(names)) if idx != id_idx]
+    columns = [(_PlainColumnWriter(null_values)
+                if names[col_idx] in plain_names
+                else _ColumnWriter(null_values))
+               for col_idx in col_idxs]
+    ids = array.array('q')
+    starts = array.array('q')
+    seen_ids = set()
+    # Encode the records
+    n_recs = 0
+    prev_id_text = None
+    for record in records:
+        id_text = record[id_idx]
+        if id_text != prev_id_text:
+            id = int(id_text)
+            if id in seen_ids:
+                raise ValueError(
+                    'Records are not grouped by ID: {!r}'.format(id))
+            seen_ids.add(id)
+            ids.append(id)
+            starts.append(n_recs)
+            prev_id_text = id_text
+        for (col_idx, column) in zip(col_idxs, columns):
+            column.append(record[col_idx] if col_idx < len(record) else '')
+        n_recs += 1
+        if n_recs % _flush_size == 0:
+            for column in columns:
+                column.flush()
+    starts.append(n_recs)
+    for column in columns:
+        column.flush()
+    # Lay out the sections
+    sections = [('ids', ids), ('starts', starts)]
+    dictionaries = []
+    plains = []
+    for (col_idx, column) in zip(col_idxs, columns):
+        if isinstance(column, _PlainColumnWriter):
+            plains.append((names[col_idx], column))
+        else:
+            offsets, texts = column.dictionary()
+            dictionaries.append((names[col_idx], column, offsets, texts))
+    meta = {
+        'byteorder': sys.byteorder,
+        'names': names,
+        'id_name': id_name,
+        'n_records': n_recs,
+        'n_groups': len(ids),
+        'sections': {},
+    }
+    # Compute offsets of sections relative to the start of the data
+    position = 0
+    def add_section(name, typecode, n_items, n_bytes):
+        nonlocal position
+        meta['sections'][name] = [position, n_items, typecode]
+        position = _align(position + n_bytes)
+    for (name, arr) in sections:
+        add_section(name, arr.typecode, len(arr), len(arr) * arr.itemsize)
+    for (name, column, offsets, texts) in dictionaries:
+        add_section(name + '.codes', 'I', n_recs, n_recs * 4)
+        add_section(name + '.offsets', 'q', len(offsets),
+                    len(offsets) * offsets.itemsize)
+        add_section(name + '.texts', 'B', len(texts), len(texts))
+    for (name, column) in plains:
+        add_section(name + '.ends', 'q', n_recs + 1, (n_recs + 1) * 8)
+        add_section(name + '.texts', 'B', column.n_bytes, column.n_bytes)
+    # Write the file
+    meta_bytes = json.dumps(meta).encode()
+    data_start = _align(
+        len(magic) + _length_format.size + len(meta_bytes))
+    with builtins.open(filename, 'wb') as file:
+        file.write(magic)
+        file.write(_length_format.pack(len(meta_bytes)))
+        file.write(meta_bytes)
+        def write_section(name, write_data):
+            file.write(b'\0' * (
+                data_start + meta['sections'][name][0] - file.tell()))
+            write_data()
+        for (name, arr) in sections:
+            write_section(name, lambda: arr.tofile(file))
+        for (name, column, offsets, texts) in dictionaries:
+            column.file.seek(0)
+            write_section(name + '.codes',
+                          lambda: shutil.copyfileobj(column.file, file))
+            column.file.close()
+            write_section(name + '.offsets', lambda: offsets.tofile(file))
+            write_section(name + '.texts', lambda: file.write(texts))
+        for (name, column) in plains:
+            for (section, tmp_file) in (('.ends', column.ends_file),
+                                        ('.texts', column.texts_file)):
+                tmp_file.seek(0)
+                write_section(name + section,
+                              lambda: shutil.copyfileobj(tmp_file, file))
+                tmp_file.close()
+
+
+def _align(position):
+    return -(-position // _alignment) * _alignment
+
+
+def convert_csv(
+        csv_filename,
+        store_filename,
+        csv_format=events.csv_format,
+        header=events.header(),
+        header_detector=True,
+        id_name='id',
+):
+    """
+    Convert the given CSV file into a column store.
+
+    The arguments are as for `records.read_csv` and `write`.  The
+    default format and header are those of tables of events.
+    """
+    write(records.read_csv(csv_filename, csv_format, header,
+                           header_detector, parser=False),
+          store_filename, header, id_name)
+
+
+class _Column:
+    """
+    Dictionary encoded column that parses its values lazily and caches
+    the most recently used ones
+    """
+
+    def __init__(self, codes, offsets, texts, parse):
+        self.codes = codes
+        self._offsets = offsets
+        self._texts = texts
+        self._parse = parse
+        self.value = functools.lru_cache(maxsize=_cache_size)(self._value)
+
+    def _value(self, code):
+        # Code 0 is null
+        if code == 0:
+            return None
+        text = str(self._texts[
+            self._offsets[code - 1]:self._offsets[code]], 'utf-8')
+        return self._parse(text) if self._parse is not None else text
+
+    def values(self, start, stop):
+        return map(self.value, self.codes[start:stop])
+
+
+class _PlainColumn:
+    """Plainly stored column that parses its values when read"""
+
+    def __init__(self, ends, texts, parse):
+        self._ends = ends
+        self._texts = texts
+        self._parse = parse
+
+    def values(self, start, stop):
+        ends = self._ends[start:stop + 1].tolist()
+        if not ends:
+            return []
+        # Decode from one copy of the bytes of the records
+        base = ends[0] >> 1
+        data = self._texts[base:ends[-1] >> 1].tobytes()
+        texts = [(data[(lo >> 1) - base:(hi >> 1) - base].decode()
+                  if not hi & 1 else None)
+                 for (lo, hi) in zip(ends, ends[1:])]
+        parse = self._parse
+        if parse is None:
+            return texts
+        return [(parse(text) if text is not None else None)
+                for text in texts]
+
+
+class ColumnStore:
+    """
+    Read-only, memory-mapped column store.
+
+    Acts as a grouped source of records for `events.read_sequences`.
+    Records are lists of values in the order of the stored header where
+    the values have already been parsed.
+    """
+
+    def __init__(self, filename, header=None):
+        """
+        Open the given column store.
+
+        filename:
+            Name of column store file.
+        header:
+            Sequence of (name, type) pairs whose types are used to parse
+            the stored values.  Names must match those stored.  If
+            `None`, values are returned as text.
+        """
+        self._file = builtins.open(filename, 'rb')
+        try:
+            self._mmap = mmap.mmap(
+                self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            self._file.close()
+            raise ValueError('Not a column store: {!r}'.format(filename))
+        view = memoryview(self._mmap)
+        if view[:len(magic)] != magic:
+            self.close()
+            raise ValueError('Not a column store: {!r}'.format(filename))
+        meta_start = len(magic) + _length_format.size
+        (meta_len,) = _length_format.unpack(view[len(magic):meta_start])
+        meta = json.loads(str(view[meta_start:meta_start + meta_len],
+                              'utf-8'))
+        if meta['byteorder'] != sys.byteorder:
+            self.close()
+            raise ValueError('Column store has {} byte order: {!r}'
+                             .format(meta['byteorder'], filename))
+        self.names = tuple(meta['names'])
+        if header is not None:
+            if tuple(field[0] for field in header) != self.names:
+                self.close()
+                raise ValueError(
+                    'Header does not match column store fields: {}'
+                    .format(self.names))
+            types = [field[1] for field in header]
+        else:
+            types = [None] * len(self.names)
+        # Map the sections
+        data_start = _align(meta_start + meta_len)
+        def section(name):
+            offset, n_items, typecode = meta['sections'][name]
+            start = data_start + offset
+            size = n_items * array.array(typecode).itemsize
+            return view[start:start + size].cast(typecode)
+        self._ids = section('ids')
+        self._starts = section('starts')
+        self.id_index = self.names.index(meta['id_name'])
+        def column(name, type):
+            if name + '.ends' in meta['sections']:
+                return _PlainColumn(section(name + '.ends'),
+                                    section(name + '.texts'), type)
+            return _Column(section(name + '.codes'),
+                           section(name + '.offsets'),
+                           section(name + '.texts'), type)
+        self._columns = [
+            (column(name, type) if idx != self.id_index else None)
+            for (idx, (name, type)) in enumerate(zip(self.names, types))]
+        self._id_type = types[self.id_index]
+        self._id2group = None
+
+    def close(self):
+        # Release the memory views before closing the map
+        self._ids = self._starts = self._columns = None
+        if not self._mmap.closed:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Views are still exported (e.g. by `codes`).  The map
+                # will be closed when they are garbage collected.
+                pass
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        """Return the number of groups (IDs)."""
+        return len(self._ids)
+
+    def n_records(self):
+        return self._starts[-1]
+
+    def ids(self):
+        """Return the IDs in stored order."""
+        return self._ids.tolist()
+
+    def _id(self, id):
+        return self._id_type(id) if self._id_type is not None else id
+
+    def _records(self, group_idx):
+        start = self._starts[group_idx]
+        stop = self._starts[group_idx + 1]
+        id = self._id(self._ids[group_idx])
+        fields = [
+            (column.values(start, stop)
+             if column is not None
+             else itools.repeat(id, stop - start))
+            for column in self._columns]
+        return [list(rec) for rec in zip(*fields)]
+
+    def records(self, id):
+        """
+        Return the list of records with the given ID (empty if none).
+        """
+        if self._id2group is None:
+            self._id2group = {id: idx for (idx, id) in enumerate(
+                self._ids.tolist())}
+        group_idx = self._id2group.get(id)
+        return self._records(group_idx) if group_idx is not None else []
+
+    def groups(self, include_ids=None):
+        """
+        Yield (ID, records) pairs in stored order.
+
+        include_ids:
+            Set of IDs to include; all other IDs are skipped without
+            decoding their records.
+        """
+        for (group_idx, id) in enumerate(self._ids):
+            id = self._id(id)
+            if include_ids is None or id in include_ids:
+                yield id, self._records(group_idx)
+
+    def __iter__(self):
+        """Yield all the records in stored order."""
+        for _, recs in self.groups():
+            yield from recs
@@ -1,41 +1,310 @@
 """Common / Core functionality"""
 
-# Copyright (c) 2019 Aubrey Barnard.
+# Copyright (c) 2019, 2026 Aubrey Barnard.
 #
 # This is free, open software licensed under the [MIT License](
 # https://choosealicense.com/licenses/mit/).
 
 
 import builtins
+import bz2
+import datetime
+import functools
+import gzip
 import io
+import lzma
 import pathlib
+import queue
 import sys
+import threading
 import warnings
 
 
-def open(file, mode='rt'):
+def open(
+        file,
+        mode='rt',
+        compression='infer',
+        read_ahead=True,
+        chunk_size=(2 ** 20), # 1 MiB
+        n_chunks=16,
+):
     """
     Open and return the given file.
 
     Convenience function that takes anything that could be turned into a
     file-like object and returns a file-like object.
 
+    Compressed files are decompressed (or compressed) transparently.
+    When reading, decompression happens in a background thread that
+    reads ahead of the consumer so that decompression overlaps parsing.
+    (The decompressors release the GIL, so this uses a second core.)
+
     file: str | pathlib.Path | io.TextIOBase | "-"
         Filename, path, stream, or '-', which indicates to use standard
-        input.  Streams are passed through unmodified.
+        input.  Streams are passed through unmodified.  Standard input
+        is decompressed like a file (by its magic bytes) when reading.
     mode: str
         Passed to `builtins.open`.
+    compression: str | None
+        One of the names in `compressions`, 'infer', or `None`.  If
+        'infer', the compression is determined by the filename suffix
+        and, when reading, by the magic bytes at the start of the file.
+        If `None`, the file is opened as is.
+    read_ahead: bool
+        Whether to decompress in a background thread when reading.
+    chunk_size: int
+        Size in bytes of each read from the decompressor.
+    n_chunks: int
+        Maximum number of decompressed chunks to buffer ahead of the
+        consumer.
     """
     if file == '-':
-        file = sys.stdin
+        file = _open_stdin(
+            mode, compression, read_ahead, chunk_size, n_chunks)
     elif isinstance(file, str) or isinstance(file, pathlib.Path):
-        file = builtins.open(file, mode)
+        file = _open_path(
+            file, mode, compression, read_ahead, chunk_size, n_chunks)
     elif not isinstance(file, io.TextIOBase):
         raise ValueError('Not a file, stream, or filename: {!r}'
                          .format(file))
     return file
 
 
+def _open_lz4(file, mode):
+    try:
+        import lz4.frame
+    except ImportError:
+        raise ImportError(
+            'The `lz4` package is required for LZ4 compression') from None
+    return lz4.frame.open(file, mode)
+
+
+"""
+Mapping of compression names to (filename suffix, magic bytes, opener)
+triples.  Each opener is called like `opener(file, mode)` where `file`
+is a filename or binary file object.
+"""
+compressions = {
+    'gzip': ('.gz', b'\x1f\x8b', gzip.open),
+    'bz2': ('.bz2', b'BZh', bz2.open),
+    'xz': ('.xz', b'\xfd7zXZ\x00', lzma.open),
+    'lz4': ('.lz4', b'\x04\x22\x4d\x18', _open_lz4),
+}
+
+
+def infer_compression(filename, magic=None):
+    """
+    Return the name of the compression of the given file or `None` if it
+    does not appear to be compressed.
+
+    filename: str | pathlib.Path
+        Filename whose suffix is checked first.
+    magic: bytes | None
+        Initial bytes of the file to check if the suffix is not
+        recognized.
+    """
+    suffix = pathlib.Path(filename).suffix.lower()
+    for name, (sfx, _, _) in compressions.items():
+        if suffix == sfx:
+            return name
+    if magic is not None:
+        for name, (_, mgc, _) in compressions.items():
+            if magic.startswith(mgc):
+                return name
+    return None
+
+
+def _open_path(file, mode, compression, read_ahead, chunk_size, n_chunks):
+    is_read = 'r' in mode
+    # Open a binary file to detect compression by magic bytes
+    bin_file = None
+    if compression == 'infer':
+        compression = infer_compression(file)
+        if compression is None and is_read:
+            bin_file = builtins.open(file, 'rb')
+            compression = infer_compression(file, bin_file.peek(8))
+    # Plain files are handled by Python.  A file that was opened to
+    # detect its compression is used as is rather than reopened because
+    # it may be a pipe whose initial bytes cannot be read again.
+    if compression is None:
+        if bin_file is None:
+            return builtins.open(file, mode)
+        if 'b' in mode:
+            return bin_file
+        return io.TextIOWrapper(bin_file)
+    opener = _opener(compression)
+    # Writing and non-read-ahead reading use the compression library
+    # directly
+    if not is_read or (not read_ahead and bin_file is None):
+        return opener(file, mode)
+    if bin_file is None:
+        bin_file = builtins.open(file, 'rb')
+    return _decompress(opener, bin_file, (bin_file,), mode, read_ahead,
+                       chunk_size, n_chunks)
+
+
+def _open_stdin(mode, compression, read_ahead, chunk_size, n_chunks):
+    # Standard input is not closed, so only the decompressor is closed
+    # with the returned stream.  If it is not a buffered binary stream
+    # (e.g. it has been replaced), it is used as is.
+    bin_file = getattr(sys.stdin, 'buffer', None)
+    if 'r' not in mode or not hasattr(bin_file, 'peek'):
+        return sys.stdin
+    if compression == 'infer':
+        compression = infer_compression('-', bin_file.peek(8))
+    if compression is None:
+        return bin_file if 'b' in mode else sys.stdin
+    return _decompress(_opener(compression), bin_file, (), mode,
+                       read_ahead, chunk_size, n_chunks)
+
+
+def _opener(compression):
+    if compression not in compressions:
+        raise ValueError('Unknown compression: {!r}'.format(compression))
+    return compressions[compression][2]
+
+
+def _decompress(
+        opener, bin_file, to_close, mode, read_ahead, chunk_size,
+        n_chunks):
+    # Decompress the given binary file, closing the files in `to_close`
+    # when the returned stream is closed.  If reading ahead, decompress
+    # in a background thread.
+    files = (opener(bin_file, 'rb'), *to_close)
+    if read_ahead:
+        buffered = io.BufferedReader(
+            _ReadAheadReader(files, chunk_size, n_chunks), chunk_size)
+    else:
+        buffered = io.BufferedReader(_StackedReader(files))
+    if 'b' in mode:
+        return buffered
+    return io.TextIOWrapper(buffered)
+
+
+class _StackedReader(io.RawIOBase):
+    """
+    Raw binary stream whose data is read from the first of the given
+    files.  Closing the stream closes all of the given files.
+    """
+
+    def __init__(self, files):
+        super().__init__()
+        self._files = files
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self._files[0].readinto(buffer)
+
+    def close(self):
+        if not self.closed:
+            for file in self._files:
+                file.close()
+        super().close()
+
+
+class _ReadAheadReader(io.RawIOBase):
+    """
+    Raw binary stream whose data is read from the first of the given
+    files by a background thread.  Closing the stream closes all of the
+    given files.
+    """
+
+    def __init__(self, files, chunk_size, n_chunks):
+        super().__init__()
+        self._files = files
+        self._chunk_size = chunk_size
+        self._chunks = queue.Queue(n_chunks)
+        self._chunk = memoryview(b'')
+        self._is_eof = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._read_ahead, name='cdmdata-read-ahead',
+            daemon=True)
+        self._thread.start()
+
+    def _read_ahead(self):
+        # Read chunks until EOF.  An empty chunk signals EOF and an
+        # exception signals an error.
+        try:
+            read = self._files[0].read
+            chunk = read(self._chunk_size)
+            while self._put(chunk) and chunk:
+                chunk = read(self._chunk_size)
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item):
+        # Wait for room in the queue but stop if the stream is closed
+        while not self._stop.is_set():
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        # Get the next chunk if the current one is used up
+        while len(self._chunk) == 0:
+            if self._is_eof:
+                return 0
+            item = self._chunks.get()
+            if isinstance(item, Exception):
+                self._is_eof = True
+                raise item
+            if not item:
+                self._is_eof = True
+                return 0
+            self._chunk = memoryview(item)
+        # Copy as much of the chunk as fits
+        n_bytes = min(len(buffer), len(self._chunk))
+        buffer[:n_bytes] = self._chunk[:n_bytes]
+        self._chunk = self._chunk[n_bytes:]
+        return n_bytes
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+            for file in self._files:
+                file.close()
+        super().close()
+
+
+# Times
+
+
+@functools.lru_cache(maxsize=(2 ** 16))
+def parse_iso_day(text):
+    """
+    Parse the given ISO 8601 date (YYYY-MM-DD) and return it as an
+    integer day number.
+
+    Day numbers are proleptic Gregorian ordinals (as from
+    `datetime.date.toordinal`), so differences are numbers of days and
+    they can be used with interval arithmetic such as in
+    `events.periods`.  Use as the time type of an events or examples
+    header.  Results are cached because many records share dates.
+    """
+    if len(text) != 10 or text[4] != '-' or text[7] != '-':
+        raise ValueError('Not an ISO date: {!r}'.format(text))
+    return datetime.date(
+        int(text[:4]), int(text[5:7]), int(text[8:])).toordinal()
+
+
+def format_iso_day(day):
+    """
+    Format the given day number (as from `parse_iso_day`) as an ISO 8601
+    date (YYYY-MM-DD) and return it.
+    """
+    return datetime.date.fromordinal(day).isoformat()
+
+
 def lookup(name, namespaces=None, modules=None):
     """
     Look up the given name and return its binding.  Return `None` if not
@@ -1,11 +1,13 @@
 """Working with event data, events, and event sequences"""
 
-# Copyright (c) 2019 Aubrey Barnard.
+# Copyright (c) 2019, 2026 Aubrey Barnard.
 #
 # This is free, open software licensed under the [MIT License](
 # https://choosealicense.com/licenses/mit/).
 
 
+import bisect
+import collections
 import csv
 import itertools as itools
 import json as _json
@@ -29,7 +31,8 @@ def header(time_type=float):
 
     time_type:
         Constructor for type of time / date found in event records:
-        time_type<T>(str) -> T.
+        time_type<T>(str) -> T.  For dates, `core.parse_iso_day` parses
+        them into integer day numbers.
     """
     return (
         ('id', int),
@@ -130,6 +133,189 @@ def sequence(
     return esal.EventSequence(evs, facts, event_sequence_id)
 
 
+class CompactSequence:
+    """
+    Event sequence that keeps the fields of its events in parallel
+    lists and only constructs `esal.Event` objects when they are
+    accessed.
+
+    Supports the parts of the `esal.EventSequence` interface that
+    feature functions use: `id`, `fact_keys`, `fact`, `types`,
+    `has_type`, `n_events`, `n_events_of_type`, `events`,
+    `events_overlapping`, and `subsequence`, plus `type_counts` (see
+    `type_counts`).  Events are constructed as by `sequence`, so
+    `value` and `json` apply to them, and JSON is only parsed when
+    `json` is called.  Events are ordered by (lo, hi) and their
+    intervals are closed.
+
+    Construct with `compact_sequence`.
+    """
+
+    def __init__(self, los, his, types, values, jsons, facts, id=None):
+        """
+        Create an event sequence from parallel lists of event fields
+        (which are kept, not copied), and a mapping of fact keys to
+        values.
+        """
+        self.id = id
+        self._los = los
+        self._his = his
+        self._types = types
+        self._values = values
+        self._jsons = jsons
+        self._facts = facts
+        self._type2idxs = {}
+        for (idx, typ) in enumerate(types):
+            idxs = self._type2idxs.get(typ)
+            if idxs is None:
+                self._type2idxs[typ] = [idx]
+            else:
+                idxs.append(idx)
+
+    def __len__(self):
+        return len(self._los)
+
+    def __getitem__(self, index):
+        return esal.Event(
+            esal.Interval(self._los[index], self._his[index]),
+            self._types[index], (self._values[index], self._jsons[index]))
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self._los)))
+
+    def fact_keys(self):
+        return self._facts.keys()
+
+    def fact(self, key, default=None):
+        return self._facts.get(key, default)
+
+    def types(self):
+        return self._type2idxs.keys()
+
+    def has_type(self, event_type):
+        return event_type in self._type2idxs
+
+    def n_events(self):
+        return len(self._los)
+
+    def n_events_of_type(self, event_type):
+        return len(self._type2idxs.get(event_type, ()))
+
+    def type_counts(self):
+        return {typ: len(idxs) for (typ, idxs) in self._type2idxs.items()}
+
+    def events(self, *event_types):
+        """
+        Return a list of the events of the given types (in order by
+        type), or of all the events if no types are given.
+        """
+        if not event_types:
+            return list(self)
+        return [self[idx] for typ in event_types
+                for idx in self._type2idxs.get(typ, ())]
+
+    def events_overlapping(self, lo, hi, is_lo_open=False, is_hi_open=False):
+        """
+        Return a list of the indices of the events that overlap the
+        given interval.
+        """
+        los = self._los
+        his = self._his
+        # Events are in order of start, so stop at the first event that
+        # starts after the interval
+        stop = (bisect.bisect_left(los, hi) if is_hi_open
+                else bisect.bisect_right(los, hi))
+        if is_lo_open:
+            return [idx for idx in range(stop) if his[idx] > lo]
+        return [idx for idx in range(stop) if his[idx] >= lo]
+
+    def subsequence(self, indices):
+        """
+        Return a new sequence with the events at the given indices (in
+        order) and the same facts and ID.
+        """
+        indices = sorted(indices)
+        def pick(fields):
+            return [fields[idx] for idx in indices]
+        return CompactSequence(
+            pick(self._los), pick(self._his), pick(self._types),
+            pick(self._values), pick(self._jsons), self._facts, self.id)
+
+
+def compact_sequence(
+        event_records,
+        event_sequence_id=None,
+        header_nm2idx=header_nm2idx,
+):
+    """
+    Construct a `CompactSequence` from the given records and return it.
+
+    A replacement for `sequence` (e.g. as the `sequence_constructor` of
+    `read_sequences`) with the same arguments and treatment of records.
+    An event with only one of `lo` and `hi` is an instant.
+    """
+    # Unpack indices of event record fields
+    id_idx = header_nm2idx['id']
+    lo_idx = header_nm2idx['lo']
+    hi_idx = header_nm2idx['hi']
+    cat_idx = header_nm2idx['cat']
+    typ_idx = header_nm2idx['typ']
+    val_idx = header_nm2idx['val']
+    jsn_idx = header_nm2idx['jsn']
+    # Collect facts and events.  Share a single tuple among all the
+    # events of the same type.
+    facts = {}
+    evs = []
+    types = {}
+    for ev_rec in event_records:
+        if event_sequence_id is None:
+            event_sequence_id = ev_rec[id_idx]
+        lo = ev_rec[lo_idx]
+        hi = ev_rec[hi_idx]
+        # Missing times indicate a fact
+        if lo is None and hi is None:
+            facts[ev_rec[cat_idx], ev_rec[typ_idx]] = ev_rec[val_idx]
+            continue
+        if lo is None:
+            lo = hi
+        elif hi is None:
+            hi = lo
+        typ = (ev_rec[cat_idx], ev_rec[typ_idx])
+        typ = types.setdefault(typ, typ)
+        evs.append((lo, hi, typ, ev_rec[val_idx], ev_rec[jsn_idx]))
+    # Order events by interval (stably)
+    evs.sort(key=lambda ev: (ev[0], ev[1]))
+    if evs:
+        los, his, typs, vals, jsns = (list(fields) for fields in zip(*evs))
+    else:
+        los, his, typs, vals, jsns = [], [], [], [], []
+    return CompactSequence(los, his, typs, vals, jsns, facts,
+                           event_sequence_id)
+
+
+def type_counts(event_sequence, types=None):
+    """
+    Return a mapping of event types to the numbers of events of those
+    types in the given event sequence.
+
+    Sequences that keep counts of their types provide them with a
+    method `type_counts`.  Otherwise, the types of all the events are
+    counted in a single pass with a `collections.Counter`, so types
+    that do not occur count as 0.
+
+    types:
+        Collection of the types that will be looked up.  All types are
+        counted regardless, so this is only a hint.
+    """
+    type_counts = getattr(event_sequence, 'type_counts', None)
+    if type_counts is not None:
+        return type_counts()
+    return collections.Counter(map(_event_type, event_sequence.events()))
+
+
+_event_type = operator.attrgetter('type')
+
+
 def read_sequences(
         csv_event_records,
         header=header(),
@@ -139,12 +325,18 @@ def read_sequences(
         include_record=None,
         transform_record=None,
         sequence_constructor=sequence,
+        include_raw_record=None,
 ):
     """
     Read event records and yield event sequences.
 
     csv_event_records:
-        Iterable of list<str>, as from `csv.reader`.
+        Iterable of list<str>, as from `csv.reader`, or a grouped source
+        of records, such as a `colstore.ColumnStore`.  A grouped source
+        has a method `groups(include_ids)` that yields (ID, records)
+        pairs and can skip excluded IDs without reading their records.
+        (Records from a column store are already parsed, so do not
+        parse them again.)
     header:
         Indexable collection of (name, type) pairs indicating the names
         and data types of the fields of each record.  Must include at
@@ -166,23 +358,56 @@ def read_sequences(
         event records and a sequence ID:
         sequence_constructor(iter<list<object>>, object) ->
         esal.EventSequence.
+    include_raw_record:
+        Passed to `records.process`.  Records that it rejects are never
+        parsed or turned into events, but their IDs still have
+        (possibly empty) sequences.  See `mk_type_filter`.
     """
-    # Make mapping of header names to indices
-    nm2idx = {field[0]: i for (i, field) in enumerate(header)}
-    id_idx = nm2idx['id']
-    # Make group-by function
-    if parse_id is None:
-        group_by = operator.itemgetter(id_idx)
+    # Grouped sources do their own grouping and skipping
+    if hasattr(csv_event_records, 'groups'):
+        groups = csv_event_records.groups(include_ids)
     else:
-        group_by = lambda rec: parse_id(rec[id_idx])
+        # Make mapping of header names to indices
+        nm2idx = {field[0]: i for (i, field) in enumerate(header)}
+        id_idx = nm2idx['id']
+        # Make group-by function
+        if parse_id is None:
+            group_by = operator.itemgetter(id_idx)
+        else:
+            group_by = lambda rec: parse_id(rec[id_idx])
+        groups = itools.groupby(csv_event_records, group_by)
+        # Skip excluded sequences
+        if include_ids is not None:
+            groups = ((rec_id, group) for (rec_id, group) in groups
+                      if rec_id in include_ids)
     # Loop to process each sequence of events that share the same ID
-    for rec_id, group in itools.groupby(csv_event_records, group_by):
-        # Process this sequence or skip it?
-        if include_ids is None or rec_id in include_ids:
-            # Assemble the event records into an event sequence
-            yield sequence_constructor(records.process(
-                group, parse_record, include_record, transform_record,
-            ), rec_id)
+    for rec_id, group in groups:
+        # Assemble the event records into an event sequence
+        yield sequence_constructor(records.process(
+            group, parse_record, include_record, transform_record,
+            include_raw_record,
+        ), rec_id)
+
+
+def mk_type_filter(types, header=header()):
+    """
+    Return a predicate that is true for the event records (text or
+    parsed) whose (cat, typ) pair is among the given types.
+
+    Use as `include_raw_record` to discard the records of other types
+    (including facts) before they are parsed.
+
+    types:
+        Collection of (cat, typ) pairs of text.
+    header:
+        Header of the event records.  Only the names are used.
+    """
+    nm2idx = {field[0]: i for (i, field) in enumerate(header)}
+    types = frozenset(types)
+    get_type = operator.itemgetter(nm2idx['cat'], nm2idx['typ'])
+    def include_record(record):
+        return get_type(record) in types
+    return include_record
 
 
 def periods(
@@ -244,13 +469,37 @@ def periods(
     output_zero:
         Value to use when filling in between nonzero values.
     """
-    prds = []
-    # Lengthen and clip nonzero periods
-    for ev in events:
+    # Lengthen, clip, merge, sequentialize, and separate nonzero periods
+    # in one forward pass
+    prds = _back_off(_sequence_periods(_clip_periods(
+        ((ev.when.lo, ev.when.hi,
+          value(ev) if value is not None else ev.value)
+         for ev in events),
+        span_lo, span_hi, zero_values, min_len)), backoff)
+    # Yield periods with intervening zero periods as needed
+    zero_lo = span_lo
+    for (lo, hi, val, _) in prds:
+        # Yield a preceding zero period if it would be non-empty after
+        # backing off from the current event
+        zero_hi = lo - backoff
+        if zero_lo < zero_hi:
+            yield (esal.Interval(zero_lo, zero_hi), output_zero)
+        yield (esal.Interval(lo, hi), val)
+        # Increment.  Delay the zero period by the backoff amount.
+        zero_lo = hi + backoff
+    if zero_lo < span_hi:
+        yield (esal.Interval(zero_lo, span_hi), output_zero)
+
+
+def _clip_periods(periods, span_lo, span_hi, zero_values, min_len):
+    """
+    Yield the given (lo, hi, value) periods that have nonzero values
+    after lengthening them to the minimum length and clipping them to
+    the span, as for `periods`.
+    """
+    for (lo, hi, val) in periods:
         # Ensure a minimum length before clipping
-        lo = ev.when.lo
-        hi = max(ev.when.hi, lo + min_len)
-        val = value(ev) if value is not None else ev.value
+        hi = max(hi, lo + min_len)
         # Discard any events that are "non-events" (have zero value) or
         # that are outside the allowed span
         if (val in zero_values or
@@ -262,39 +511,137 @@ def periods(
             hi = min(hi, span_hi)
         if span_lo is not None:
             lo = max(lo, span_lo)
-        prds.append((lo, hi, val))
-    # Merge and sequentialize periods
-    mrg_idx = 0
-    prd_idx = 1
-    while prd_idx < len(prds):
-        lo1, hi1, val1 = prds[mrg_idx]
-        lo2, hi2, val2 = prds[prd_idx]
+        yield (lo, hi, val)
+
+
+def _sequence_periods(periods):
+    """
+    Merge the given (lo, hi, value) periods with the same value and put
+    them in sequence by truncating each period at the start of the next,
+    as for `periods`.  Yield each period as soon as it is final, that
+    is, once the next period does not merge with it, as a (lo, hi,
+    value, n-merged) tuple.
+    """
+    periods = iter(periods)
+    prd = next(periods, None)
+    if prd is None:
+        return
+    lo1, hi1, val1 = prd
+    n_merged = 1
+    for (lo2, hi2, val2) in periods:
         # Merge periods with the same value
         if hi1 >= lo2 and val1 == val2:
-            prds[mrg_idx] = (lo1, hi2, val1)
-            del prds[prd_idx]
+            hi1 = hi2
+            n_merged += 1
         else:
             # Put periods in sequence by removing overlaps
-            if hi1 > lo2:
-                prds[mrg_idx] = (lo1, lo2, val1)
-            mrg_idx += 1
-            prd_idx += 1
-    # Yield periods with intervening zero periods as needed.  Separate
-    # periods by backing off from the following nonzero event (if there
-    # is one).
-    zero_lo = span_lo
-    for (idx, (lo, hi, val)) in enumerate(prds):
-        # Yield a preceding zero period if it would be non-empty after
-        # backing off from the current event
-        zero_hi = lo - backoff
-        if zero_lo < zero_hi:
-            yield (esal.Interval(zero_lo, zero_hi), output_zero)
-        # Back off from the following nonzero event if there is one
-        hi_bk = (max(min(hi, prds[idx + 1][0] - backoff), lo)
-                 if idx + 1 < len(prds)
-                 else hi)
-        yield (esal.Interval(lo, hi_bk), val)
-        # Increment.  Delay the zero period by the backoff amount.
-        zero_lo = hi_bk + backoff
-    if zero_lo < span_hi:
-        yield (esal.Interval(zero_lo, span_hi), output_zero)
+            yield (lo1, min(hi1, lo2), val1, n_merged)
+            lo1, hi1, val1 = lo2, hi2, val2
+            n_merged = 1
+    yield (lo1, hi1, val1, n_merged)
+
+
+def _back_off(periods, backoff):
+    """
+    Separate the given sequential periods by backing off the end of each
+    from the start of the following one (if there is one), which is
+    looked ahead to, as for `periods`.
+    """
+    periods = iter(periods)
+    prd = next(periods, None)
+    while prd is not None:
+        lo, hi, val, n_merged = prd
+        prd = next(periods, None)
+        if prd is not None:
+            hi = max(min(hi, prd[0] - backoff), lo)
+        yield (lo, hi, val, n_merged)
+
+
+def eras(
+        event_records,
+        header=header(),
+        types=None,
+        spans=None,
+        value=None,
+        zero_values=(0, None),
+        min_len=0,
+        backoff=0,
+):
+    """
+    Yield the eras (nonzero periods, as from `periods`) of every event
+    type of every subject in the given stream of event records in one
+    pass.
+
+    Each era is a (ID, event-type, lo, hi, value, n-events) tuple, where
+    n-events is the number of events merged into the era.  Eras are
+    yielded by subject, then by event type (in order of first
+    occurrence), then by time.  This is like calling `periods` for each
+    event type of each event sequence (and discarding the zero periods),
+    but without constructing any events or sequences.  Use
+    `examples.era_records` to convert eras into example records.
+
+    event_records:
+        Iterable of parsed event records that are grouped by ID, such as
+        a `colstore.ColumnStore`.  To use columnar arrays of values,
+        `zip` them together in the order of `header`.  Facts (records
+        in which `lo` and `hi` are both `None`, as for `sequence`) are
+        ignored.  Events with only one of `lo` and `hi` are taken to
+        be instantaneous.
+    header:
+        Header of the event records.  Only the names are used.
+    types:
+        Set of (cat, typ) event types for which to make eras, or `None`
+        for all types.
+    spans:
+        Mapping of IDs to (lo, hi) spans to which the events of each
+        subject are clipped, as `span_lo` and `span_hi` are for
+        `periods`.  Subjects not in the mapping are not clipped.
+    value:
+        Function to extract values from event records:
+        value(record) -> object.  Default uses the `val` field.
+    zero_values:
+        As for `periods`.
+    min_len:
+        As for `periods`.
+    backoff:
+        As for `periods`.
+    """
+    nm2idx = {field[0]: idx for (idx, field) in enumerate(header)}
+    id_idx = nm2idx['id']
+    lo_idx = nm2idx['lo']
+    hi_idx = nm2idx['hi']
+    get_type = operator.itemgetter(nm2idx['cat'], nm2idx['typ'])
+    if value is None:
+        value = operator.itemgetter(nm2idx['val'])
+    for (id, recs) in itools.groupby(
+            event_records, operator.itemgetter(id_idx)):
+        # Collect the periods of each type
+        type2prds = {}
+        for rec in recs:
+            # Missing times indicate a fact
+            lo = rec[lo_idx]
+            hi = rec[hi_idx]
+            if lo is None:
+                if hi is None:
+                    continue
+                lo = hi
+            elif hi is None:
+                hi = lo
+            ev_type = get_type(rec)
+            if types is not None and ev_type not in types:
+                continue
+            prds = type2prds.get(ev_type)
+            if prds is None:
+                prds = type2prds[ev_type] = []
+            prds.append((lo, hi, value(rec)))
+        span_lo, span_hi = (spans.get(id, (None, None))
+                            if spans is not None
+                            else (None, None))
+        for (ev_type, prds) in type2prds.items():
+            # Periods must be in order of interval, as events are in
+            # event sequences
+            prds.sort(key=operator.itemgetter(0, 1))
+            for (lo, hi, val, n_evs) in _back_off(_sequence_periods(
+                    _clip_periods(prds, span_lo, span_hi, zero_values,
+                                  min_len)), backoff):
+                yield (id, ev_type, lo, hi, val, n_evs)
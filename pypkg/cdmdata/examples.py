@@ -1,6 +1,6 @@
 """Working with example definitions"""
 
-# Copyright (c) 2019 Aubrey Barnard.
+# Copyright (c) 2019, 2026 Aubrey Barnard.
 #
 # This is free, open software licensed under the [MIT License](
 # https://choosealicense.com/licenses/mit/).
@@ -16,7 +16,8 @@ def header(time_type=float):
 
     time_type:
         Constructor for type of time / date found in example records:
-        time_type<T>(str) -> T.
+        time_type<T>(str) -> T.  For dates, `core.parse_iso_day` parses
+        them into integer day numbers.
 
     An example record describes a span of time where a subject has a
     particular label, treatment status, and classification.  It also has
@@ -75,3 +76,46 @@ csv_format = dict(
     quotechar='"',
     quoting=csv.QUOTE_MINIMAL,
 )
+
+
+def era_records(eras, label=None, classification=None, format_time=None):
+    """
+    Convert the given eras (as from `events.eras`) into example records
+    and yield them.
+
+    The example record of an era has the era's ID and times, its event
+    type as its label, its value as its treatment, its length as its
+    weight, and its number of events.  For example, the era (123,
+    ('rx', '7'), 10, 40, '20 mg', 3) becomes
+
+        [123, 10, 40, 'rx-7', '20 mg', None, 30.0, 3, None]
+
+    label:
+        Function to make the label of an era from its event type:
+        label((cat, typ)) -> str.  Default is 'cat-typ'.
+    classification:
+        Function to make the classification of an era from the era
+        tuple: classification(era) -> str.  Default is `None`.
+    format_time:
+        Function to format the times of an era for the example record:
+        format_time(time) -> object.  For example, `core.format_iso_day`
+        turns the integer day numbers of eras of events read with
+        `core.parse_iso_day` back into ISO dates, so that the records
+        can be written as a CSV with the format of `header`.  The
+        weight is computed from the unformatted times.  Default is to
+        use the times as they are.
+    """
+    for era in eras:
+        id, ev_type, lo, hi, val, n_evs = era
+        yield [
+            id,
+            format_time(lo) if format_time is not None else lo,
+            format_time(hi) if format_time is not None else hi,
+            (label(ev_type) if label is not None
+             else '{}-{}'.format(*ev_type)),
+            val,
+            classification(era) if classification is not None else None,
+            float(hi - lo),
+            n_evs,
+            None,
+        ]
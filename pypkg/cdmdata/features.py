@@ -43,21 +43,37 @@ id|name|tbl|typ|val|data_type|feat_func|args
 ```
 """
 
-# Copyright (c) 2019, 2021, 2023 Aubrey Barnard.
+# Copyright (c) 2019, 2021, 2023, 2026 Aubrey Barnard.
 #
 # This is free, open software licensed under the [MIT License](
 # https://choosealicense.com/licenses/mit/).
 
 
+import array
+import ast
+import bisect
+import builtins
 import collections
+import concurrent.futures
 import csv
 import datetime
+import importlib
+import io
+import itertools as itools
 import json
+import logging
 import operator
+import os
+import pathlib
+import pickle
 import sys
+import tempfile
+import time
 
 import esal
 
+from . import cache
+from . import colstore
 from . import core
 from . import events
 from . import examples
@@ -109,8 +125,124 @@ csv_format = dict(
 )
 
 
-def compile_lambda(text): # TODO
-    return None
+"""
+Names available to feature functions given as lambda expressions: a
+subset of the builtins that has no side effects.  Add to it to make more
+names available.
+"""
+lambda_names = {
+    name: getattr(builtins, name) for name in (
+        'abs', 'all', 'any', 'bool', 'dict', 'divmod', 'enumerate',
+        'filter', 'float', 'frozenset', 'int', 'isinstance', 'len',
+        'list', 'map', 'max', 'min', 'pow', 'range', 'reversed', 'round',
+        'set', 'sorted', 'str', 'sum', 'tuple', 'zip',
+    )}
+
+
+# Cache of compiled lambdas by their text
+_text2lambda = {}
+
+
+def compile_lambda(text):
+    """
+    Compile the given lambda expression into a feature function and
+    return it.
+
+    The lambda must take 2 arguments (an example and an event
+    sequence).  It can only use its arguments, the names it binds
+    itself (e.g. in comprehensions), and the names in `lambda_names`,
+    and it cannot use any attributes or names that start with an
+    underscore.  This guards against mistakes, but it is not a security
+    boundary.  Each distinct text is compiled only once, so duplicate
+    definitions share one function.
+
+    Raises `ValueError` if the text is not a valid lambda.
+    """
+    func = _text2lambda.get(text)
+    if func is None:
+        tree = _validate_lambda(text)
+        code = compile(tree, '<feature lambda>', 'eval')
+        func = _text2lambda[text] = eval(
+            code, {'__builtins__': lambda_names})
+    return func
+
+
+def _validate_lambda(text):
+    # Parse the given lambda and check that it only uses allowed names.
+    # Return the syntax tree.
+    def invalid(reason):
+        return ValueError('Invalid feature lambda: {!r}: {}'
+                          .format(text, reason))
+    try:
+        tree = ast.parse(text.strip(), mode='eval')
+    except SyntaxError as error:
+        raise invalid(error.msg) from None
+    lambda_ = tree.body
+    if not isinstance(lambda_, ast.Lambda):
+        raise invalid('Not a lambda expression')
+    args = lambda_.args
+    if (len(args.posonlyargs) + len(args.args) != 2 or args.vararg or
+            args.kwonlyargs or args.kwarg or args.defaults):
+        raise invalid('Must take 2 arguments (example, event_sequence)')
+    _check_names(lambda_, [], invalid)
+    return tree
+
+
+_comprehension_types = (
+    ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+
+
+def _check_names(node, scopes, invalid):
+    # Check that the given node of a lambda only uses names that are
+    # bound in the given scopes (innermost last) where they are used or
+    # that are in `lambda_names`.  A scope is a pair of a set of names
+    # and whether it is a function (rather than a comprehension).
+    # Names are bound in the order of evaluation, as far as that
+    # follows the order of the syntax tree.
+    if isinstance(node, ast.Lambda):
+        args = node.args
+        # Defaults are evaluated in the enclosing scope
+        for default in args.defaults + args.kw_defaults:
+            if default is not None:
+                _check_names(default, scopes, invalid)
+        names = {arg.arg for arg in itools.chain(
+            args.posonlyargs, args.args, args.kwonlyargs,
+            (args.vararg, args.kwarg)) if arg is not None}
+        _check_names(node.body, scopes + [(names, True)], invalid)
+    elif isinstance(node, _comprehension_types):
+        names = set()
+        inner_scopes = scopes + [(names, False)]
+        for (idx, generator) in enumerate(node.generators):
+            # The first iterable is evaluated in the enclosing scope
+            _check_names(generator.iter,
+                         scopes if idx == 0 else inner_scopes, invalid)
+            _check_names(generator.target, inner_scopes, invalid)
+            for condition in generator.ifs:
+                _check_names(condition, inner_scopes, invalid)
+        if isinstance(node, ast.DictComp):
+            _check_names(node.key, inner_scopes, invalid)
+            _check_names(node.value, inner_scopes, invalid)
+        else:
+            _check_names(node.elt, inner_scopes, invalid)
+    elif isinstance(node, ast.NamedExpr):
+        _check_names(node.value, scopes, invalid)
+        # Assignment expressions bind in the innermost function
+        for (names, is_function) in reversed(scopes):
+            if is_function:
+                names.add(node.target.id)
+                break
+    elif isinstance(node, ast.Name):
+        if isinstance(node.ctx, ast.Store):
+            scopes[-1][0].add(node.id)
+        elif not any(node.id in names for (names, _) in scopes) and (
+                node.id.startswith('_') or node.id not in lambda_names):
+            raise invalid('Unknown name: {}'.format(node.id))
+    else:
+        if (isinstance(node, ast.Attribute) and
+                node.attr.startswith('_')):
+            raise invalid('Private attribute: {}'.format(node.attr))
+        for child in ast.iter_child_nodes(node):
+            _check_names(child, scopes, invalid)
 
 
 def mk_function(
@@ -119,6 +251,7 @@ def mk_function(
         namespaces=None,
         modules=None,
         constructor_prefixes=['mk_func__'],
+        lookups=None,
 ):
     """
     Look up or create and return the feature function described by the
@@ -126,7 +259,8 @@ def mk_function(
 
     The function field can be the name of a function, the name of a
     function constructor (when prefixed with one of the
-    `constructor_prefixes`), or a lambda expression (TODO).
+    `constructor_prefixes`), or a lambda expression (see
+    `compile_lambda`).
 
     feature_record:
         List of values agreeing with `header`.
@@ -141,6 +275,10 @@ def mk_function(
     constructor_prefixes:
         Prefixes that identify functions that construct feature
         functions.
+    lookups:
+        Dictionary in which to memoize the lookups of function names.
+        Only share it among calls with the same namespaces, modules,
+        and constructor prefixes.
     """
     if namespaces is None:
         namespaces = []
@@ -151,15 +289,24 @@ def mk_function(
     # Compile feature functions given as lambdas
     if func_text.startswith('lambda'):
         return compile_lambda(func_text)
-    # Look up function
+    # Look up function (constructor)
+    if lookups is not None and func_text in lookups:
+        mk_func, func = lookups[func_text]
     else:
+        mk_func = func = None
         for constructor_prefix in constructor_prefixes:
             mk_func = core.lookup(
                 constructor_prefix + func_text, namespaces, modules)
             if mk_func is not None:
-                return mk_func(
-                    feature_record, namespaces=namespaces, modules=modules)
-        return core.lookup(func_text, namespaces, modules)
+                break
+        else:
+            func = core.lookup(func_text, namespaces, modules)
+        if lookups is not None:
+            lookups[func_text] = (mk_func, func)
+    if mk_func is not None:
+        return mk_func(
+            feature_record, namespaces=namespaces, modules=modules)
+    return func
 
 
 def mk_functions(feature_records, namespaces=None, modules=None,
@@ -168,6 +315,9 @@ def mk_functions(feature_records, namespaces=None, modules=None,
     Create a return a list of feature functions based on the given
     feature records.
 
+    Function names are looked up once each, and feature records that
+    are the same except for their ID and name share one function.
+
     feature_records:
         Iterable of feature records.
     namespaces:
@@ -178,19 +328,38 @@ def mk_functions(feature_records, namespaces=None, modules=None,
         Passed to `mk_function`.
     """
     id_idx = header_nm2idx['id']
+    name_idx = header_nm2idx['name']
     func_idx = header_nm2idx['feat_func']
     functions = []
+    lookups = {}
+    definitions = {}
     for feat_rec in feature_records:
-        feat_func = mk_function(
-            feat_rec, func_idx, namespaces, modules, constructor_prefixes)
+        definition = _function_definition(feat_rec, id_idx, name_idx)
+        feat_func = definitions.get(definition)
         if feat_func is None:
-            raise ValueError(
-                'Feature {}: Failed to find / construct function: {!r}'
-                .format(feat_rec[id_idx], feat_rec[func_idx]))
+            feat_func = mk_function(
+                feat_rec, func_idx, namespaces, modules,
+                constructor_prefixes, lookups)
+            if feat_func is None:
+                raise ValueError(
+                    'Feature {}: Failed to find / construct function: {!r}'
+                    .format(feat_rec[id_idx], feat_rec[func_idx]))
+            definitions[definition] = feat_func
         functions.append(feat_func)
     return functions
 
 
+def _function_definition(feature_record, id_idx, name_idx):
+    # Return a hashable key of the fields that define the function of
+    # the given feature record.  Arguments can be any JSON.
+    return tuple(
+        (json.dumps(field, sort_keys=True)
+         if isinstance(field, (list, dict))
+         else field)
+        for (idx, field) in enumerate(feature_record)
+        if idx != id_idx and idx != name_idx)
+
+
 def map_to_functions(features, functions):
     """
     Create and return a mapping of feature keys to feature functions.
@@ -212,6 +381,168 @@ def map_to_functions(features, functions):
     return feat_key2idsfuncs
 
 
+class FeaturePlan(dict):
+    """
+    Mapping of feature keys to feature functions (as created by
+    `map_to_functions`) that is compiled into a plan for applying the
+    feature functions efficiently.
+
+    The plan interns the keys and finds the keys that apply to an
+    example with set intersections instead of one lookup per fact and
+    event type.  Feature functions that declare a batch family (see
+    `batch_families`) are grouped by family, and each family is
+    evaluated by a single call for all of its features that apply,
+    instead of one closure call per feature.  All other functions are
+    applied one at a time.
+
+    As a dictionary, the plan is the same as the mapping it was created
+    from.  The plan is compiled on creation, so create a new plan
+    rather than modifying an existing one.
+    """
+
+    def __init__(self, feature_key2idsfuncs):
+        """
+        feature_key2idsfuncs:
+            Mapping of feature keys to lists of (feature-ID,
+            feature-function) pairs as created by `map_to_functions`.
+        """
+        super().__init__(feature_key2idsfuncs)
+        key2singles = collections.defaultdict(list)
+        family2keyfeats = {}
+        for (key, ids_funcs) in self.items():
+            key = _intern_key(key)
+            for (feat_id, func) in ids_funcs:
+                batch = getattr(func, 'batch', None)
+                if batch is not None and batch[0] in batch_families:
+                    family, func_key, spec = batch
+                    family2keyfeats.setdefault(
+                        family, collections.defaultdict(list))[
+                            _intern_key(func_key)].append((feat_id, spec))
+                else:
+                    key2singles[key].append((feat_id, func))
+        self._keys = frozenset(_intern_key(key) for key in self)
+        self._key2singles = {key: tuple(ids_funcs)
+                             for (key, ids_funcs) in key2singles.items()}
+        self._families = [
+            (batch_families[family], frozenset(key2feats),
+             {key: tuple(feats) for (key, feats) in key2feats.items()})
+            for (family, key2feats) in family2keyfeats.items()]
+
+    def evaluate(self, example, event_sequence, always_keys=()):
+        """
+        Apply the feature functions to the given example and event
+        sequence and yield the (feature-ID, value) pairs whose values
+        evaluate to `True`.  The arguments are as for `vector`.
+        """
+        keys = self._keys
+        present = keys.intersection(event_sequence.fact_keys())
+        present |= keys.intersection(event_sequence.types())
+        if always_keys:
+            present |= keys.intersection(always_keys)
+        # Apply the individual functions
+        key2singles = self._key2singles
+        for key in present:
+            ids_funcs = key2singles.get(key)
+            if ids_funcs is not None:
+                for feat_id, feat_func in ids_funcs:
+                    value = feat_func(example, event_sequence)
+                    if value:
+                        yield feat_id, value
+        # Evaluate the families in batches
+        for (evaluate_family, family_keys, key2feats) in self._families:
+            family_present = present & family_keys
+            if family_present:
+                yield from evaluate_family(
+                    key2feats, family_present, example, event_sequence)
+
+
+def _intern_key(key):
+    if isinstance(key, tuple):
+        return tuple(sys.intern(part) if type(part) is str else part
+                     for part in key)
+    return key
+
+
+def _evaluate_event_counts(key2feats, keys, example, event_sequence):
+    """
+    Batch family evaluator for `count_events`, `has_event`, and
+    `proportion_events` features.
+
+    Counts the events of each type once (see `events.type_counts`) and
+    derives the values of all the features of that type from the count.
+    The values are identical to those of the individual functions.
+    """
+    counts = events.type_counts(event_sequence, keys)
+    n_evs = None
+    for key in keys:
+        n_typ = counts.get(key, 0)
+        for (feat_id, (measure, ret_type)) in key2feats[key]:
+            if measure is _count:
+                value = ret_type(n_typ)
+            elif measure is _has:
+                value = ret_type(n_typ > 0)
+            else:
+                if n_evs is None:
+                    n_evs = event_sequence.n_events()
+                value = ret_type(n_typ / n_evs if n_evs > 0 else 0)
+            if value:
+                yield feat_id, value
+
+
+# Measures of the event counts family
+_count = 'count'
+_has = 'has'
+_proportion = 'proportion'
+
+
+"""
+Mapping of names of batch families to their evaluators.
+
+A feature function declares that it belongs to a family by having the
+attribute `batch` set to a (family-name, key, specification) triple.  An
+evaluator is called like `evaluator(key2feats, keys, example,
+event_sequence)`, where `key2feats` maps each key of the family to a
+sequence of (feature-ID, specification) pairs and `keys` is the set of
+the family's keys that apply to the example.  It yields (feature-ID,
+value) pairs whose values are true.
+"""
+batch_families = {
+    'event_counts': _evaluate_event_counts,
+}
+
+
+def _uses_event_types(function, all_types=False):
+    # Declare whether the given feature function uses the events of all
+    # types or only those of its own key
+    function.uses_all_event_types = all_types
+    return function
+
+
+def event_types(feature_key2idsfuncs):
+    """
+    Return the set of event types (and fact keys) whose records the
+    given feature functions use, or `None` if they might use records of
+    any type.
+
+    Builtin feature functions use only the records of their own keys,
+    except those that count all the events of a sequence (`n_events`,
+    `proportion_events`, `proportion_events_matching`).  Functions that
+    do not declare which records they use (in their attribute
+    `uses_all_event_types`) might use any.
+    """
+    for ids_funcs in feature_key2idsfuncs.values():
+        for (_, func) in ids_funcs:
+            if getattr(func, 'uses_all_event_types', True):
+                return None
+    return set(feature_key2idsfuncs)
+
+
+def _batch(function, family, key, specification):
+    # Declare that the given feature function is in the given family
+    function.batch = (family, key, specification)
+    return function
+
+
 def load(
         features_csv_filename,
         csv_format=csv_format,
@@ -219,18 +550,207 @@ def load(
         header_detector=True,
         namespaces=None,
         modules=None,
+        compiled=None,
 ):
     """
     Load features and return a (records, functions, map-to-functions)
     triple.
+
+    The map to functions is a `FeaturePlan`.  The time taken to load is
+    logged (at level INFO).
+
+    compiled:
+        Name of a compiled feature table (see `compile_features`) from
+        which to load the feature records instead of parsing the CSV.
+        If `True`, the sidecar compiled table is used (see
+        `compiled_features_filename`).  If the compiled table does not
+        exist or does not match the CSV, the CSV is parsed and the
+        compiled table is (re)written.  Only used for feature tables
+        given by name.  Functions cannot be serialized, so they are
+        constructed anew in each process.  However, unless there are
+        `namespaces`, the functions and plan are kept for the life of
+        the process and reused by later loads of the same compiled
+        table while it matches the CSV.
+    """
+    start = time.perf_counter()
+    if compiled and isinstance(features_csv_filename, (str, pathlib.Path)):
+        feature_records, feature_functions, feature_key2idsfuncs = (
+            _load_compiled(
+                features_csv_filename, compiled, csv_format, header,
+                header_detector, namespaces, modules))
+    else:
+        feature_records = list(records.read_csv(
+            features_csv_filename, csv_format, header, header_detector))
+        feature_functions = mk_functions(
+            feature_records, namespaces, modules)
+        feature_key2idsfuncs = FeaturePlan(map_to_functions(
+            feature_records, feature_functions))
+    logger = logging.getLogger(__name__)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            'Loaded %d features (%d distinct functions) in %.3f s: %s',
+            len(feature_records),
+            len({id(func) for func in feature_functions}),
+            time.perf_counter() - start, features_csv_filename)
+    return feature_records, feature_functions, feature_key2idsfuncs
+
+
+# Compiled feature tables
+
+
+"""Version of the format of compiled feature tables"""
+compiled_version = 2
+
+
+# Plans built from compiled tables in this process: compiled filename ->
+# (key, (records, functions, plan))
+_compiled_plans = {}
+
+
+def compiled_features_filename(features_csv_filename):
+    """
+    Return the name of the sidecar compiled table of the given feature
+    table.
     """
+    return str(features_csv_filename) + '.pkl'
+
+
+def _compiled_key(
+        features_csv_filename, csv_format, header, modules):
+    # Return the key that a compiled table must match: the size and
+    # modification time of the CSV, how it is read, and the names of the
+    # modules in which to look for functions
+    stat = os.stat(features_csv_filename)
+    return dict(
+        version=compiled_version,
+        size=stat.st_size,
+        mtime_ns=stat.st_mtime_ns,
+        csv_format=sorted((name, str(value))
+                          for (name, value) in csv_format.items()),
+        header=[field[0] for field in header],
+        modules=([module.__name__ for module in modules]
+                 if modules is not None
+                 else None),
+    )
+
+
+def compile_features(
+        features_csv_filename,
+        compiled_filename=None,
+        csv_format=csv_format,
+        header=header(),
+        header_detector=True,
+        modules=None,
+):
+    """
+    Parse the given feature table and write its records to a compiled
+    table, a pickle that `load` reads instead of parsing the CSV.
+    Return the name of the compiled table.
+
+    The compiled table records the size and modification time of the
+    CSV, the format and header with which it is read, and the names of
+    the given modules, so that `load` can detect when it is stale.  The other
+    arguments are as for `load`.  Default `compiled_filename` is the
+    sidecar (see `compiled_features_filename`).
+    """
+    if compiled_filename is None:
+        compiled_filename = compiled_features_filename(
+            features_csv_filename)
+    key = _compiled_key(features_csv_filename, csv_format, header, modules)
     feature_records = list(records.read_csv(
         features_csv_filename, csv_format, header, header_detector))
-    feature_functions = mk_functions(
-        feature_records, namespaces, modules)
-    feature_key2idsfuncs = map_to_functions(
-        feature_records, feature_functions)
-    return feature_records, feature_functions, feature_key2idsfuncs
+    _write_compiled(compiled_filename, key, feature_records)
+    return compiled_filename
+
+
+def _write_compiled(compiled_filename, key, feature_records):
+    # Write to a temporary file and rename it so that a partial compiled
+    # table is never read (e.g. by concurrent workers)
+    fd, tmp_name = tempfile.mkstemp(
+        suffix='.tmp', dir=os.path.dirname(os.path.abspath(
+            compiled_filename)))
+    try:
+        with builtins.open(fd, 'wb') as file:
+            pickle.dump(dict(key, records=feature_records), file,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_name, compiled_filename)
+    except BaseException:
+        os.remove(tmp_name)
+        raise
+
+
+def _load_compiled_records(
+        features_csv_filename,
+        compiled_filename,
+        csv_format,
+        header,
+        header_detector,
+        modules,
+        key=None,
+):
+    """
+    Return the feature records from the given compiled table if it
+    matches the given feature table.  Otherwise, parse the feature
+    table and (re)write the compiled table.
+    """
+    if key is None:
+        key = _compiled_key(
+            features_csv_filename, csv_format, header, modules)
+    try:
+        with builtins.open(compiled_filename, 'rb') as file:
+            compiled = pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        compiled = None
+    if (isinstance(compiled, dict) and
+            all(compiled.get(name) == value
+                for (name, value) in key.items())):
+        return compiled['records']
+    logging.getLogger(__name__).info(
+        'Compiling feature table: %s -> %s',
+        features_csv_filename, compiled_filename)
+    feature_records = list(records.read_csv(
+        features_csv_filename, csv_format, header, header_detector))
+    _write_compiled(compiled_filename, key, feature_records)
+    return feature_records
+
+
+def _load_compiled(
+        features_csv_filename,
+        compiled_filename,
+        csv_format,
+        header,
+        header_detector,
+        namespaces,
+        modules,
+):
+    """
+    Return the (records, functions, plan) triple of the given feature
+    table as for `load`, reusing the plan already built from the given
+    compiled table in this process if it still matches.
+    """
+    if compiled_filename is True:
+        compiled_filename = compiled_features_filename(
+            features_csv_filename)
+    key = _compiled_key(features_csv_filename, csv_format, header, modules)
+    # Functions looked up in namespaces depend on their contents, which
+    # cannot be keyed, so plans that use them are not kept
+    plan_name = os.path.abspath(compiled_filename)
+    cached = _compiled_plans.get(plan_name) if namespaces is None else None
+    if cached is not None and cached[0] == key:
+        feature_records, feature_functions, plan = cached[1]
+    else:
+        feature_records = _load_compiled_records(
+            features_csv_filename, compiled_filename, csv_format, header,
+            header_detector, modules, key)
+        feature_functions = mk_functions(
+            feature_records, namespaces, modules)
+        plan = FeaturePlan(map_to_functions(
+            feature_records, feature_functions))
+        if namespaces is None:
+            _compiled_plans[plan_name] = (
+                key, (feature_records, feature_functions, plan))
+    # Copy the lists so that callers cannot change the kept ones
+    return list(feature_records), list(feature_functions), plan
 
 
 # Feature functions
@@ -289,6 +809,7 @@ def event_sequence_id(example, event_sequence):
     Feature function: Return the ID of the given event sequence.
     """
     return event_sequence.id
+_uses_event_types(event_sequence_id)
 
 
 def mk_func__example_field(
@@ -305,7 +826,7 @@ def mk_func__example_field(
     field_idx = get_argument(args, 0, 'field_index')
     def featfunc__example_field(example, event_sequence):
         return ret_type(example[field_idx])
-    return featfunc__example_field
+    return _uses_event_types(featfunc__example_field)
 
 
 def mk_func__year_of_fact(
@@ -329,7 +850,7 @@ def mk_func__year_of_fact(
             return ret_type()
         dt = datetime.datetime.strptime(val, datetime_format)
         return ret_type(dt.year)
-    return featfunc__year_of_fact
+    return _uses_event_types(featfunc__year_of_fact)
 
 
 def mk_func__fact_matches(
@@ -357,7 +878,7 @@ def mk_func__fact_matches(
     vals = set(ev_vals.split(delimiter))
     def featfunc__fact_matches(example, event_sequence):
         return ret_type(event_sequence.fact((ev_cat, ev_typ)) in vals)
-    return featfunc__fact_matches
+    return _uses_event_types(featfunc__fact_matches)
 
 
 def mk_func__has_event(feature_record, namespaces=None, modules=None):
@@ -372,7 +893,8 @@ def mk_func__has_event(feature_record, namespaces=None, modules=None):
     ret_type = nm2type[data_type_name]
     def featfunc__has_event(example, event_sequence):
         return ret_type(event_sequence.has_type((ev_cat, ev_typ)))
-    return featfunc__has_event
+    return _batch(_uses_event_types(featfunc__has_event), 'event_counts',
+                  (ev_cat, ev_typ), (_has, ret_type))
 
 
 def mk_func__n_events(feature_record, namespaces=None, modules=None):
@@ -387,7 +909,7 @@ def mk_func__n_events(feature_record, namespaces=None, modules=None):
     ret_type = nm2type[data_type_name]
     def featfunc__n_events(example, event_sequence):
         return ret_type(event_sequence.n_events())
-    return featfunc__n_events
+    return _uses_event_types(featfunc__n_events, all_types=True)
 
 
 def mk_func__count_events(
@@ -404,7 +926,9 @@ def mk_func__count_events(
     def featfunc__count_events(example, event_sequence):
         return ret_type(
             event_sequence.n_events_of_type((ev_cat, ev_typ)))
-    return featfunc__count_events
+    return _batch(
+        _uses_event_types(featfunc__count_events), 'event_counts',
+        (ev_cat, ev_typ), (_count, ret_type))
 
 
 def mk_func__proportion_events(
@@ -419,7 +943,9 @@ def mk_func__proportion_events(
         n_typ = event_sequence.n_events_of_type((ev_cat, ev_typ))
         n_evs = event_sequence.n_events()
         return ret_type(n_typ / n_evs if n_evs > 0 else 0)
-    return featfunc__proportion_events
+    return _batch(
+        _uses_event_types(featfunc__proportion_events, all_types=True),
+        'event_counts', (ev_cat, ev_typ), (_proportion, ret_type))
 
 
 def mk_func__count_events_matching(
@@ -460,7 +986,7 @@ def mk_func__count_events_matching(
         return ret_type(sum(
             1 for ev in event_sequence.events((ev_cat, ev_typ))
             if get_value(ev) in vals))
-    return featfunc__count_events_matching
+    return _uses_event_types(featfunc__count_events_matching)
 
 
 def mk_func__proportion_events_matching(
@@ -483,7 +1009,8 @@ def mk_func__proportion_events_matching(
                     if get_value(ev) in vals)
         n_evs = event_sequence.n_events()
         return ret_type(n_mat / n_evs if n_evs > 0 else 0)
-    return featfunc__proportion_events_matching
+    return _uses_event_types(
+        featfunc__proportion_events_matching, all_types=True)
 
 
 # Feature vectors
@@ -516,7 +1043,25 @@ def vector(feature_key2idsfuncs, example, event_sequence,
         example.
     """
     # Sparse mapping of feature IDs to values
-    fv = {}
+    return dict(feature_values(
+        feature_key2idsfuncs, example, event_sequence, always_keys))
+
+
+def feature_values(feature_key2idsfuncs, example, event_sequence,
+                   always_keys=set()):
+    """
+    Apply the given feature functions to the given example and event
+    sequence and yield the (feature-ID, value) pairs whose values
+    evaluate to `True`.
+
+    This is `vector` without the dictionary.  The arguments are as for
+    `vector`.  If the feature functions are a `FeaturePlan`, it is used
+    to evaluate them.
+    """
+    if isinstance(feature_key2idsfuncs, FeaturePlan):
+        yield from feature_key2idsfuncs.evaluate(
+            example, event_sequence, always_keys)
+        return
     # Use each fact and event key to look up the corresponding feature
     for key in (event_sequence.fact_keys() |
                 event_sequence.types() | always_keys):
@@ -525,8 +1070,142 @@ def vector(feature_key2idsfuncs, example, event_sequence,
             for feat_id, feat_func in ids_funcs:
                 value = feat_func(example, event_sequence)
                 if value:
-                    fv[feat_id] = value
-    return fv
+                    yield feat_id, value
+
+
+class FeatureMatrix:
+    """
+    Sparse matrix of feature vectors that is accumulated in compressed
+    sparse row (CSR) form.
+
+    Rows are examples and columns are features.  Features are assigned
+    to columns in ascending order of feature ID.  The row pointers,
+    column indices, and values are accumulated in typed arrays, so no
+    per-example objects are kept.  Conversion to NumPy arrays requires
+    NumPy.
+    """
+
+    def __init__(self, feature_ids):
+        """
+        feature_ids:
+            Iterable of feature IDs, such as the first field of the
+            feature records returned by `load`.
+        """
+        self.feature_ids = sorted(set(feature_ids))
+        self.feature_id2column = {
+            feat_id: col for (col, feat_id) in enumerate(self.feature_ids)}
+        self.labels = []
+        self.indptr = array.array('q', [0])
+        self.indices = array.array('q')
+        self.data = array.array('d')
+
+    def __len__(self):
+        """Return the number of rows."""
+        return len(self.labels)
+
+    @property
+    def shape(self):
+        return (len(self.labels), len(self.feature_ids))
+
+    def _append(self, label, feature_values):
+        id2col = self.feature_id2column
+        row = sorted((id2col[feat_id], value)
+                     for (feat_id, value) in feature_values)
+        self.indices.extend(col for (col, _) in row)
+        self.data.extend(value for (_, value) in row)
+        self.indptr.append(len(self.indices))
+        self.labels.append(label)
+
+    def add(self, label, feature_key2idsfuncs, example, event_sequence,
+            always_keys=set()):
+        """
+        Apply the given feature functions to the given example and
+        event sequence and append the result as a row.
+
+        The arguments after `label` are as for `vector`.  Feature values
+        must be numbers (or booleans).
+        """
+        self._append(label, feature_values(
+            feature_key2idsfuncs, example, event_sequence, always_keys))
+
+    def add_vector(self, label, feature_vector):
+        """
+        Append the given feature vector (mapping of feature IDs to
+        values) as a row.
+        """
+        self._append(label, feature_vector.items())
+
+    def rows(self):
+        """
+        Yield (label, ((feature-ID, value), ...)) pairs, one per row,
+        with features in ascending order of ID.
+        """
+        feat_ids = self.feature_ids
+        indices = self.indices
+        data = self.data
+        indptr = self.indptr
+        for (row_idx, label) in enumerate(self.labels):
+            lo = indptr[row_idx]
+            hi = indptr[row_idx + 1]
+            yield label, tuple((feat_ids[indices[idx]], data[idx])
+                               for idx in range(lo, hi))
+
+    def arrays(self):
+        """
+        Return the (indptr, indices, data) NumPy arrays of the CSR
+        form.
+        """
+        import numpy
+        return (numpy.frombuffer(self.indptr, dtype=numpy.int64).copy(),
+                numpy.frombuffer(self.indices, dtype=numpy.int64).copy(),
+                numpy.frombuffer(self.data, dtype=numpy.float64).copy())
+
+    def save_npz(self, file):
+        """
+        Save the matrix, labels, and feature IDs in NumPy `.npz`
+        format.
+
+        The layout is that of `scipy.sparse.save_npz` (with the extra
+        arrays `labels` and `feature_ids`), so the matrix can be loaded
+        with `scipy.sparse.load_npz`.
+        """
+        import numpy
+        indptr, indices, data = self.arrays()
+        numpy.savez(
+            file,
+            indptr=indptr,
+            indices=indices,
+            data=data,
+            shape=numpy.array(self.shape),
+            format=b'csr',
+            labels=numpy.array(self.labels),
+            feature_ids=numpy.array(self.feature_ids),
+        )
+
+    def save_svmlight(self, output=sys.stdout, zero_based=False):
+        """
+        Write the matrix in SVMLight format to the given output stream
+        or file.  Feature IDs (not column indices) are written.  The
+        arguments are passed to `SvmlightWriter`.
+
+        The matrix stores every value as a float, so the original types
+        of the values are lost.  Integral values are written without a
+        decimal point and all others as floats.  Thus the output is the
+        same as that of `write_vector` for integer and non-integral
+        float values, but integral floats (e.g. `1.0`) are written as
+        integers (`1`) and booleans are written as `1` or `0` instead of
+        as `True` or `False`.
+        """
+        with SvmlightWriter(output, zero_based=zero_based) as writer:
+            for (label, row) in self.rows():
+                writer.write_row(label, [
+                    (feat_id, _svmlight_value(value))
+                    for (feat_id, value) in row])
+
+
+def _svmlight_value(value):
+    # Write integral values without a decimal point
+    return int(value) if value.is_integer() else value
 
 
 def write_vector(label, feature_vector, output=sys.stdout):
@@ -547,11 +1226,116 @@ def write_vector(label, feature_vector, output=sys.stdout):
     output:
         Output stream.
     """
-    print(label, sep='', end='', file=output)
-    for feat_id in sorted(feature_vector.keys()):
-        print(' ', feat_id, ':', feature_vector[feat_id],
-              sep='', end='', file=output)
-    print(file=output)
+    output.write(format_vector(label, feature_vector))
+
+
+def format_vector(label, feature_vector, qid=None, id_offset=0):
+    """
+    Format the given feature vector as a line (including the newline)
+    in SVMLight format and return it.
+
+    label:
+        Class label or regression value.
+    feature_vector:
+        Mapping of feature IDs to feature values.
+    qid:
+        Query ID to write after the label, if any.
+    id_offset:
+        Amount to add to each feature ID.
+    """
+    return _format_row(label, sorted(feature_vector.items()), qid, id_offset)
+
+
+def _format_row(label, feature_values, qid, id_offset):
+    head = (f'{label} qid:{qid}' if qid is not None else f'{label}')
+    if id_offset:
+        body = ''.join([f' {feat_id + id_offset}:{value}'
+                        for (feat_id, value) in feature_values])
+    else:
+        body = ''.join([f' {feat_id}:{value}'
+                        for (feat_id, value) in feature_values])
+    return head + body + '\n'
+
+
+class SvmlightWriter:
+    """
+    Writer of feature vectors in SVMLight format that formats batches of
+    lines into a single buffer and writes them in large chunks.
+
+    Lines are identical to those of `write_vector` unless a query ID or
+    zero-based feature IDs are requested.  Use as a context manager or
+    call `close` to write any remaining buffered lines.
+    """
+
+    def __init__(
+            self,
+            output=sys.stdout,
+            batch_size=4096,
+            zero_based=False,
+            compression='infer',
+    ):
+        """
+        output:
+            Output stream or filename.  Files are opened with
+            `core.open`, so, for example, a filename ending in '.gz' is
+            written with gzip compression.
+        batch_size:
+            Number of lines to buffer before writing them.
+        zero_based:
+            Whether to subtract 1 from each feature ID, for feature
+            tables whose IDs start at 1 and consumers that expect
+            feature indices to start at 0.
+        compression:
+            Passed to `core.open` when `output` is a filename.
+        """
+        if isinstance(output, (str, pathlib.Path)):
+            self._output = core.open(output, 'wt', compression)
+            self._is_owner = True
+        else:
+            self._output = output
+            self._is_owner = False
+        self.batch_size = batch_size
+        self._id_offset = -1 if zero_based else 0
+        self._lines = []
+
+    def write(self, label, feature_vector, qid=None):
+        """
+        Write the given feature vector (mapping of feature IDs to
+        values).
+        """
+        self.write_row(label, sorted(feature_vector.items()), qid)
+
+    def write_row(self, label, feature_values, qid=None):
+        """
+        Write the given (feature-ID, value) pairs, which must be in
+        ascending order of feature ID.
+        """
+        self._lines.append(
+            _format_row(label, feature_values, qid, self._id_offset))
+        if len(self._lines) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write any buffered lines."""
+        if self._lines:
+            self._output.write(''.join(self._lines))
+            self._lines.clear()
+        self._output.flush()
+
+    def close(self):
+        """
+        Write any buffered lines and close the output if this writer
+        opened it.
+        """
+        self.flush()
+        if self._is_owner:
+            self._output.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
 
 def mk_feature_vectors(
@@ -567,34 +1351,72 @@ def mk_feature_vectors(
         events_header_detector=True,
         examples_header_detector=True,
         features_header_detector=True,
+        events_index=None,
         include_event_record=None,
         transform_event_record=None,
         include_example_record=None,
         always_feature_keys=(),
         feature_function_namespaces=None,
         feature_function_modules=None,
+        sweep=False,
+        compact_sequences=False,
+        events_cache=None,
+        features_compiled=None,
+        merge_join=False,
 ):
     """
     Make and yield feature vectors.
 
     Yields (example-label, example-weight, feature-vector) triples.
+
+    The events file can be a CSV file or a column store (see
+    `colstore`).  If `events_index` is given, the events CSV is read
+    through that index (see `records.build_index`) so that only the
+    events of IDs with examples are read.  If `events_index` is `True`,
+    the sidecar index is used, and it is (re)built if it does not exist
+    or is stale (see `records.index_is_current`).
+
+    If `sweep` is true, the examples of each ID are swept in order of
+    start while a window of overlapping events is maintained
+    incrementally, instead of making a subsequence for every example.
+    Event count features (`count_events`, `has_event`,
+    `proportion_events`) are computed from the window; a subsequence is
+    only made for an example if some other feature needs the events.
+    This pays off when IDs have many (overlapping) examples.  The
+    feature vectors are the same either way.
+
+    If `compact_sequences` is true, event sequences are constructed as
+    `events.CompactSequence`s, which are smaller and quicker to make.
+    Any custom feature functions must then use only the interface it
+    supports.
+
+    If the feature functions only use the records of their own types
+    (see `event_types`), the records of other types are discarded
+    before they are parsed, unless there is a custom function for
+    transforming event records.
+
+    If `events_cache` is given, a CSV events file is converted into a
+    column store in that cache (see `cache.Cache`) the first time it is
+    used, and it is read from the column store thereafter, skipping CSV
+    parsing entirely, until the file changes.  `events_cache` can be a
+    `cache.Cache` or the name of its directory.  If the events cannot
+    be converted (e.g. because their IDs are not integers), they are
+    read from the CSV as usual.
+
+    `features_compiled` is passed to `load` as `compiled`.
+
+    If `merge_join` is true, the examples are read in step with the
+    event sequences instead of being loaded into memory all at once, so
+    memory stays proportional to a single ID.  This requires both the
+    examples and the events to be sorted by ID (in the order of their
+    parsed IDs, e.g. numerically for integer IDs); `ValueError` is
+    raised if they are not.
     """
-    # Unpack events header
-    ev_hdr_nm2idx = {f[0]: i for i, f in enumerate(events_header)}
-    ev_id_idx = ev_hdr_nm2idx['id']
-    # Unpack examples header
-    ex_hdr_nm2idx = {f[0]: i for i, f in enumerate(examples_header)}
-    ex_id_idx = ex_hdr_nm2idx['id']
-    ex_lo_idx = ex_hdr_nm2idx['lo']
-    ex_hi_idx = ex_hdr_nm2idx['hi']
-    # Load example definitions
-    exs = records.read_csv(
+    # Load example definitions (or prepare to read them in step with the
+    # events)
+    id2ex = (_merge_examples if merge_join else _read_examples)(
         examples_csv_filename, examples_csv_format, examples_header,
-        examples_header_detector, include_record=include_example_record)
-    # Collect examples by ID
-    id2ex = collections.defaultdict(list)
-    for ex in exs:
-        id2ex[ex[ex_id_idx]].append(ex)
+        examples_header_detector, include_example_record)
     # Load feature definitions
     _, _, feat_key2idsfuncs = load(
         features_csv_filename,
@@ -603,24 +1425,326 @@ def mk_feature_vectors(
         features_header_detector,
         feature_function_namespaces,
         feature_function_modules,
+        features_compiled,
     )
     # Create a feature vector for each example definition.  Only
     # construct event sequences for IDs that have examples.
-    for ev_seq in events.read_sequences(
-            records.read_csv(
-                events_csv_filename,
-                events_csv_format,
-                events_header,
-                header_detector=events_header_detector,
-                parser=False,
-            ),
-            header=events_header,
-            parse_id=events_header[ev_id_idx][1],
-            include_ids=id2ex,
-            parse_record=records.mk_parser(events_header),
-            include_record=include_event_record,
-            transform_record=transform_event_record,
-    ):
+    ev_seqs = _read_event_sequences(
+        events_csv_filename, events_csv_format, events_header,
+        events_header_detector, events_index, include_event_record,
+        transform_event_record, id2ex,
+        events.compact_sequence if compact_sequences else events.sequence,
+        _event_type_filter(feat_key2idsfuncs, events_header,
+                           transform_event_record),
+        events_cache)
+    if sweep:
+        for (ex, feat_vals) in _swept_feature_values(
+                ev_seqs, id2ex, examples_header, feat_key2idsfuncs,
+                always_feature_keys):
+            yield ex, dict(feat_vals)
+        return
+    for (ex, subseq) in _example_subsequences(
+            ev_seqs, id2ex, examples_header):
+        yield ex, vector(
+            feat_key2idsfuncs, ex, subseq, always_feature_keys)
+
+
+def mk_feature_matrix(
+        events_csv_filename,
+        examples_csv_filename,
+        features_csv_filename,
+        events_csv_format=events.csv_format,
+        examples_csv_format=examples.csv_format,
+        features_csv_format=csv_format,
+        events_header=events.header(),
+        examples_header=examples.header(),
+        features_header=header(),
+        events_header_detector=True,
+        examples_header_detector=True,
+        features_header_detector=True,
+        events_index=None,
+        include_event_record=None,
+        transform_event_record=None,
+        include_example_record=None,
+        always_feature_keys=(),
+        feature_function_namespaces=None,
+        feature_function_modules=None,
+        example_label=None,
+        sweep=False,
+        compact_sequences=False,
+        events_cache=None,
+        features_compiled=None,
+        merge_join=False,
+):
+    """
+    Make and return a `FeatureMatrix` with a row for each feature vector
+    that `mk_feature_vectors` would make.
+
+    Feature values are accumulated directly into the matrix without
+    making a dictionary per example.  There is a column for every
+    feature in the feature table.
+
+    example_label:
+        Function that returns the label of an example:
+        example_label(example) -> object.  Default returns the `cls`
+        field.
+
+    The other arguments are as for `mk_feature_vectors`.
+    """
+    if example_label is None:
+        example_label = operator.itemgetter(
+            [f[0] for f in examples_header].index('cls'))
+    # Load example definitions (or prepare to read them in step with the
+    # events)
+    id2ex = (_merge_examples if merge_join else _read_examples)(
+        examples_csv_filename, examples_csv_format, examples_header,
+        examples_header_detector, include_example_record)
+    # Load feature definitions
+    feat_recs, _, feat_key2idsfuncs = load(
+        features_csv_filename,
+        features_csv_format,
+        features_header,
+        features_header_detector,
+        feature_function_namespaces,
+        feature_function_modules,
+        features_compiled,
+    )
+    feat_id_idx = [f[0] for f in features_header].index('id')
+    matrix = FeatureMatrix(feat_rec[feat_id_idx] for feat_rec in feat_recs)
+    # Add a row for each example definition
+    ev_seqs = _read_event_sequences(
+        events_csv_filename, events_csv_format, events_header,
+        events_header_detector, events_index, include_event_record,
+        transform_event_record, id2ex,
+        events.compact_sequence if compact_sequences else events.sequence,
+        _event_type_filter(feat_key2idsfuncs, events_header,
+                           transform_event_record),
+        events_cache)
+    if sweep:
+        for (ex, feat_vals) in _swept_feature_values(
+                ev_seqs, id2ex, examples_header, feat_key2idsfuncs,
+                always_feature_keys):
+            matrix._append(example_label(ex), feat_vals)
+        return matrix
+    for (ex, subseq) in _example_subsequences(
+            ev_seqs, id2ex, examples_header):
+        matrix.add(example_label(ex), feat_key2idsfuncs, ex, subseq,
+                   always_feature_keys)
+    return matrix
+
+
+def _read_event_sequences(
+        events_csv_filename,
+        events_csv_format,
+        events_header,
+        events_header_detector,
+        events_index,
+        include_event_record,
+        transform_event_record,
+        id2ex,
+        sequence_constructor=events.sequence,
+        include_raw_record=None,
+        events_cache=None,
+):
+    """
+    Read and yield the event sequences of the IDs that have examples.
+    CSV files are read through the given cache of column stores, if
+    any.
+    """
+    # Unpack events header
+    ev_id_idx = [f[0] for f in events_header].index('id')
+    # Substitute the cached column store of a CSV file
+    if events_cache is not None and _is_cacheable(events_csv_filename):
+        if not isinstance(events_cache, cache.Cache):
+            events_cache = cache.Cache(events_cache)
+        try:
+            events_csv_filename = events_cache.column_store(
+                events_csv_filename, events_csv_format, events_header,
+                events_header_detector, events_header[ev_id_idx][0])
+        except ValueError:
+            # Read the CSV as usual
+            pass
+    # Read events from a column store (already parsed) or a CSV
+    store = None
+    if colstore.is_column_store(events_csv_filename):
+        ev_recs = store = colstore.ColumnStore(
+            events_csv_filename, events_header)
+        parse_ev_rec = None
+    elif events_index:
+        if events_index is True:
+            events_index = records.sidecar_index_filename(
+                events_csv_filename)
+            if not records.index_is_current(
+                    events_csv_filename, events_index):
+                records.build_index(
+                    events_csv_filename, events_csv_format, ev_id_idx,
+                    events_header_detector, events_index)
+        ev_recs = records.IndexedCsv(
+            events_csv_filename, events_csv_format, events_index,
+            events_header[ev_id_idx][1])
+        parse_ev_rec = records.mk_parser(events_header)
+    else:
+        ev_recs = records.read_csv(
+            events_csv_filename,
+            events_csv_format,
+            events_header,
+            header_detector=events_header_detector,
+            parser=False,
+        )
+        parse_ev_rec = records.mk_parser(events_header)
+    ev_seqs = events.read_sequences(
+        ev_recs,
+        header=events_header,
+        parse_id=events_header[ev_id_idx][1],
+        include_ids=id2ex,
+        parse_record=parse_ev_rec,
+        include_record=include_event_record,
+        transform_record=transform_event_record,
+        sequence_constructor=sequence_constructor,
+        include_raw_record=include_raw_record,
+    )
+    if store is not None:
+        return _closing_items(ev_seqs, store)
+    return ev_seqs
+
+
+def _closing_items(items, resource):
+    # Yield the items and then close the resource, even if the
+    # iteration is abandoned
+    with resource:
+        yield from items
+
+
+def _is_cacheable(filename):
+    return (isinstance(filename, (str, pathlib.Path)) and
+            filename != '-' and
+            os.path.isfile(filename) and
+            not colstore.is_column_store(filename))
+
+
+def _event_type_filter(
+        feature_key2idsfuncs,
+        events_header,
+        transform_event_record,
+):
+    """
+    Return a filter of unparsed event records that includes only the
+    types that the feature functions use (see `event_types`), or `None`
+    if all types are needed.  Custom transforming of event records
+    might change their types, so it needs all of them.
+    """
+    if transform_event_record is not None:
+        return None
+    nm2type = {field[0]: field[1] for field in events_header}
+    # Unparsed records are text, and parsed records (from column
+    # stores) must be too
+    if nm2type['cat'] is not str or nm2type['typ'] is not str:
+        return None
+    types = event_types(feature_key2idsfuncs)
+    if types is None:
+        return None
+    return events.mk_type_filter(types, events_header)
+
+
+def _read_examples(
+        examples_csv_filename,
+        examples_csv_format,
+        examples_header,
+        examples_header_detector,
+        include_example_record,
+):
+    """Read examples and return a mapping of IDs to lists of examples."""
+    ex_id_idx = [f[0] for f in examples_header].index('id')
+    exs = records.read_csv(
+        examples_csv_filename, examples_csv_format, examples_header,
+        examples_header_detector, include_record=include_example_record)
+    # Collect examples by ID
+    id2ex = collections.defaultdict(list)
+    for ex in exs:
+        id2ex[ex[ex_id_idx]].append(ex)
+    return id2ex
+
+
+class _MergedExamples:
+    """
+    Examples that are read in order of ID in step with the event
+    sequences they are joined with.
+
+    Acts as the mapping of IDs to lists of examples that
+    `_read_examples` returns (for `in` and `get`), except that IDs must
+    be looked up in nondecreasing order.  Only the examples of the
+    current ID are held in memory.  Both the examples and the lookups
+    must be sorted by ID, and `ValueError` is raised if they are not.
+    """
+
+    def __init__(self, examples, id_index):
+        self._groups = itools.groupby(
+            examples, operator.itemgetter(id_index))
+        self._id = None
+        self._examples = None
+        self._lookup_id = None
+        self._advance()
+
+    def _advance(self):
+        group = next(self._groups, None)
+        if group is None:
+            self._examples = None
+            return
+        id, exs = group
+        if self._id is not None and not self._id < id:
+            raise ValueError('Examples are not sorted by ID: {!r} after {!r}'
+                             .format(id, self._id))
+        self._id = id
+        self._examples = list(exs)
+
+    def _seek(self, id):
+        # Advance to the examples of the given ID and return whether
+        # there are any
+        if self._lookup_id is not None and id < self._lookup_id:
+            raise ValueError(
+                'Event sequences are not sorted by ID: {!r} after {!r}'
+                .format(id, self._lookup_id))
+        self._lookup_id = id
+        while self._examples is not None and self._id < id:
+            self._advance()
+        return self._examples is not None and self._id == id
+
+    def __contains__(self, id):
+        return self._seek(id)
+
+    def get(self, id, default=None):
+        return self._examples if self._seek(id) else default
+
+
+def _merge_examples(
+        examples_csv_filename,
+        examples_csv_format,
+        examples_header,
+        examples_header_detector,
+        include_example_record,
+):
+    """
+    Return the examples as a `_MergedExamples` that reads them as it is
+    joined with event sequences instead of all at once.
+    """
+    ex_id_idx = [f[0] for f in examples_header].index('id')
+    exs = records.read_csv(
+        examples_csv_filename, examples_csv_format, examples_header,
+        examples_header_detector, include_record=include_example_record)
+    return _MergedExamples(exs, ex_id_idx)
+
+
+def _example_subsequences(event_sequences, id2ex, examples_header):
+    """
+    Yield an (example, event-subsequence) pair for each example of the
+    given event sequences where the subsequence has the events that
+    overlap the example period.
+    """
+    # Unpack examples header
+    ex_hdr_nm2idx = {f[0]: i for i, f in enumerate(examples_header)}
+    ex_lo_idx = ex_hdr_nm2idx['lo']
+    ex_hi_idx = ex_hdr_nm2idx['hi']
+    for ev_seq in event_sequences:
         # Skip any IDs without examples
         for ex in id2ex.get(ev_seq.id, ()):
             # Create a subsequence that includes all the events that
@@ -628,8 +1752,430 @@ def mk_feature_vectors(
             itvl = esal.Interval(ex[ex_lo_idx], ex[ex_hi_idx])
             subseq = ev_seq.subsequence(ev_seq.events_overlapping(
                 itvl.lo, itvl.hi, itvl.is_lo_open, itvl.is_hi_open))
-            # Create feature vector
-            fv = vector(
-                feat_key2idsfuncs, ex, subseq, always_feature_keys)
-            # Yield example and its feature fector
-            yield ex, fv
+            yield ex, subseq
+
+
+class _EventWindow:
+    """
+    Window of the events of a sequence that overlap an example period,
+    as maintained by `_sweep_windows`.
+
+    The counts of event types are kept current by adding and retracting
+    events as the window moves, so count features can be computed
+    without making a subsequence.  The facts and ID are those of the
+    whole sequence.  Anything else is delegated to the subsequence of
+    the events overlapping the period, which is only made when needed.
+    """
+
+    def __init__(self, event_sequence):
+        self._ev_seq = event_sequence
+        self.id = event_sequence.id
+        self._counts = {}
+        self._n_events = 0
+        self._interval = None
+        self._subseq = None
+
+    def _add(self, event_type):
+        self._counts[event_type] = self._counts.get(event_type, 0) + 1
+        self._n_events += 1
+
+    def _retract(self, event_type):
+        n_typ = self._counts[event_type] - 1
+        if n_typ > 0:
+            self._counts[event_type] = n_typ
+        else:
+            del self._counts[event_type]
+        self._n_events -= 1
+
+    def _move(self, interval):
+        self._interval = interval
+        self._subseq = None
+
+    def fact_keys(self):
+        return self._ev_seq.fact_keys()
+
+    def fact(self, key, *default):
+        return self._ev_seq.fact(key, *default)
+
+    def types(self):
+        return self._counts.keys()
+
+    def has_type(self, event_type):
+        return event_type in self._counts
+
+    def n_events(self):
+        return self._n_events
+
+    def n_events_of_type(self, event_type):
+        return self._counts.get(event_type, 0)
+
+    def type_counts(self):
+        return self._counts
+
+    def subsequence_of_window(self):
+        """Return the events in the window as an event sequence."""
+        if self._subseq is None:
+            itvl = self._interval
+            self._subseq = self._ev_seq.subsequence(
+                self._ev_seq.events_overlapping(
+                    itvl.lo, itvl.hi, itvl.is_lo_open, itvl.is_hi_open))
+        return self._subseq
+
+    def __getattr__(self, name):
+        return getattr(self.subsequence_of_window(), name)
+
+
+def _starts_by(when, interval):
+    # Whether an event that starts at `when` starts by the end of the
+    # interval
+    return (when.lo < interval.hi or
+            (when.lo == interval.hi and
+             not (when.is_lo_open or interval.is_hi_open)))
+
+
+def _ends_before(when, interval):
+    # Whether an event that ends at `when` ends before the start of the
+    # interval
+    return (when.hi < interval.lo or
+            (when.hi == interval.lo and
+             (when.is_hi_open or interval.is_lo_open)))
+
+
+def _sweep_windows(event_sequence, examples, ex_lo_idx, ex_hi_idx):
+    """
+    Sweep the examples of the given event sequence in order of start and
+    yield an (example-index, window) pair for each, where the window
+    (an `_EventWindow`) has the events that overlap the example period.
+
+    The window is moved incrementally from example to example: events
+    that end before the example starts are retracted for good, and
+    events are added or retracted according to whether they start by
+    the end of the example.  The same window object is yielded every
+    time, so use it before advancing the generator.
+    """
+    itvls = [esal.Interval(ex[ex_lo_idx], ex[ex_hi_idx]) for ex in examples]
+    ex_order = sorted(range(len(examples)), key=lambda idx: (
+        itvls[idx].lo, itvls[idx].is_lo_open))
+    # Order the events by start (for adding) and by end (for expiring).
+    # Closed starts sort before open ones and open ends before closed
+    # ones so that both conditions are monotone.
+    evs = [ev for typ in event_sequence.types()
+           for ev in event_sequence.events(typ)]
+    evs.sort(key=lambda ev: (ev.when.lo, ev.when.is_lo_open))
+    by_end = sorted(range(len(evs)), key=lambda idx: (
+        evs[idx].when.hi, not evs[idx].when.is_hi_open))
+    expired = [False] * len(evs)
+    window = _EventWindow(event_sequence)
+    n_started = 0
+    n_expired = 0
+    for ex_idx in ex_order:
+        itvl = itvls[ex_idx]
+        # Expire the events that end before the example starts.  The
+        # examples are in order of start, so these never return.
+        while (n_expired < len(by_end) and
+               _ends_before(evs[by_end[n_expired]].when, itvl)):
+            ev_idx = by_end[n_expired]
+            expired[ev_idx] = True
+            if ev_idx < n_started:
+                window._retract(evs[ev_idx].type)
+            n_expired += 1
+        # Add the events that start by the end of the example or retract
+        # those that no longer do (the ends of examples need not be in
+        # order)
+        while (n_started < len(evs) and
+               _starts_by(evs[n_started].when, itvl)):
+            if not expired[n_started]:
+                window._add(evs[n_started].type)
+            n_started += 1
+        while (n_started > 0 and
+               not _starts_by(evs[n_started - 1].when, itvl)):
+            n_started -= 1
+            if not expired[n_started]:
+                window._retract(evs[n_started].type)
+        window._move(itvl)
+        yield ex_idx, window
+
+
+def _swept_feature_values(
+        event_sequences,
+        id2ex,
+        examples_header,
+        feature_key2idsfuncs,
+        always_keys,
+):
+    """
+    Yield an (example, ((feature-ID, value), ...)) pair for each example
+    of the given event sequences, in the same order as
+    `_example_subsequences`, by sweeping the examples of each sequence
+    (see `_sweep_windows`).
+    """
+    ex_hdr_nm2idx = {f[0]: i for i, f in enumerate(examples_header)}
+    ex_lo_idx = ex_hdr_nm2idx['lo']
+    ex_hi_idx = ex_hdr_nm2idx['hi']
+    for ev_seq in event_sequences:
+        exs = id2ex.get(ev_seq.id, ())
+        values = [None] * len(exs)
+        for (ex_idx, window) in _sweep_windows(
+                ev_seq, exs, ex_lo_idx, ex_hi_idx):
+            values[ex_idx] = tuple(feature_values(
+                feature_key2idsfuncs, exs[ex_idx], window, always_keys))
+        yield from zip(exs, values)
+
+
+def mk_feature_vectors_parallel(
+        events_csv_filename,
+        examples_csv_filename,
+        features_csv_filename,
+        events_csv_format=events.csv_format,
+        examples_csv_format=examples.csv_format,
+        features_csv_format=csv_format,
+        events_header=events.header(),
+        examples_header=examples.header(),
+        features_header=header(),
+        events_header_detector=True,
+        examples_header_detector=True,
+        features_header_detector=True,
+        include_event_record=None,
+        transform_event_record=None,
+        include_example_record=None,
+        always_feature_keys=(),
+        feature_function_namespaces=None,
+        feature_function_modules=None,
+        n_processes=None,
+        shard_size=(2 ** 26), # 64 MiB
+        max_in_flight=None,
+        features_compiled=None,
+        events_encoding='utf-8',
+):
+    """
+    Make and yield feature vectors using multiple processes.
+
+    Yields the same (example, feature-vector) pairs in the same order as
+    `mk_feature_vectors`, to which the common arguments are passed.
+
+    Splits the events file into shards of about `shard_size` bytes on
+    ID boundaries and makes the feature vectors of each shard in a pool
+    of `n_processes` worker processes (default is the number of CPUs).
+    At most `max_in_flight` shards (default is twice the number of
+    processes) are submitted or held for output at once, which bounds
+    memory use.  Each worker loads the features itself.  If
+    `features_compiled` is given (see `load`), the compiled feature table
+    is brought up to date before the workers start so that they all
+    load it instead of parsing the CSV.
+
+    The events file must be an uncompressed CSV file that is sorted by
+    ID (numerically, if IDs are numbers).  Otherwise, this falls back to
+    `mk_feature_vectors`, except that a `ValueError` is raised if the
+    IDs at the shard boundaries are not increasing (as parsed by the
+    events header), because then examples would be assigned to the
+    wrong shards.  Records may span lines (e.g. quoted JSON with line
+    breaks), but then the whole events file is read to find the shard
+    boundaries (see `records.shard_csv`).  The events file is
+    decoded with `events_encoding`.  The record functions, namespaces,
+    and modules must be picklable (e.g. defined at the top level of a
+    module).
+    """
+    # Fall back to serial processing if the events cannot be sharded
+    if not _is_shardable(events_csv_filename):
+        yield from mk_feature_vectors(
+            events_csv_filename,
+            examples_csv_filename,
+            features_csv_filename,
+            events_csv_format,
+            examples_csv_format,
+            features_csv_format,
+            events_header,
+            examples_header,
+            features_header,
+            events_header_detector,
+            examples_header_detector,
+            features_header_detector,
+            include_event_record=include_event_record,
+            transform_event_record=transform_event_record,
+            include_example_record=include_example_record,
+            always_feature_keys=always_feature_keys,
+            feature_function_namespaces=feature_function_namespaces,
+            feature_function_modules=feature_function_modules,
+            features_compiled=features_compiled,
+        )
+        return
+    if n_processes is None:
+        n_processes = os.cpu_count() or 1
+    if max_in_flight is None:
+        max_in_flight = 2 * n_processes
+    # Load example definitions and order them by ID in order to assign
+    # them to shards
+    id2ex = _read_examples(
+        examples_csv_filename, examples_csv_format, examples_header,
+        examples_header_detector, include_example_record)
+    ex_ids = sorted(id2ex)
+    # Shard the events
+    ev_id_idx = [f[0] for f in events_header].index('id')
+    parse_id = events_header[ev_id_idx][1]
+    shards = records.shard_csv(
+        events_csv_filename, shard_size, events_csv_format, ev_id_idx,
+        events_encoding)
+    # Examples are assigned to shards by ID, which requires the shards
+    # to be in order of ID
+    bound_ids = [parse_id(first_id) for (_, _, first_id) in shards[1:]]
+    for (id1, id2) in zip(bound_ids, bound_ids[1:]):
+        if not id1 < id2:
+            raise ValueError('Events are not sorted by ID: {!r} precedes '
+                             '{!r}'.format(id1, id2))
+    # Compile the feature table once for all the workers
+    if features_compiled and isinstance(
+            features_csv_filename, (str, pathlib.Path)):
+        if features_compiled is True:
+            features_compiled = compiled_features_filename(
+                features_csv_filename)
+        _load_compiled_records(
+            features_csv_filename, features_compiled, features_csv_format,
+            features_header, features_header_detector,
+            feature_function_modules)
+    # Workers load the features and process shards of events.  Modules
+    # are passed by name because they cannot be pickled.
+    worker_args = (
+        events_csv_filename,
+        features_csv_filename,
+        events_csv_format,
+        features_csv_format,
+        events_header,
+        examples_header,
+        features_header,
+        events_header_detector,
+        features_header_detector,
+        include_event_record,
+        transform_event_record,
+        always_feature_keys,
+        feature_function_namespaces,
+        ([module.__name__ for module in feature_function_modules]
+         if feature_function_modules is not None
+         else None),
+        features_compiled,
+        events_encoding,
+    )
+    with concurrent.futures.ProcessPoolExecutor(
+            n_processes, initializer=_init_shard_worker,
+            initargs=worker_args) as pool:
+        futures = collections.deque()
+        for (shard_idx, (offset, length, _)) in enumerate(shards):
+            # Find the examples whose IDs are in this shard
+            lo = (bisect.bisect_left(ex_ids, bound_ids[shard_idx - 1])
+                  if shard_idx > 0
+                  else 0)
+            hi = (bisect.bisect_left(ex_ids, bound_ids[shard_idx])
+                  if shard_idx < len(bound_ids)
+                  else len(ex_ids))
+            if lo == hi:
+                continue
+            exs = [ex for id in ex_ids[lo:hi] for ex in id2ex[id]]
+            # Wait for the oldest shard before submitting another
+            if len(futures) >= max_in_flight:
+                yield from futures.popleft().result()
+            futures.append(pool.submit(
+                _mk_shard_vectors, offset, length, exs))
+        while futures:
+            yield from futures.popleft().result()
+
+
+def _is_shardable(filename):
+    if not isinstance(filename, (str, pathlib.Path)) or filename == '-':
+        return False
+    if colstore.is_column_store(filename):
+        return False
+    with builtins.open(filename, 'rb') as file:
+        return core.infer_compression(filename, file.peek(8)) is None
+
+
+# Per-process state of shard workers
+_shard_worker = None
+
+
+def _init_shard_worker(
+        events_csv_filename,
+        features_csv_filename,
+        events_csv_format,
+        features_csv_format,
+        events_header,
+        examples_header,
+        features_header,
+        events_header_detector,
+        features_header_detector,
+        include_event_record,
+        transform_event_record,
+        always_feature_keys,
+        feature_function_namespaces,
+        feature_function_module_names,
+        features_compiled,
+        events_encoding,
+):
+    global _shard_worker
+    modules = ([importlib.import_module(name)
+                for name in feature_function_module_names]
+               if feature_function_module_names is not None
+               else None)
+    _, _, feat_key2idsfuncs = load(
+        features_csv_filename,
+        features_csv_format,
+        features_header,
+        features_header_detector,
+        feature_function_namespaces,
+        modules,
+        features_compiled,
+    )
+    include_raw_record = _event_type_filter(
+        feat_key2idsfuncs, events_header, transform_event_record)
+    _shard_worker = dict(
+        events_csv_filename=events_csv_filename,
+        events_csv_format=events_csv_format,
+        events_encoding=events_encoding,
+        events_header=events_header,
+        examples_header=examples_header,
+        events_header_detector=events_header_detector,
+        include_event_record=include_event_record,
+        transform_event_record=transform_event_record,
+        always_feature_keys=always_feature_keys,
+        feat_key2idsfuncs=feat_key2idsfuncs,
+        include_raw_record=include_raw_record,
+        parse_record=records.mk_parser(events_header),
+    )
+
+
+def _mk_shard_vectors(offset, length, examples):
+    """
+    Make and return the list of (example, feature-vector) pairs for the
+    given examples from the given shard of events.
+    """
+    wkr = _shard_worker
+    events_header = wkr['events_header']
+    ev_id_idx = [f[0] for f in events_header].index('id')
+    ex_id_idx = [f[0] for f in wkr['examples_header']].index('id')
+    id2ex = collections.defaultdict(list)
+    for ex in examples:
+        id2ex[ex[ex_id_idx]].append(ex)
+    # Read the shard.  Only the first shard has a header.
+    with builtins.open(wkr['events_csv_filename'], 'rb') as file:
+        file.seek(offset)
+        text = file.read(length).decode(wkr['events_encoding'])
+    ev_recs = records.read_csv(
+        io.StringIO(text),
+        wkr['events_csv_format'],
+        events_header,
+        header_detector=(
+            wkr['events_header_detector'] if offset == 0 else None),
+        parser=False,
+    )
+    ev_seqs = events.read_sequences(
+        ev_recs,
+        header=events_header,
+        parse_id=events_header[ev_id_idx][1],
+        include_ids=id2ex,
+        parse_record=wkr['parse_record'],
+        include_record=wkr['include_event_record'],
+        transform_record=wkr['transform_event_record'],
+        include_raw_record=wkr['include_raw_record'],
+    )
+    return [(ex, vector(wkr['feat_key2idsfuncs'], ex, subseq,
+                        wkr['always_feature_keys']))
+            for (ex, subseq) in _example_subsequences(
+                    ev_seqs, id2ex, wkr['examples_header'])]
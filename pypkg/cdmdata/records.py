@@ -1,13 +1,17 @@
 """Working with records and tabular data"""
 
-# Copyright (c) 2019 Aubrey Barnard.
+# Copyright (c) 2019, 2026 Aubrey Barnard.
 #
 # This is free, open software licensed under the [MIT License](
 # https://choosealicense.com/licenses/mit/).
 
 
 import csv
+import io
+import os
+import pathlib
 import re
+import sys
 
 from . import core
 
@@ -82,6 +86,7 @@ def read_csv(
         parser=True,
         include_record=None,
         transform_record=None,
+        include_raw_record=None,
 ):
     """
     Read and yield records from the given CSV file.
@@ -115,6 +120,8 @@ def read_csv(
         Passed to `process`.
     transform_record:
         Passed to `process`.
+    include_raw_record:
+        Passed to `process`.
     """
     # Use or make detector for header as requested
     if callable(header_detector):
@@ -149,10 +156,12 @@ def read_csv(
             # records than just doing one more call to `process`.
             if rec is not None:
                 yield from process(
-                    (rec,), parser, include_record, transform_record)
+                    (rec,), parser, include_record, transform_record,
+                    include_raw_record)
         # Process all the records and yield them
         yield from process(
-            records, parser, include_record, transform_record)
+            records, parser, include_record, transform_record,
+            include_raw_record)
 
 
 def is_header_if_first_n_lines(n_header_lines=0):
@@ -211,6 +220,11 @@ def mk_parser(header, null_values=('',)):
     Return a function that will parse a record according to the given
     header.
 
+    The function is specialized for the header: the conversion of each
+    field is unrolled, and fields of type `str` are passed through
+    without a call.  Records whose length differs from the header are
+    parsed like `zip(header, record)`.
+
     header: Sequence<(str, function<T>(str)->T)>
         Indexable collection of (name, func) pairs where the function
         parses a string into a value of the desired type.
@@ -218,26 +232,74 @@ def mk_parser(header, null_values=('',)):
         Set of unparsed values to replace with `None` instead of
         parsing.
     """
-    hdr_len = len(header)
+    parse_generic = _mk_generic_parser(header, null_values)
+    if len(header) == 0:
+        return parse_generic
+    # Only the empty string is false, so the test for nulls can be a
+    # truth test
+    null_values = frozenset(null_values)
+    is_empty_null = null_values == frozenset(('',))
+    # Generate the source code of a function that constructs the parser
+    # from the field parsing functions
+    fields = ['f{}'.format(idx) for idx in range(len(header))]
+    exprs = []
+    for (idx, (_, parse)) in enumerate(header):
+        fld = fields[idx]
+        value = fld if parse is str else 'p{}({})'.format(idx, fld)
+        if is_empty_null:
+            if parse is str:
+                exprs.append('{} or None'.format(fld))
+            else:
+                exprs.append('{} if {} else None'.format(value, fld))
+        else:
+            exprs.append('{} if {} not in null_values else None'
+                         .format(value, fld))
+    source = _parser_template.format(
+        params=', '.join('p{}'.format(idx) for idx in range(len(header))),
+        n_fields=len(header),
+        fields=', '.join(fields),
+        exprs=''.join('            ({}),\n'.format(expr) for expr in exprs),
+    )
+    namespace = {}
+    exec(compile(source, '<cdmdata.records.mk_parser>', 'exec'), namespace)
+    return namespace['mk_parse_record'](
+        null_values, parse_generic, *(parse for (_, parse) in header))
+
+
+_parser_template = """
+def mk_parse_record(null_values, parse_generic, {params}):
+    def parse_record(record):
+        if len(record) != {n_fields}:
+            return parse_generic(record)
+        {fields}, = record
+        return [
+{exprs}        ]
+    return parse_record
+"""
+
+
+def _mk_generic_parser(header, null_values=('',)):
+    """
+    Return a function that will parse a record according to the given
+    header by applying each field's parser in turn.  This is the
+    unspecialized version of `mk_parser`.
+    """
     def parse_record(record):
         return [(parse(text) if text not in null_values else None)
                 for ((_, parse), text) in zip(header, record)]
     return parse_record
 
-# header = list(zip(string.ascii_lowercase, (int, datetime.date.fromisoformat, datetime.date.fromisoformat, str, str, int, float, float)))
-# raw_record = ['123456789', '2013-11-13', '2019-04-30', 'cluster', 'penumbra', '987654321', '1.23456789', '9.87654321']
-# timeit.timeit(setup='prsr = data.mk_record_parser(header)', stmt='prsr(raw_record)', globals=globals())
-
 
 def process(
         records,
         parse_record=None,
         include_record=None,
         transform_record=None,
+        include_raw_record=None,
 ):
     """
-    Create a pipeline that optionally parses, filters, and transforms
-    the given records.  Return an iterable of records.
+    Create a pipeline that optionally filters, parses, filters, and
+    transforms the given records.  Return an iterable of records.
 
     records: Iterable<list<str>>
     parse_record: function(list<str>)->list<object>
@@ -249,7 +311,14 @@ def process(
     transform_record: function(list<object>)->list<object>
         Function to transform a record before it is converted into an
         event.  Applied after including / discarding records.
+    include_raw_record: function(list<str>)->bool
+        Predicate that returns whether a record should be included or
+        discarded before it is parsed.  Use to avoid parsing records
+        that will be discarded anyway.
     """
+    # Filter unparsed records if requested
+    if include_raw_record is not None:
+        records = filter(include_raw_record, records)
     # Parse records if requested
     if parse_record is not None:
         records = map(parse_record, records)
@@ -260,3 +329,439 @@ def process(
     if transform_record is not None:
         records = map(transform_record, records)
     return records
+
+
+def write_csv(
+        records,
+        csv_filename,
+        csv_format,
+        header=None,
+        format_record=None,
+):
+    """
+    Write the given records to the given CSV file and return the number
+    of records written.
+
+    records: Iterable<list<object>>
+    csv_filename:
+        Filename, path, stream, or '-', which indicates to use standard
+        output.  Files are compressed according to their suffixes (see
+        `core.open`).  Streams are not closed.
+    csv_format:
+        Passed to `csv.writer`.
+    header:
+        Sequence of (name, type) pairs.  If given, a header line of the
+        names is written first.
+    format_record: function(list<object>)->list<object>
+        Function to format each record before it is written.  Fields
+        that are `None` are written as empty text and all others with
+        `str`.
+    """
+    if csv_filename == '-':
+        return _write_csv(records, sys.stdout, csv_format, header,
+                          format_record)
+    if not isinstance(csv_filename, (str, pathlib.Path)):
+        return _write_csv(records, csv_filename, csv_format, header,
+                          format_record)
+    with core.open(csv_filename, 'wt') as file:
+        return _write_csv(records, file, csv_format, header, format_record)
+
+
+def _write_csv(records, file, csv_format, header, format_record):
+    writer = csv.writer(file, **csv_format)
+    if header is not None:
+        writer.writerow(field[0] for field in header)
+    if format_record is not None:
+        records = map(format_record, records)
+    n_records = 0
+    for record in records:
+        writer.writerow(record)
+        n_records += 1
+    return n_records
+
+
+# Indexes of groups of records
+
+
+"""Header of a table that indexes groups of records in a CSV file"""
+index_header = (
+    ('id', str),
+    ('offset', int),
+    ('length', int),
+)
+
+
+"""Format of CSV tables that index groups of records"""
+index_csv_format = dict(
+    delimiter='|',
+    lineterminator='\n',
+    quoting=csv.QUOTE_MINIMAL,
+)
+
+
+"""
+Prefix of the first line of an index, which records the size and
+modification time of the indexed file
+"""
+index_source_prefix = '# source: '
+
+
+def sidecar_index_filename(csv_filename):
+    """Return the name of the sidecar index of the given CSV file."""
+    return str(csv_filename) + '.idx'
+
+
+def _source_stamp(csv_filename):
+    stat = os.stat(csv_filename)
+    return 'size={} mtime_ns={}'.format(stat.st_size, stat.st_mtime_ns)
+
+
+def _read_index_source(index_file):
+    # Return the source stamp of an open index and leave the file at the
+    # start of the index table.  Indexes without a stamp have `None`.
+    line = index_file.readline()
+    if line.startswith(index_source_prefix):
+        return line[len(index_source_prefix):].strip()
+    index_file.seek(0)
+    return None
+
+
+def read_index(index_filename, parse_id=str):
+    """
+    Read the given index (as made by `build_index`) and return its list
+    of (ID, offset, length) triples.
+
+    parse_id:
+        Function to parse the IDs in the index: parse_id(str) -> object.
+    """
+    with open(index_filename, 'rt') as file:
+        _read_index_source(file)
+        return [(parse_id(id), offset, length)
+                for (id, offset, length) in read_csv(
+                    file, index_csv_format, index_header)]
+
+
+def index_is_current(csv_filename, index_filename=None):
+    """
+    Return whether the given index exists and was built from the given
+    CSV file as it is now (judging by its size and modification time).
+    """
+    if index_filename is None:
+        index_filename = sidecar_index_filename(csv_filename)
+    try:
+        with open(index_filename, 'rt') as file:
+            source = _read_index_source(file)
+    except FileNotFoundError:
+        return False
+    return source is not None and source == _source_stamp(csv_filename)
+
+
+def build_index(
+        csv_filename,
+        csv_format,
+        id_index=0,
+        header_detector=True,
+        index_filename=None,
+        encoding='utf-8',
+):
+    """
+    Build a sidecar index of the groups of records in the given CSV file
+    and return the name of the index file.
+
+    The CSV file must be grouped by ID (as it is when sorted by ID);
+    raises `ValueError` if it is not.  The index has a (ID, offset,
+    length) record for each group that gives the location of the group
+    in the file in bytes.  The index starts with a line that records
+    the size and modification time of the CSV file so that stale
+    indexes can be detected (see `index_is_current`).  The CSV file is
+    read once with `csv.reader`, so records may span lines.
+
+    csv_filename:
+        Name of an uncompressed CSV file.
+    csv_format:
+        Passed to `csv.reader`.
+    id_index:
+        Index of the ID field in each record.
+    header_detector:
+        As for `read_csv`.  Header records are not indexed.
+    index_filename:
+        Name of the index file.  Default is the name given by
+        `sidecar_index_filename`.
+    encoding:
+        Encoding of the CSV file.
+    """
+    if index_filename is None:
+        index_filename = sidecar_index_filename(csv_filename)
+    if header_detector is True:
+        header_detector = is_header_if_identifiers()
+    # Keep track of the position in bytes while decoding lines.
+    # `csv.reader` only reads the lines it needs for each record, so
+    # after each record, the position is the end of that record.
+    position = 0
+    def lines(file):
+        nonlocal position
+        for line in file:
+            position += len(line)
+            yield line.decode(encoding)
+    # Stamp the index with the file as it was before reading it
+    source = _source_stamp(csv_filename)
+    with open(csv_filename, 'rb') as file:
+        if core.infer_compression(csv_filename, file.peek(8)) is not None:
+            raise ValueError('Cannot index a compressed file: {!r}'
+                             .format(csv_filename))
+        idx_file = open(index_filename, 'wt')
+        try:
+            idx_file.write(index_source_prefix + source + '\n')
+            writer = csv.writer(idx_file, **index_csv_format)
+            writer.writerow(field[0] for field in index_header)
+            seen_ids = set()
+            grp_id = None
+            grp_lo = grp_hi = 0
+            for (idx, record) in enumerate(
+                    csv.reader(lines(file), **csv_format)):
+                rec_lo = grp_hi
+                grp_hi = position
+                # Skip header records
+                if header_detector is not None and header_detector(
+                        idx, record):
+                    grp_lo = grp_hi
+                    continue
+                header_detector = None
+                # Skip empty lines
+                if not record:
+                    continue
+                rec_id = record[id_index]
+                if rec_id != grp_id:
+                    if rec_id in seen_ids:
+                        raise ValueError('Records are not grouped by ID: '
+                                         '{!r}'.format(rec_id))
+                    seen_ids.add(rec_id)
+                    if grp_id is not None:
+                        writer.writerow((grp_id, grp_lo, rec_lo - grp_lo))
+                    grp_id = rec_id
+                    grp_lo = rec_lo
+            if grp_id is not None:
+                writer.writerow((grp_id, grp_lo, grp_hi - grp_lo))
+        except BaseException:
+            # Do not leave a partial index
+            idx_file.close()
+            os.remove(index_filename)
+            raise
+        idx_file.close()
+    return index_filename
+
+
+class IndexedCsv:
+    """
+    CSV file with a sidecar index of its groups of records.
+
+    Acts as a grouped source of records for `events.read_sequences`
+    that reads only the groups that are requested.  Records are lists
+    of text fields, as from `csv.reader`.
+    """
+
+    def __init__(
+            self,
+            csv_filename,
+            csv_format,
+            index_filename=None,
+            parse_id=int,
+            encoding='utf-8',
+    ):
+        """
+        csv_filename:
+            Name of an uncompressed CSV file.
+        csv_format:
+            Passed to `csv.reader`.
+        index_filename:
+            Name of index file made by `build_index`.  Default is the
+            name given by `sidecar_index_filename`.
+        parse_id:
+            Function to parse the IDs in the index: parse_id(str) ->
+            object.
+        encoding:
+            Encoding of the CSV file.
+        """
+        if index_filename is None:
+            index_filename = sidecar_index_filename(csv_filename)
+        self.csv_filename = csv_filename
+        self.csv_format = csv_format
+        self.encoding = encoding
+        self.index = read_index(index_filename, parse_id)
+        self._id2loc = None
+
+    def __len__(self):
+        """Return the number of groups (IDs)."""
+        return len(self.index)
+
+    def ids(self):
+        """Return the IDs in file order."""
+        return [id for (id, _, _) in self.index]
+
+    def _read(self, file, offset, length):
+        file.seek(offset)
+        text = file.read(length).decode(self.encoding)
+        # Split lines only at line feeds, as when reading the file.
+        # (`str.splitlines` also splits at characters like '\x1c' and
+        # '\u2028', which may occur in fields.)
+        return list(csv.reader(
+            io.StringIO(text, newline=''), **self.csv_format))
+
+    def records(self, id):
+        """
+        Return the list of records with the given ID (empty if none).
+        """
+        if self._id2loc is None:
+            self._id2loc = {id: (offset, length)
+                            for (id, offset, length) in self.index}
+        loc = self._id2loc.get(id)
+        if loc is None:
+            return []
+        with open(self.csv_filename, 'rb') as file:
+            return self._read(file, *loc)
+
+    def groups(self, include_ids=None):
+        """
+        Yield (ID, records) pairs in file order.
+
+        include_ids:
+            Set of IDs to include; all other IDs are skipped without
+            reading them from the file.
+        """
+        with open(self.csv_filename, 'rb') as file:
+            for (id, offset, length) in self.index:
+                if include_ids is None or id in include_ids:
+                    yield id, self._read(file, offset, length)
+
+
+def shard_csv(
+        csv_filename,
+        shard_size,
+        csv_format,
+        id_index=0,
+        encoding='utf-8',
+):
+    """
+    Split the given CSV file into shards on ID boundaries and return a
+    list of (offset, length, first-ID) triples that describe the shards
+    in bytes.
+
+    The CSV file must be uncompressed and grouped by ID (as it is when
+    sorted by ID).  Each shard except the last is at least `shard_size`
+    bytes.  The first ID of the first shard is `None` because the first
+    shard includes any header.  The other first IDs are text.
+
+    If the file has no quote or escape characters, every line is a
+    record, so only the lines around the shard boundaries are read.
+    Otherwise records may span lines and the whole file is read with
+    `csv.reader` to find the boundaries between records.
+
+    csv_filename:
+        Name of an uncompressed CSV file.
+    shard_size:
+        Minimum size in bytes of each shard.
+    csv_format:
+        Passed to `csv.reader`.
+    id_index:
+        Index of the ID field in each record.
+    encoding:
+        Encoding of the CSV file.
+    """
+    size = os.path.getsize(csv_filename)
+    if _has_any(csv_filename, _quoting_chars(csv_format, encoding)):
+        bounds = _record_shard_bounds(
+            csv_filename, shard_size, csv_format, id_index, encoding)
+    else:
+        bounds = _line_shard_bounds(
+            csv_filename, shard_size, size,
+            csv_format.get('delimiter', ','), id_index, encoding)
+    bounds.append((size, None))
+    return [(lo, hi - lo, id)
+            for ((lo, id), (hi, _)) in zip(bounds, bounds[1:])]
+
+
+def _quoting_chars(csv_format, encoding):
+    # Encoded characters that can make a record span lines
+    chars = []
+    if csv_format.get('quoting') != csv.QUOTE_NONE:
+        chars.append(csv_format.get('quotechar', '"'))
+    chars.append(csv_format.get('escapechar'))
+    return [char.encode(encoding) for char in chars if char]
+
+
+def _has_any(filename, needles, chunk_size=(2 ** 20)):
+    # Whether the file contains any of the given byte strings (of one
+    # or a few bytes each)
+    if not needles:
+        return False
+    overlap = max(map(len, needles)) - 1
+    with open(filename, 'rb') as file:
+        tail = b''
+        chunk = file.read(chunk_size)
+        while chunk:
+            chunk = tail + chunk
+            if any(needle in chunk for needle in needles):
+                return True
+            tail = chunk[len(chunk) - overlap:] if overlap else b''
+            chunk = file.read(chunk_size)
+    return False
+
+
+def _line_shard_bounds(
+        csv_filename, shard_size, size, delimiter, id_index, encoding):
+    # Find the shard boundaries of a file whose lines are records
+    delimiter = delimiter.encode(encoding)
+    def line_id(line):
+        return line.rstrip(b'\r\n').split(delimiter, id_index + 1)[id_index]
+    bounds = [(0, None)]
+    with open(csv_filename, 'rb') as file:
+        target = shard_size
+        while target < size:
+            # Finish the line that contains the target position, then
+            # find the start of the next group
+            file.seek(target - 1)
+            file.readline()
+            line = file.readline()
+            if not line:
+                break
+            grp_id = line_id(line)
+            offset = file.tell()
+            line = file.readline()
+            while line and line_id(line) == grp_id:
+                offset = file.tell()
+                line = file.readline()
+            if not line:
+                break
+            bounds.append((offset, line_id(line).decode(encoding)))
+            target = offset + shard_size
+    return bounds
+
+
+def _record_shard_bounds(
+        csv_filename, shard_size, csv_format, id_index, encoding):
+    # Find the shard boundaries of a file whose records may span lines
+    # by reading all its records.  As in `build_index`, the position in
+    # bytes is tracked while decoding lines.
+    position = 0
+    def lines(file):
+        nonlocal position
+        for line in file:
+            position += len(line)
+            yield line.decode(encoding)
+    bounds = [(0, None)]
+    target = shard_size
+    grp_id = None
+    rec_lo = 0
+    with open(csv_filename, 'rb') as file:
+        for record in csv.reader(lines(file), **csv_format):
+            # Skip empty lines
+            if record:
+                rec_id = record[id_index]
+                # Start a shard at the first group that starts after
+                # the record that contains the target position
+                if rec_lo >= target and rec_id != grp_id:
+                    bounds.append((rec_lo, rec_id))
+                    target = rec_lo + shard_size
+                grp_id = rec_id
+            rec_lo = position
+    return bounds
@@ -0,0 +1,132 @@
+"""Tests `cache.py`"""
+
+# Copyright (c) 2026 Aubrey Barnard.
+#
+# This is free, open software licensed under the [MIT License](
+# https://choosealicense.com/licenses/mit/).
+
+
+import os
+import pathlib
+import re
+import tempfile
+import unittest
+import unittest.mock
+
+from .. import cache
+from .. import colstore
+from .. import events
+
+
+class CacheTest(unittest.TestCase):
+
+    header = events.header(str)
+
+    lines = [
+        'id|lo|hi|cat|typ|val|jsn\n',
+        '3|||bx|gndr|F|\n',
+        '3|2019-04-09|2019-04-10|dx|250||\n',
+        '1|2018-01-01|2018-01-02|dx|250||\n',
+    ]
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dir = pathlib.Path(self.tmp_dir.name)
+        self.cache = cache.Cache(self.dir / 'cache')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, name, lines):
+        path = self.dir / name
+        path.write_text(''.join(lines))
+        return path
+
+    def test_fingerprint(self):
+        path = self.write('evs.csv', self.lines)
+        fingerprint = cache.fingerprint(path)
+        self.assertEqual(fingerprint, cache.fingerprint(path))
+        # Same size and modification time, different contents
+        stat = path.stat()
+        self.write('evs.csv', [line.replace('dx', 'rx')
+                               for line in self.lines])
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertNotEqual(fingerprint, cache.fingerprint(path))
+
+    def test_fingerprint_sampled(self):
+        n_lines = 2 * cache._sample_size * cache._n_samples // 30
+        lines = ['{}|2019-04-09|2019-04-10|dx|250||\n'.format(idx)
+                 for idx in range(n_lines)]
+        path = self.write('evs.csv', lines)
+        fingerprint = cache.fingerprint(path)
+        stat = path.stat()
+        lines[-1] = lines[-1].replace('250', '251')
+        self.write('evs.csv', lines)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertNotEqual(fingerprint, cache.fingerprint(path))
+
+    def test_column_store(self):
+        path = self.write('evs.csv', self.lines)
+        store_path = self.cache.column_store(path, header=self.header)
+        self.assertTrue(colstore.is_column_store(store_path))
+        with colstore.ColumnStore(store_path, self.header) as store:
+            self.assertEqual([3, 1], store.ids())
+        # Hit
+        self.assertEqual(store_path, self.cache.column_store(
+            path, header=self.header))
+        self.assertEqual([store_path], self.cache.entries())
+
+    def test_invalidate(self):
+        path = self.write('evs.csv', self.lines)
+        old_path = self.cache.column_store(path, header=self.header)
+        self.write('evs.csv', self.lines + ['2|||bx|gndr|M|\n'])
+        new_path = self.cache.column_store(path, header=self.header)
+        self.assertNotEqual(old_path, new_path)
+        self.assertEqual([new_path], self.cache.entries())
+        with colstore.ColumnStore(new_path, self.header) as store:
+            self.assertEqual([3, 1, 2], store.ids())
+
+    def test_not_convertible(self):
+        path = self.write('evs.csv', self.lines[:1] + ['x|||bx|gndr|F|\n'])
+        with self.assertRaises(ValueError) as context:
+            self.cache.column_store(path, header=self.header)
+        self.assertEqual([], self.cache.entries())
+        (failed_path,) = self.cache.directory.iterdir()
+        self.assertEqual(cache.failed_suffix, failed_path.suffix)
+        # The failure is remembered without converting again
+        with unittest.mock.patch.object(
+                colstore, 'convert_csv') as convert_csv:
+            with self.assertRaisesRegex(
+                    ValueError, re.escape(str(context.exception))):
+                self.cache.column_store(path, header=self.header)
+            convert_csv.assert_not_called()
+        # Until the file changes
+        self.write('evs.csv', self.lines)
+        store_path = self.cache.column_store(path, header=self.header)
+        self.assertEqual([store_path],
+                         list(self.cache.directory.iterdir()))
+        self.cache.clear()
+        self.write('evs.csv', self.lines[:1] + ['x|||bx|gndr|F|\n'])
+        with self.assertRaises(ValueError):
+            self.cache.column_store(path, header=self.header)
+        self.cache.clear()
+        self.assertEqual([], list(self.cache.directory.iterdir()))
+
+    def test_evict_lru(self):
+        paths = [self.write('evs{}.csv'.format(idx), self.lines)
+                 for idx in range(3)]
+        store_paths = [self.cache.column_store(path, header=self.header)
+                       for path in paths]
+        # Use the first again, making the second least recently used
+        os.utime(store_paths[1], ns=(0, 0))
+        os.utime(store_paths[2], ns=(0, 10 ** 9))
+        self.cache.column_store(paths[0], header=self.header)
+        self.cache.max_entries = 2
+        self.cache.evict()
+        self.assertEqual([store_paths[2], store_paths[0]],
+                         self.cache.entries())
+        self.cache.max_bytes = 1
+        self.cache.evict(keep=store_paths[0])
+        self.assertEqual([store_paths[0]], self.cache.entries())
+        self.cache.clear()
+        self.assertEqual([], self.cache.entries())
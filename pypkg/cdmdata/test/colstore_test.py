@@ -0,0 +1,134 @@
+"""Tests `colstore.py`"""
+
+# Copyright (c) 2026 Aubrey Barnard.
+#
+# This is free, open software licensed under the [MIT License](
+# https://choosealicense.com/licenses/mit/).
+
+
+import io
+import os
+import pathlib
+import tempfile
+import unittest
+
+from .. import colstore
+from .. import events
+
+
+class ColumnStoreTest(unittest.TestCase):
+
+    header = events.header(str)
+
+    text_records = [
+        ['3', '', '', 'bx', 'gndr', 'F', ''],
+        ['3', '2019-04-09', '2019-04-10', 'dx', '250', '', ''],
+        ['3', '2019-04-09', '2019-04-09', 'mx', '4', 'lo', '{"v": 1}'],
+        ['1', '2018-01-01', '2018-01-02', 'dx', '250', '', ''],
+        ['2', '2018-01-01', '2018-01-01', 'rx', '7', '2', ''],
+        ['2', '2018-01-03', '2018-01-05', 'rx', '7', '1', ''],
+    ]
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filename = pathlib.Path(self.tmp_dir.name) / 'evs.cols'
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def expected(self, records):
+        return [[int(rec[0])] + [(x if x != '' else None) for x in rec[1:]]
+                for rec in records]
+
+    def test_round_trip(self):
+        colstore.write(self.text_records, self.filename, self.header)
+        self.assertTrue(colstore.is_column_store(self.filename))
+        with colstore.ColumnStore(self.filename, self.header) as store:
+            self.assertEqual(3, len(store))
+            self.assertEqual(6, store.n_records())
+            self.assertEqual([3, 1, 2], store.ids())
+            self.assertEqual(self.expected(self.text_records), list(store))
+            self.assertEqual(self.expected(self.text_records[4:]),
+                             store.records(2))
+            self.assertEqual([], store.records(4))
+
+    def test_parse_types(self):
+        header = events.header(lambda t: int(t.replace('-', '')))
+        colstore.write(self.text_records, self.filename, header)
+        with colstore.ColumnStore(self.filename, header) as store:
+            self.assertEqual(
+                [[1, 20180101, 20180102, 'dx', '250', None, None]],
+                store.records(1))
+
+    def test_null_values(self):
+        # Empty text is not null in dictionary or plain columns
+        records = [['1', 'NULL', '', 'dx', '250', '', 'NULL'],
+                   ['1', '1', '2', 'NULL', '', 'NULL', '{}']]
+        colstore.write(records, self.filename, self.header,
+                       null_values=('NULL',))
+        with colstore.ColumnStore(self.filename, self.header) as store:
+            self.assertEqual(
+                [[1, None, '', 'dx', '250', '', None],
+                 [1, '1', '2', None, '', None, '{}']],
+                list(store))
+
+    def test_plain_names(self):
+        for plain_names in ((), ('lo', 'hi', 'cat', 'typ', 'val', 'jsn')):
+            with self.subTest(plain_names):
+                colstore.write(self.text_records, self.filename,
+                               self.header, plain_names=plain_names)
+                with colstore.ColumnStore(
+                        self.filename, self.header) as store:
+                    self.assertEqual(self.expected(self.text_records),
+                                     list(store))
+                    self.assertEqual(self.expected(self.text_records[3:4]),
+                                     store.records(1))
+
+    def test_groups_include_ids(self):
+        colstore.write(self.text_records, self.filename, self.header)
+        with colstore.ColumnStore(self.filename, self.header) as store:
+            groups = list(store.groups({2, 3}))
+        self.assertEqual([3, 2], [id for (id, _) in groups])
+        self.assertEqual(self.expected(self.text_records[4:]), groups[1][1])
+
+    def test_read_sequences(self):
+        colstore.write(self.text_records, self.filename, self.header)
+        with colstore.ColumnStore(self.filename, self.header) as store:
+            seqs = list(events.read_sequences(store, include_ids={1, 3}))
+        self.assertEqual([3, 1], [seq.id for seq in seqs])
+        self.assertEqual('F', seqs[0].fact(('bx', 'gndr')))
+        self.assertEqual(2, seqs[0].n_events())
+
+    def test_empty(self):
+        colstore.write([], self.filename, self.header)
+        with colstore.ColumnStore(self.filename, self.header) as store:
+            self.assertEqual(0, len(store))
+            self.assertEqual([], list(store))
+
+    def test_not_grouped(self):
+        with self.assertRaises(ValueError):
+            colstore.write(self.text_records + self.text_records[:1],
+                           self.filename, self.header)
+
+    def test_convert_csv(self):
+        csv_file = io.StringIO(
+            'id|lo|hi|cat|typ|val|jsn\n' +
+            ''.join('|'.join(rec) + '\n' for rec in self.text_records))
+        colstore.convert_csv(csv_file, self.filename, header=self.header)
+        with colstore.ColumnStore(self.filename, self.header) as store:
+            self.assertEqual(self.expected(self.text_records), list(store))
+
+    def test_not_column_store(self):
+        self.filename.write_text('id|lo|hi\n')
+        self.assertFalse(colstore.is_column_store(self.filename))
+        self.assertFalse(colstore.is_column_store(io.StringIO()))
+        self.assertFalse(colstore.is_column_store(self.tmp_dir.name))
+        with self.assertRaises(ValueError):
+            colstore.ColumnStore(self.filename)
+
+    @unittest.skipUnless(hasattr(os, 'mkfifo'), 'needs named pipes')
+    def test_pipe_not_read(self):
+        # Checking a pipe must not consume its data (nor block)
+        fifo = pathlib.Path(self.tmp_dir.name) / 'evs.fifo'
+        os.mkfifo(fifo)
+        self.assertFalse(colstore.is_column_store(fifo))
@@ -0,0 +1,174 @@
+"""Tests `core.py`"""
+
+# Copyright (c) 2026 Aubrey Barnard.
+#
+# This is free, open software licensed under the [MIT License](
+# https://choosealicense.com/licenses/mit/).
+
+
+import bz2
+import datetime
+import gzip
+import importlib.util
+import io
+import lzma
+import os
+import pathlib
+import tempfile
+import threading
+import unittest
+import unittest.mock
+
+from .. import core
+
+
+class OpenTest(unittest.TestCase):
+
+    text = ''.join('{}|2019-04-{:02}|dx|{}\n'.format(i, i % 28 + 1, i % 7)
+                   for i in range(20000))
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dir = pathlib.Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def read(self, filename, **kwds):
+        with core.open(filename, 'rt', **kwds) as file:
+            return file.read()
+
+    def test_plain(self):
+        path = self.dir / 'evs.csv'
+        path.write_text(self.text)
+        self.assertEqual(self.text, self.read(path))
+        self.assertEqual(self.text, self.read(str(path)))
+
+    def test_by_suffix(self):
+        for name, compress in (
+                ('gzip', gzip.compress),
+                ('bz2', bz2.compress),
+                ('xz', lzma.compress),
+        ):
+            with self.subTest(name):
+                path = self.dir / ('evs.csv' + core.compressions[name][0])
+                path.write_bytes(compress(self.text.encode()))
+                self.assertEqual(name, core.infer_compression(path))
+                self.assertEqual(self.text, self.read(path))
+                self.assertEqual(
+                    self.text, self.read(path, read_ahead=False))
+
+    def test_by_magic(self):
+        for name, compress in (
+                ('gzip', gzip.compress),
+                ('bz2', bz2.compress),
+                ('xz', lzma.compress),
+        ):
+            with self.subTest(name):
+                path = self.dir / 'evs.{}.csv'.format(name)
+                path.write_bytes(compress(self.text.encode()))
+                self.assertEqual(self.text, self.read(path))
+                self.assertEqual(
+                    self.text, self.read(path, read_ahead=False))
+
+    @unittest.skipUnless(hasattr(os, 'mkfifo'), 'needs named pipes')
+    def test_pipe(self):
+        # The bytes read to detect compression must not be lost
+        path = self.dir / 'evs.fifo'
+        for name, data, kwds in (
+                ('plain', self.text.encode(), {}),
+                ('gzip', gzip.compress(self.text.encode()), {}),
+                ('gzip no read-ahead', gzip.compress(self.text.encode()),
+                 dict(read_ahead=False)),
+        ):
+            with self.subTest(name):
+                os.mkfifo(path)
+                writer = threading.Thread(target=path.write_bytes,
+                                          args=(data,))
+                writer.start()
+                try:
+                    self.assertEqual(self.text, self.read(path, **kwds))
+                finally:
+                    writer.join()
+                    path.unlink()
+
+    def test_stdin(self):
+        # Compressed data piped to standard input is decompressed
+        for name, data, kwds in (
+                ('plain', self.text.encode(), {}),
+                ('gzip', gzip.compress(self.text.encode()), {}),
+                ('xz no read-ahead', lzma.compress(self.text.encode()),
+                 dict(read_ahead=False)),
+        ):
+            with self.subTest(name):
+                stdin = io.TextIOWrapper(
+                    io.BufferedReader(io.BytesIO(data)))
+                with unittest.mock.patch('sys.stdin', stdin):
+                    self.assertEqual(self.text, self.read('-', **kwds))
+
+    def test_multi_member_gzip(self):
+        path = self.dir / 'evs.csv.gz'
+        half = len(self.text) // 2
+        path.write_bytes(gzip.compress(self.text[:half].encode()) +
+                         gzip.compress(self.text[half:].encode()))
+        self.assertEqual(self.text, self.read(path))
+
+    def test_no_compression(self):
+        path = self.dir / 'evs.csv.gz'
+        data = gzip.compress(self.text.encode())
+        path.write_bytes(data)
+        with core.open(path, 'rb', compression=None) as file:
+            self.assertEqual(data, file.read())
+
+    def test_write(self):
+        path = self.dir / 'evs.csv.gz'
+        with core.open(path, 'wt') as file:
+            file.write(self.text)
+        self.assertEqual(self.text, gzip.decompress(
+            path.read_bytes()).decode())
+
+    def test_close_early(self):
+        path = self.dir / 'evs.csv.xz'
+        path.write_bytes(lzma.compress(self.text.encode()))
+        with core.open(path, 'rt', chunk_size=64, n_chunks=2) as file:
+            line = file.readline()
+        self.assertEqual(self.text[:self.text.index('\n') + 1], line)
+        self.assertTrue(file.closed)
+
+    def test_corrupt(self):
+        path = self.dir / 'evs.csv.gz'
+        path.write_bytes(gzip.compress(self.text.encode())[:-100])
+        with self.assertRaises(EOFError):
+            self.read(path)
+
+    @unittest.skipUnless(importlib.util.find_spec('lz4'), 'needs `lz4`')
+    def test_lz4(self):
+        import lz4.frame
+        path = self.dir / 'evs.csv.lz4'
+        path.write_bytes(lz4.frame.compress(self.text.encode()))
+        self.assertEqual(self.text, self.read(path))
+
+
+class IsoDayTest(unittest.TestCase):
+
+    def test_parse_format(self):
+        for text in ('0001-01-01', '1949-04-09', '2000-02-29',
+                     '2019-12-31', '9999-12-31'):
+            with self.subTest(text):
+                day = core.parse_iso_day(text)
+                self.assertEqual(
+                    datetime.date.fromisoformat(text).toordinal(), day)
+                self.assertEqual(text, core.format_iso_day(day))
+
+    def test_arithmetic(self):
+        lo = core.parse_iso_day('2019-02-27')
+        hi = core.parse_iso_day('2019-03-01')
+        self.assertEqual(2, hi - lo)
+        self.assertEqual('2019-03-29', core.format_iso_day(hi + 28))
+
+    def test_bad_dates(self):
+        for text in ('', '2019-4-9', '2019/04/09', '2019-02-29',
+                     '2019-04-09T00:00:00'):
+            with self.subTest(text):
+                with self.assertRaises(ValueError):
+                    core.parse_iso_day(text)
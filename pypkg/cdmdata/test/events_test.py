@@ -1,16 +1,132 @@
 """Tests `events.py`"""
 
-# Copyright (c) 2019 Aubrey Barnard.
+# Copyright (c) 2019, 2026 Aubrey Barnard.
 #
 # This is free, open software licensed under the [MIT License](
 # https://choosealicense.com/licenses/mit/).
 
 
+import io
+import itertools as itools
 import unittest
 
 import esal
 
+from .. import core
 from .. import events
+from .. import examples
+from .. import records
+
+
+class CompactSequenceTest(unittest.TestCase):
+
+    ev_recs = [
+        [5, None, None, 'bx', 'gndr', 'F', None],
+        [5, 7, 9, 'dx', '250', None, '{"src": "condition"}'],
+        [5, 1, 1, 'rx', '42', '10 mg', None],
+        [5, 3, 8, 'dx', '250', None, None],
+        [5, None, None, 'bx', 'dob', '1949-04-09', None],
+        [5, 9, 12, 'px', '1', None, '[1, 2]'],
+        [5, 3, 3, 'rx', '42', '20 mg', None],
+    ]
+
+    def setUp(self):
+        self.seq = events.compact_sequence(self.ev_recs)
+
+    def test_facts(self):
+        self.assertEqual(5, self.seq.id)
+        self.assertEqual({('bx', 'gndr'), ('bx', 'dob')},
+                         set(self.seq.fact_keys()))
+        self.assertEqual('F', self.seq.fact(('bx', 'gndr')))
+        self.assertIsNone(self.seq.fact(('bx', 'race')))
+
+    def test_types(self):
+        self.assertEqual({('dx', '250'), ('rx', '42'), ('px', '1')},
+                         set(self.seq.types()))
+        self.assertTrue(self.seq.has_type(('px', '1')))
+        self.assertFalse(self.seq.has_type(('px', '2')))
+        self.assertEqual(5, self.seq.n_events())
+        self.assertEqual(2, self.seq.n_events_of_type(('rx', '42')))
+        self.assertEqual(0, self.seq.n_events_of_type(('px', '2')))
+        self.assertEqual(
+            {('dx', '250'): 2, ('rx', '42'): 2, ('px', '1'): 1},
+            events.type_counts(self.seq))
+
+    def test_events(self):
+        evs = self.seq.events(('rx', '42'))
+        self.assertEqual([esal.Interval(1, 1), esal.Interval(3, 3)],
+                         [ev.when for ev in evs])
+        self.assertEqual(['10 mg', '20 mg'], [events.value(ev) for ev in evs])
+        self.assertEqual([1, 3, 3, 7, 9],
+                         [ev.when.lo for ev in self.seq.events()])
+        (ev,) = self.seq.events(('px', '1'))
+        self.assertEqual([1, 2], events.json(ev))
+
+    def test_overlapping(self):
+        for (lo, hi, lo_open, hi_open, expected) in (
+                (3, 7, False, False, [1, 2, 3]),
+                (3, 7, True, True, [2]),
+                (9, 9, False, False, [3, 4]),
+                (13, 20, False, False, []),
+        ):
+            with self.subTest((lo, hi, lo_open, hi_open)):
+                idxs = self.seq.events_overlapping(lo, hi, lo_open, hi_open)
+                self.assertEqual(expected, idxs)
+
+    def test_subsequence(self):
+        subseq = self.seq.subsequence(self.seq.events_overlapping(3, 7))
+        self.assertEqual(5, subseq.id)
+        self.assertEqual('F', subseq.fact(('bx', 'gndr')))
+        self.assertEqual(3, subseq.n_events())
+        self.assertEqual({('dx', '250'): 2, ('rx', '42'): 1},
+                         subseq.type_counts())
+
+    def test_same_as_sequence(self):
+        seq = events.sequence(self.ev_recs)
+        self.assertEqual(set(seq.fact_keys()), set(self.seq.fact_keys()))
+        self.assertEqual(set(seq.types()), set(self.seq.types()))
+        for typ in seq.types():
+            with self.subTest(typ):
+                self.assertEqual(
+                    sorted((ev.when.lo, ev.when.hi, ev.value)
+                           for ev in seq.events(typ)),
+                    sorted((ev.when.lo, ev.when.hi, ev.value)
+                           for ev in self.seq.events(typ)))
+
+    def test_type_counts_plain_sequence(self):
+        seq = events.sequence(self.ev_recs)
+        counts = events.type_counts(seq, [('rx', '42'), ('px', '2')])
+        for typ in list(seq.types()) + [('px', '2')]:
+            with self.subTest(typ):
+                self.assertEqual(seq.n_events_of_type(typ),
+                                 counts.get(typ, 0))
+
+
+class ReadSequencesTest(unittest.TestCase):
+
+    text_records = [
+        ['1', '', '', 'bx', 'gndr', 'F', ''],
+        ['1', '3', '4', 'dx', '250', '', ''],
+        ['1', '5', '5', 'rx', '42', 'a', ''],
+        ['2', '5', '6', 'mx', 'bad-time', 'x', ''],
+        ['3', 'bad', 'time', 'ox', '1', '', ''],
+        ['3', '7', '8', 'dx', '250', '', ''],
+    ]
+
+    def test_type_filter(self):
+        include = events.mk_type_filter({('dx', '250'), ('bx', 'gndr')})
+        seqs = list(events.read_sequences(
+            self.text_records, parse_id=int,
+            parse_record=records.mk_parser(events.header(int)),
+            include_raw_record=include,
+            sequence_constructor=events.compact_sequence))
+        # Records of other types are never parsed, and IDs whose records
+        # are all discarded still have sequences
+        self.assertEqual([1, 2, 3], [seq.id for seq in seqs])
+        self.assertEqual([1, 0, 1], [seq.n_events() for seq in seqs])
+        self.assertEqual('F', seqs[0].fact(('bx', 'gndr')))
+        self.assertEqual([{('dx', '250')}, set(), {('dx', '250')}],
+                         [set(seq.types()) for seq in seqs])
 
 
 class PeriodsTest(unittest.TestCase):
@@ -192,6 +308,18 @@ class PeriodsTest(unittest.TestCase):
         actual = list(events.periods(evs, 1, 9, min_len=5, backoff=1))
         self.assertEqual(expected, actual)
 
+    def test_unbounded(self):
+        # Alternating pairs of overlapping events: 1, 1, 2, 2, 1, 1, ...
+        evs = (esal.Event(esal.Interval(idx, idx + 2), 'a', idx // 2 % 2 + 1)
+               for idx in itools.count())
+        expected = [
+            (esal.Interval(0, 2), 1),
+            (esal.Interval(2, 4), 2),
+            (esal.Interval(4, 6), 1),
+        ]
+        actual = list(itools.islice(events.periods(evs, 0), 3))
+        self.assertEqual(expected, actual)
+
     def test_backoff_too_much(self):
         evs = [
             esal.Event(esal.Interval(1, 1), 'a', 1),
@@ -234,3 +362,167 @@ class PeriodsTest(unittest.TestCase):
         ]
         actual = list(events.periods(evs, 0, 4, backoff=1))
         self.assertEqual(expected, actual)
+
+    def test_iso_days(self):
+        day = core.parse_iso_day
+        evs = [
+            esal.Event(esal.Interval(day('2019-01-30'), day('2019-01-30')),
+                       'a', 1),
+            esal.Event(esal.Interval(day('2019-02-20'), day('2019-02-21')),
+                       'a', 2),
+        ]
+        expected = [
+            ('2019-01-01', '2019-01-28', 0),
+            ('2019-01-30', '2019-02-18', 1),
+            ('2019-02-20', '2019-03-22', 2),
+            ('2019-03-24', '2019-03-31', 0),
+        ]
+        actual = [
+            (core.format_iso_day(itvl.lo), core.format_iso_day(itvl.hi), val)
+            for (itvl, val) in events.periods(
+                evs, day('2019-01-01'), day('2019-03-31'),
+                min_len=30, backoff=2)]
+        self.assertEqual(expected, actual)
+
+
+class ErasTest(unittest.TestCase):
+
+    event_records = [
+        [1, None, None, 'bx', 'gndr', 'F', None],
+        [1, 1, 3, 'rx', 'a', '10', None],
+        [1, 2, 5, 'rx', 'b', '5', None],
+        [1, 3, 4, 'rx', 'a', '10', None],
+        [1, 6, 8, 'rx', 'a', '20', None],
+        [1, 9, 9, 'dx', '250', None, None],
+        [2, 0, 2, 'rx', 'a', '10', None],
+        [2, 20, 30, 'rx', 'a', '10', None],
+        [3, 4, 4, 'rx', 'b', '5', None],
+    ]
+
+    def periods(self, id, ev_type, **kwds):
+        span_lo, span_hi = kwds.pop('span', (0, 40))
+        evs = [esal.Event(esal.Interval(rec[1], rec[2]), ev_type, rec[5])
+               for rec in self.event_records
+               if rec[0] == id and tuple(rec[3:5]) == ev_type]
+        return [(id, ev_type, itvl.lo, itvl.hi, val)
+                for (itvl, val) in events.periods(
+                    evs, span_lo, span_hi, **kwds)
+                if val != 0]
+
+    def test_same_as_periods(self):
+        for kwds in ({}, dict(min_len=3), dict(min_len=3, backoff=1)):
+            with self.subTest(**kwds):
+                expected = [
+                    era for (id, ev_type) in (
+                        (1, ('rx', 'a')), (1, ('rx', 'b')),
+                        (2, ('rx', 'a')), (3, ('rx', 'b')))
+                    for era in self.periods(id, ev_type, **kwds)]
+                actual = [era[:5] for era in events.eras(
+                    self.event_records, types={('rx', 'a'), ('rx', 'b')},
+                    **kwds)]
+                self.assertEqual(expected, actual)
+
+    def test_equal_starts(self):
+        # Events that start together are in order of end, whatever
+        # their order in the table.  Different values do not merge, so
+        # the order determines the eras.
+        ev_recs = [
+            [1, 2, 6, 'rx', 'a', '20', None],
+            [1, 2, 3, 'rx', 'a', '10', None],
+            [1, 2, 4, 'rx', 'a', '30', None],
+            [1, 5, 5, 'rx', 'a', '10', None],
+        ]
+        evs = [esal.Event(esal.Interval(rec[1], rec[2]), ('rx', 'a'),
+                          rec[5])
+               for rec in ev_recs]
+        evs.sort(key=lambda ev: (ev.when.lo, ev.when.hi))
+        for kwds in ({}, dict(backoff=1)):
+            with self.subTest(**kwds):
+                expected = [(1, ('rx', 'a'), itvl.lo, itvl.hi, val)
+                            for (itvl, val) in events.periods(
+                                    evs, 0, 10, **kwds)
+                            if val != 0]
+                self.assertEqual(
+                    expected, [era[:5] for era in events.eras(
+                        ev_recs, **kwds)])
+        self.assertEqual(
+            [(1, ('rx', 'a'), 2, 2, '10', 1),
+             (1, ('rx', 'a'), 2, 2, '30', 1),
+             (1, ('rx', 'a'), 2, 5, '20', 1),
+             (1, ('rx', 'a'), 5, 5, '10', 1)],
+            list(events.eras(ev_recs)))
+
+    def test_missing_times(self):
+        # Only records without both times are facts
+        ev_recs = [
+            [1, None, None, 'rx', 'a', '10', None],
+            [1, None, 3, 'rx', 'a', '10', None],
+            [1, 5, None, 'rx', 'a', '10', None],
+        ]
+        self.assertEqual(
+            [(1, ('rx', 'a'), 3, 3, '10', 1),
+             (1, ('rx', 'a'), 5, 5, '10', 1)],
+            list(events.eras(ev_recs)))
+
+    def test_eras(self):
+        self.assertEqual(
+            [(1, ('rx', 'a'), 1, 5, '10', 2),
+             (1, ('rx', 'a'), 6, 8, '20', 1),
+             (1, ('rx', 'b'), 2, 5, '5', 1),
+             (1, ('dx', '250'), 9, 11, None, 1),
+             (2, ('rx', 'a'), 0, 2, '10', 1),
+             (2, ('rx', 'a'), 20, 30, '10', 1),
+             (3, ('rx', 'b'), 4, 6, '5', 1)],
+            list(events.eras(self.event_records, zero_values=(),
+                             min_len=2)))
+
+    def test_spans(self):
+        spans = {1: (2, 7), 2: (1, 25)}
+        actual = list(events.eras(
+            self.event_records, types={('rx', 'a')}, spans=spans))
+        self.assertEqual(
+            [(1, ('rx', 'a'), 2, 4, '10', 2),
+             (1, ('rx', 'a'), 6, 7, '20', 1),
+             (2, ('rx', 'a'), 1, 2, '10', 1),
+             (2, ('rx', 'a'), 20, 25, '10', 1)],
+            actual)
+
+    def test_example_records(self):
+        file = io.StringIO()
+        n_recs = records.write_csv(
+            examples.era_records(events.eras(
+                self.event_records, types={('rx', 'a')})),
+            file, examples.csv_format, examples.header())
+        self.assertEqual(4, n_recs)
+        self.assertEqual(
+            'id|lo|hi|lbl|trt|cls|wgt|n_evs|jsn\n'
+            '1|1|4|rx-a|10||3.0|2|\n'
+            '1|6|8|rx-a|20||2.0|1|\n'
+            '2|0|2|rx-a|10||2.0|1|\n'
+            '2|20|30|rx-a|10||10.0|1|\n',
+            file.getvalue())
+
+    def test_example_records_iso_days(self):
+        day = core.parse_iso_day
+        ev_recs = [[1, day('2019-04-0{}'.format(rec[1] + 1)),
+                    day('2019-04-0{}'.format(rec[2] + 1)), *rec[3:]]
+                   for rec in self.event_records[1:5]]
+        file = io.StringIO()
+        records.write_csv(
+            examples.era_records(
+                events.eras(ev_recs, types={('rx', 'a')}),
+                format_time=core.format_iso_day),
+            file, examples.csv_format, examples.header())
+        self.assertEqual(
+            'id|lo|hi|lbl|trt|cls|wgt|n_evs|jsn\n'
+            '1|2019-04-02|2019-04-05|rx-a|10||3.0|2|\n'
+            '1|2019-04-07|2019-04-09|rx-a|20||2.0|1|\n',
+            file.getvalue())
+        # The CSV reads back into the same eras
+        file.seek(0)
+        exs = list(records.read_csv(
+            file, examples.csv_format, examples.header(day)))
+        self.assertEqual(
+            [(1, day('2019-04-02'), day('2019-04-05'), 'rx-a', 3.0),
+             (1, day('2019-04-07'), day('2019-04-09'), 'rx-a', 2.0)],
+            [(ex[0], ex[1], ex[2], ex[3], ex[6]) for ex in exs])
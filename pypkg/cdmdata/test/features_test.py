@@ -1,15 +1,25 @@
 """Tests `features.py`"""
 
-# Copyright (c) 2019, 2021, 2023 Aubrey Barnard.
+# Copyright (c) 2019, 2021, 2023, 2026 Aubrey Barnard.
 #
 # This is free, open software licensed under the [MIT License](
 # https://choosealicense.com/licenses/mit/).
 
 
+import gc
+import gzip
+import importlib.util
+import io
+import os
+import pathlib
+import random
+import tempfile
 import unittest
+import warnings
 
 import esal
 
+from .. import cache
 from .. import features
 
 
@@ -214,3 +224,569 @@ class FunctionTest(unittest.TestCase):
                     feat_rec, namespaces=[locals()])
                 self.assertEqual(exp, feat_func(None, self.ev_seq))
                 self.assertEqual(0.0, feat_func(None, self.ev_seq_empty))
+
+
+class LambdaTest(unittest.TestCase):
+
+    setUp = FunctionTest.setUp
+
+    def test_mk_function(self):
+        feat_rec = [1, 'n-dx', 'dx', '*', None, 'int',
+                    'lambda ex, es: sum(1 for ev in es '
+                    "if ev.type[0] == 'dx')", None]
+        feat_func = features.mk_function(feat_rec)
+        self.assertEqual(6, feat_func(None, self.ev_seq))
+        self.assertEqual(0, feat_func(None, self.ev_seq_empty))
+
+    def test_shared(self):
+        text = 'lambda ex, es: len(es) * ex[0]'
+        func = features.compile_lambda(text)
+        self.assertIs(func, features.compile_lambda(text))
+        self.assertEqual(56, func([2], self.ev_seq))
+        feat_recs = [[id, 'x', 'dx', str(id), None, 'int', text, None]
+                     for id in range(3)]
+        funcs = features.mk_functions(feat_recs)
+        self.assertEqual([func] * 3, funcs)
+
+    def test_invalid(self):
+        for text in (
+                'lambda ex: 1',
+                'lambda ex, es, x=1: 1',
+                'lambda ex, es: (',
+                'lambda ex, es: open("x")',
+                'lambda ex, es: es.__class__',
+                'lambda ex, es: __import__("os")',
+                'lambda ex, es: [y for x in es]',
+                # Comprehension variables are only bound inside
+                'lambda ex, es: [x for x in es] and x',
+                'lambda ex, es: ([x for x in es], x)',
+                'lambda ex, es: sum(x for x in es) + x',
+                'lambda ex, es: [x for x in x]',
+                'lambda ex, es: [y for x in es for y in y]',
+                'lambda ex, es: (lambda x: x)(1) + x',
+                'lambda ex, es: [y for y in es if (z := y)] and z._a',
+        ):
+            with self.subTest(text):
+                with self.assertRaises(ValueError):
+                    features.compile_lambda(text)
+
+    def test_restricted_names(self):
+        func = features.compile_lambda(
+            'lambda ex, es: [x for x in range(ex)]')
+        self.assertEqual([0, 1], func(2, None))
+        for (text, expected) in (
+                ('lambda ex, es: {x: y for x in range(ex) '
+                 'for y in range(x)}', {1: 0}),
+                ('lambda ex, es: [[x for x in range(y)] '
+                 'for y in range(ex)]', [[], [0]]),
+                ('lambda ex, es: (lambda x: x + ex)(1)', 3),
+                ('lambda ex, es: [y for x in range(ex) '
+                 'if (y := x * 2)] + [y]', [2, 2]),
+        ):
+            with self.subTest(text):
+                self.assertEqual(
+                    expected, features.compile_lambda(text)(2, None))
+        self.assertNotIn('open', features.lambda_names)
+
+
+class FeaturePlanTest(unittest.TestCase):
+
+    setUp = FunctionTest.setUp
+
+    feature_records = [
+        [1, '_attr-id', '_attr', 'id', None, 'int',
+         'event_sequence_id', None],
+        [2, 'bx-gndr-M', 'bx', 'gndr', 'M', 'int', 'fact_matches', None],
+        [3, 'bx-dob', 'bx', 'dob', None, 'int', 'year_of_fact',
+         '%Y-%m-%d'],
+        [4, 'dx-2', 'dx', '2', None, 'int', 'count_events', None],
+        [5, 'dx-2-has', 'dx', '2', None, 'int', 'has_event', None],
+        [6, 'dx-2-pr', 'dx', '2', None, 'float', 'proportion_events', None],
+        [7, 'px-2', 'px', '2', None, 'float', 'count_events', None],
+        [8, 'rx-3', 'rx', '3', None, 'int', 'count_events', None],
+        [9, 'mx-8', 'mx', '8', 'lo,ok', 'int',
+         'count_events_matching', dict(get_value='ev_val_0')],
+        [10, 'mx-8-any', 'mx', '8', None, 'int', 'count_events', None],
+        [11, 'vx-1', 'vx', '1', None, 'bool', 'count_events', None],
+    ]
+
+    def mk_functions(self):
+        def ev_val_0(ev):
+            return ev.value[0]
+        funcs = features.mk_functions(
+            self.feature_records, namespaces=[locals()])
+        return features.map_to_functions(self.feature_records, funcs)
+
+    def test_same_as_unplanned(self):
+        key2idsfuncs = self.mk_functions()
+        plan = features.FeaturePlan(key2idsfuncs)
+        self.assertEqual(dict(key2idsfuncs), dict(plan))
+        always = {('_attr', 'id')}
+        for ev_seq in (self.ev_seq, self.ev_seq_empty):
+            with self.subTest(ev_seq.id):
+                expected = features.vector(
+                    key2idsfuncs, None, ev_seq, always)
+                actual = features.vector(plan, None, ev_seq, always)
+                self.assertEqual(expected, actual)
+        self.assertEqual(
+            {1: 808186755, 2: 1, 3: 1949, 4: 2, 5: 1, 6: 2 / 28, 7: 2.0,
+             9: 1, 10: 2, 11: True},
+            features.vector(plan, None, self.ev_seq, always))
+
+    def test_event_types(self):
+        key2idsfuncs = self.mk_functions()
+        self.assertIsNone(features.event_types(key2idsfuncs))
+        feat_recs = [rec for rec in self.feature_records
+                     if 'proportion' not in rec[6]]
+        key2idsfuncs = features.map_to_functions(
+            feat_recs, features.mk_functions(feat_recs))
+        self.assertEqual(
+            {('_attr', 'id'), ('bx', 'gndr'), ('bx', 'dob'), ('dx', '2'),
+             ('px', '2'), ('rx', '3'), ('mx', '8'), ('vx', '1')},
+            features.event_types(key2idsfuncs))
+
+    def test_batch_family(self):
+        plan = features.FeaturePlan(self.mk_functions())
+        families = {tuple(sorted(key2feats))
+                    for (_, _, key2feats) in plan._families}
+        self.assertEqual(
+            {(('dx', '2'), ('mx', '8'), ('px', '2'), ('rx', '3'),
+              ('vx', '1'))},
+            families)
+        # Counts, indicators, and proportions are all in the family
+        (_, _, key2feats), = plan._families
+        self.assertEqual(
+            [4, 5, 6], [feat_id for (feat_id, _) in key2feats['dx', '2']])
+
+    def test_shared_functions(self):
+        feat_recs = self.feature_records + [
+            [12, 'dx-2-again', 'dx', '2', None, 'int', 'count_events',
+             None],
+            [13, 'mx-8-again', 'mx', '8', 'lo,ok', 'int',
+             'count_events_matching', dict(get_value='ev_val_0')],
+            [14, 'mx-8-hi', 'mx', '8', 'hi', 'int',
+             'count_events_matching', dict(get_value='ev_val_0')],
+        ]
+        def ev_val_0(ev):
+            return ev.value[0]
+        funcs = features.mk_functions(feat_recs, namespaces=[locals()])
+        self.assertIs(funcs[3], funcs[11])
+        self.assertIs(funcs[8], funcs[12])
+        self.assertIsNot(funcs[8], funcs[13])
+        self.assertIsNot(funcs[3], funcs[6])
+        self.assertEqual(len(feat_recs) - 2, len(set(funcs)))
+
+    def test_load_logs_time(self):
+        file = io.StringIO(
+            'id|name|tbl|typ|val|data_type|feat_func|args\n'
+            '1|dx-2|dx|2||int|count_events|\n'
+            '2|dx-2-again|dx|2||int|count_events|\n')
+        with self.assertLogs(features.__name__, 'INFO') as logs:
+            recs, funcs, _ = features.load(file)
+        self.assertEqual(2, len(recs))
+        self.assertIs(funcs[0], funcs[1])
+        self.assertRegex(
+            logs.output[0], r'Loaded 2 features \(1 distinct functions\)')
+
+
+class CompiledFeaturesTest(unittest.TestCase):
+
+    lines = [
+        'id|name|tbl|typ|val|data_type|feat_func|args\n',
+        '1|_attr-id|_attr|id||int|event_sequence_id|\n',
+        '2|bx-gndr-M|bx|gndr|M;m|int|fact_matches|{"delimiter": ";"}\n',
+        '3|dx-2|dx|2||int|count_events|\n',
+    ]
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filename = pathlib.Path(self.tmp_dir.name) / 'feats.csv'
+        self.filename.write_text(''.join(self.lines))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_compile_load(self):
+        expected, _, _ = features.load(self.filename)
+        compiled = features.compile_features(self.filename)
+        self.assertEqual(
+            features.compiled_features_filename(self.filename), compiled)
+        self.filename.write_text('id|name\n')
+        # Stale, so recompiled
+        recs, _, _ = features.load(self.filename, compiled=True)
+        self.assertEqual([], recs)
+        self.filename.write_text(''.join(self.lines))
+        recs, funcs, plan = features.load(self.filename, compiled=compiled)
+        self.assertEqual(expected, recs)
+        self.assertEqual({('_attr', 'id'), ('bx', 'gndr'), ('dx', '2')},
+                         set(plan))
+        # Loaded from the compiled table without parsing the CSV
+        with self.assertLogs(features.__name__, 'INFO') as logs:
+            recs, _, _ = features.load(self.filename, compiled=compiled)
+        self.assertEqual(expected, recs)
+        self.assertFalse(any('Compiling' in line for line in logs.output))
+
+    def test_modules_must_match(self):
+        features.compile_features(self.filename)
+        with self.assertLogs(features.__name__, 'INFO') as logs:
+            features.load(self.filename, modules=[features], compiled=True)
+            features.load(self.filename, modules=[features], compiled=True)
+        self.assertEqual(
+            1, sum(1 for line in logs.output if 'Compiling' in line))
+
+    def test_plan_reused(self):
+        recs, funcs, plan = features.load(self.filename, compiled=True)
+        recs2, funcs2, plan2 = features.load(self.filename, compiled=True)
+        self.assertIs(plan, plan2)
+        self.assertEqual(recs, recs2)
+        self.assertIs(funcs[0], funcs2[0])
+        # Not with namespaces
+        _, _, plan3 = features.load(
+            self.filename, namespaces=[{}], compiled=True)
+        self.assertIsNot(plan, plan3)
+        # Not once the CSV changes, which is detected by its size and
+        # modification time
+        stat = self.filename.stat()
+        os.utime(self.filename, ns=(stat.st_atime_ns,
+                                    stat.st_mtime_ns + 10 ** 9))
+        with self.assertLogs(features.__name__, 'INFO') as logs:
+            _, _, plan4 = features.load(self.filename, compiled=True)
+        self.assertIsNot(plan, plan4)
+        self.assertTrue(any('Compiling' in line for line in logs.output))
+
+
+class SweepTest(unittest.TestCase):
+
+    def test_same_as_subsequences(self):
+        rng = random.Random(0x5eed)
+        evs = []
+        for _ in range(200):
+            lo = rng.randrange(100)
+            evs.append(esal.Event(
+                esal.Interval(lo, lo + rng.choice((0, 0, 1, 5))),
+                ('dx', str(rng.randrange(10))), None))
+        ev_seq = esal.EventSequence(evs, [(('bx', 'gndr'), 'F')], 3)
+        exs = []
+        for _ in range(100):
+            lo = rng.randrange(-5, 105)
+            exs.append([3, lo, lo + rng.choice((0, 1, 7, 30))])
+        feat_recs = [
+            [1, '_attr-n', '_attr', 'n', None, 'int', 'n_events', None],
+            [2, 'bx-gndr-F', 'bx', 'gndr', 'F', 'int', 'fact_matches',
+             None],
+        ] + [
+            [id, 'dx-{}-{}'.format(typ, func), 'dx', str(typ), None,
+             'float', func, None]
+            for (id, (typ, func)) in enumerate((
+                (typ, func) for typ in range(11)
+                for func in ('count_events', 'has_event',
+                             'proportion_events')), 3)]
+        plan = features.FeaturePlan(features.map_to_functions(
+            feat_recs, features.mk_functions(feat_recs)))
+        always = {('_attr', 'n')}
+        seen = set()
+        for (ex_idx, window) in features._sweep_windows(
+                ev_seq, exs, 1, 2):
+            seen.add(ex_idx)
+            ex = exs[ex_idx]
+            itvl = esal.Interval(ex[1], ex[2])
+            subseq = ev_seq.subsequence(ev_seq.events_overlapping(
+                itvl.lo, itvl.hi, itvl.is_lo_open, itvl.is_hi_open))
+            with self.subTest(ex):
+                self.assertEqual(subseq.n_events(), window.n_events())
+                self.assertEqual(set(subseq.types()), set(window.types()))
+                self.assertEqual(
+                    features.vector(plan, ex, subseq, always),
+                    features.vector(plan, ex, window, always))
+        self.assertEqual(set(range(len(exs))), seen)
+
+
+class FeatureVectorsTest(unittest.TestCase):
+
+    events_lines = ['id|lo|hi|cat|typ|val|jsn\n'] + [
+        '{}|{}|{}|{}|{}||\n'.format(
+            id, lo, lo + id % 3, 'dx' if lo % 2 else 'rx', lo % 5)
+        for id in range(1, 40) for lo in range(id % 7 * 3)]
+
+    examples_lines = ['id|lo|hi|lbl|trt|cls|wgt|n_evs|jsn\n'] + [
+        '{}|{}|{}|x|t|{}|1.0|0|\n'.format(id, lo, lo + 4, '+-'[lo % 2])
+        for id in range(1, 45, 2) for lo in range(0, id % 5 * 3, 3)]
+
+    features_lines = [
+        'id|name|tbl|typ|val|data_type|feat_func|args\n',
+        '1|_attr-id|_attr|id||int|event_sequence_id|\n',
+    ] + [
+        '{}|{}-{}|{}|{}||int|{}|\n'.format(
+            id, cat, typ, cat, typ, func)
+        for (id, (cat, typ, func)) in enumerate((
+            (cat, typ, func)
+            for cat in ('dx', 'rx') for typ in range(5)
+            for func in ('count_events', 'has_event')), 2)]
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        dir = pathlib.Path(self.tmp_dir.name)
+        self.filenames = []
+        for (name, lines) in (
+                ('evs.csv', self.events_lines),
+                ('exs.csv', self.examples_lines),
+                ('feats.csv', self.features_lines),
+        ):
+            filename = dir / name
+            filename.write_text(''.join(lines))
+            self.filenames.append(filename)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_parallel(self):
+        kwds = dict(always_feature_keys={('_attr', 'id')})
+        expected = list(features.mk_feature_vectors(
+            *self.filenames, **kwds))
+        # Examples of IDs with events
+        self.assertEqual(sum(1 for line in self.examples_lines[1:]
+                             if int(line.split('|')[0]) % 7 != 0
+                             and int(line.split('|')[0]) < 40),
+                         len(expected))
+        for shard_size in (1, 100, 10 ** 6):
+            with self.subTest(shard_size):
+                actual = list(features.mk_feature_vectors_parallel(
+                    *self.filenames, n_processes=2,
+                    shard_size=shard_size, max_in_flight=2, **kwds))
+                self.assertEqual(expected, actual)
+
+    def test_events_index(self):
+        kwds = dict(always_feature_keys={('_attr', 'id')})
+        expected = list(features.mk_feature_vectors(
+            *self.filenames, **kwds))
+        actual = list(features.mk_feature_vectors(
+            *self.filenames, events_index=True, **kwds))
+        self.assertEqual(expected, actual)
+        n_vectors = len(actual)
+        # Adding events of an ID with an example makes the index stale
+        with open(self.filenames[0], 'at') as file:
+            file.write('41|0|1|dx|0||\n')
+        expected = list(features.mk_feature_vectors(
+            *self.filenames, **kwds))
+        actual = list(features.mk_feature_vectors(
+            *self.filenames, events_index=True, **kwds))
+        self.assertEqual(expected, actual)
+        self.assertEqual(n_vectors + 1, len(actual))
+
+    def test_parallel_not_sorted(self):
+        # Sorted as text, not numerically
+        lines = self.events_lines[:1] + sorted(
+            self.events_lines[1:], key=lambda line: line.split('|')[0])
+        self.filenames[0].write_text(''.join(lines))
+        with self.assertRaises(ValueError):
+            list(features.mk_feature_vectors_parallel(
+                *self.filenames, n_processes=1, shard_size=1))
+
+    def test_parallel_spanning_records(self):
+        # Quoted JSON with line breaks whose lines look like records
+        kwds = dict(always_feature_keys={('_attr', 'id')})
+        n_vectors = len(list(features.mk_feature_vectors(
+            *self.filenames, **kwds)))
+        lines = self.events_lines[:1] + [
+            line.replace('||\n', '||"{{\n{0}|0|1|dx|1||\n}}"\n'.format(
+                int(line.split('|')[0]) + 3))
+            for line in self.events_lines[1:]]
+        self.filenames[0].write_text(''.join(lines))
+        expected = list(features.mk_feature_vectors(
+            *self.filenames, **kwds))
+        self.assertEqual(n_vectors, len(expected))
+        for shard_size in (1, 100, 10 ** 6):
+            with self.subTest(shard_size):
+                actual = list(features.mk_feature_vectors_parallel(
+                    *self.filenames, n_processes=1,
+                    shard_size=shard_size, **kwds))
+                self.assertEqual(expected, actual)
+
+    def test_parallel_encoding(self):
+        kwds = dict(always_feature_keys={('_attr', 'id')})
+        expected = list(features.mk_feature_vectors(
+            *self.filenames, **kwds))
+        lines = [line.replace('||', '|é|') for line in self.events_lines]
+        self.filenames[0].write_bytes(''.join(lines).encode('latin-1'))
+        actual = list(features.mk_feature_vectors_parallel(
+            *self.filenames, n_processes=1, shard_size=100,
+            events_encoding='latin-1', **kwds))
+        self.assertEqual(expected, actual)
+
+    def test_sweep(self):
+        kwds = dict(always_feature_keys={('_attr', 'id')})
+        expected = list(features.mk_feature_vectors(
+            *self.filenames, **kwds))
+        actual = list(features.mk_feature_vectors(
+            *self.filenames, sweep=True, **kwds))
+        self.assertEqual(expected, actual)
+        matrix = features.mk_feature_matrix(
+            *self.filenames, sweep=True, **kwds)
+        self.assertEqual(
+            list(features.mk_feature_matrix(*self.filenames, **kwds).rows()),
+            list(matrix.rows()))
+
+    def test_compact_sequences(self):
+        kwds = dict(always_feature_keys={('_attr', 'id')})
+        expected = list(features.mk_feature_vectors(
+            *self.filenames, **kwds))
+        for sweep in (False, True):
+            with self.subTest(sweep=sweep):
+                actual = list(features.mk_feature_vectors(
+                    *self.filenames, sweep=sweep, compact_sequences=True,
+                    **kwds))
+                self.assertEqual(expected, actual)
+
+    def test_type_filter(self):
+        kwds = dict(always_feature_keys={('_attr', 'id')})
+        # Transforming records disables filtering by type
+        expected = list(features.mk_feature_vectors(
+            *self.filenames, transform_event_record=lambda rec: rec,
+            **kwds))
+        actual = list(features.mk_feature_vectors(*self.filenames, **kwds))
+        self.assertEqual(expected, actual)
+
+    def test_events_cache(self):
+        kwds = dict(always_feature_keys={('_attr', 'id')})
+        expected = list(features.mk_feature_vectors(
+            *self.filenames, **kwds))
+        cache_dir = pathlib.Path(self.tmp_dir.name) / 'cache'
+        for _ in range(2):
+            actual = list(features.mk_feature_vectors(
+                *self.filenames, events_cache=cache_dir, **kwds))
+            self.assertEqual(expected, actual)
+            self.assertEqual(1, len(cache.Cache(cache_dir).entries()))
+        matrix = features.mk_feature_matrix(
+            *self.filenames, events_cache=cache.Cache(cache_dir), **kwds)
+        self.assertEqual(
+            list(features.mk_feature_matrix(*self.filenames, **kwds).rows()),
+            list(matrix.rows()))
+        # The column store is closed after reading
+        with warnings.catch_warnings(record=True) as warns:
+            warnings.simplefilter('always', ResourceWarning)
+            list(features.mk_feature_vectors(
+                *self.filenames, events_cache=cache_dir, **kwds))
+            gc.collect()
+        self.assertEqual([], [w for w in warns
+                              if issubclass(w.category, ResourceWarning)])
+
+    def test_merge_join(self):
+        kwds = dict(always_feature_keys={('_attr', 'id')})
+        expected = list(features.mk_feature_vectors(
+            *self.filenames, **kwds))
+        for sweep in (False, True):
+            with self.subTest(sweep=sweep):
+                actual = list(features.mk_feature_vectors(
+                    *self.filenames, sweep=sweep, merge_join=True, **kwds))
+                self.assertEqual(expected, actual)
+        matrix = features.mk_feature_matrix(
+            *self.filenames, merge_join=True, **kwds)
+        self.assertEqual(
+            list(features.mk_feature_matrix(*self.filenames, **kwds).rows()),
+            list(matrix.rows()))
+        # Unsorted examples
+        lines = self.examples_lines[:]
+        lines.insert(8, lines.pop(1))
+        self.filenames[1].write_text(''.join(lines))
+        with self.assertRaises(ValueError):
+            list(features.mk_feature_vectors(
+                *self.filenames, merge_join=True, **kwds))
+
+    def test_matrix(self):
+        kwds = dict(always_feature_keys={('_attr', 'id')})
+        vectors = list(features.mk_feature_vectors(*self.filenames, **kwds))
+        matrix = features.mk_feature_matrix(*self.filenames, **kwds)
+        self.assertEqual((len(vectors), len(self.features_lines) - 1),
+                         matrix.shape)
+        self.assertEqual(
+            [(ex[5], tuple(sorted(fv.items()))) for (ex, fv) in vectors],
+            list(matrix.rows()))
+        svmlight = io.StringIO()
+        for (ex, fv) in vectors:
+            features.write_vector(ex[5], fv, svmlight)
+        actual = io.StringIO()
+        matrix.save_svmlight(actual)
+        self.assertEqual(svmlight.getvalue(), actual.getvalue())
+
+    def test_matrix_svmlight_values(self):
+        matrix = features.FeatureMatrix([1, 2, 3, 4, 5])
+        vector = {1: 3, 2: 0.25, 3: 2.0, 4: True, 5: False}
+        matrix.add_vector('+', vector)
+        actual = io.StringIO()
+        matrix.save_svmlight(actual)
+        # Integral floats and booleans differ from `write_vector`
+        self.assertEqual('+ 1:3 2:0.25 3:2 4:1 5:0\n', actual.getvalue())
+        self.assertEqual('+ 1:3 2:0.25 3:2.0 4:True 5:False\n',
+                         features.format_vector('+', vector))
+
+    @unittest.skipUnless(importlib.util.find_spec('numpy'), 'needs `numpy`')
+    def test_matrix_npz(self):
+        import numpy
+        matrix = features.FeatureMatrix([30, 10, 20])
+        matrix.add_vector('+', {20: 2, 10: 1.5})
+        matrix.add_vector('-', {})
+        matrix.add_vector('+', {30: True})
+        indptr, indices, data = matrix.arrays()
+        self.assertEqual([0, 2, 2, 3], indptr.tolist())
+        self.assertEqual([0, 1, 2], indices.tolist())
+        self.assertEqual([1.5, 2.0, 1.0], data.tolist())
+        file = io.BytesIO()
+        matrix.save_npz(file)
+        file.seek(0)
+        npz = numpy.load(file)
+        self.assertEqual([3, 3], npz['shape'].tolist())
+        self.assertEqual(['+', '-', '+'], npz['labels'].tolist())
+        self.assertEqual([10, 20, 30], npz['feature_ids'].tolist())
+        self.assertEqual(indices.tolist(), npz['indices'].tolist())
+
+
+class SvmlightWriterTest(unittest.TestCase):
+
+    vectors = [
+        ('+', {3: 1, 1: 0.25, 20: True, 7: 'x'}),
+        ('-', {}),
+        (1.5, {2: 2.0, 1: -3}),
+    ]
+
+    def expected(self):
+        output = io.StringIO()
+        for (label, fv) in self.vectors:
+            # The original implementation of `write_vector`
+            print(label, sep='', end='', file=output)
+            for feat_id in sorted(fv.keys()):
+                print(' ', feat_id, ':', fv[feat_id],
+                      sep='', end='', file=output)
+            print(file=output)
+        return output.getvalue()
+
+    def test_write_vector(self):
+        output = io.StringIO()
+        for (label, fv) in self.vectors:
+            features.write_vector(label, fv, output)
+        self.assertEqual(self.expected(), output.getvalue())
+
+    def test_writer(self):
+        for batch_size in (1, 2, 100):
+            with self.subTest(batch_size):
+                output = io.StringIO()
+                with features.SvmlightWriter(output, batch_size) as writer:
+                    for (label, fv) in self.vectors:
+                        writer.write(label, fv)
+                self.assertEqual(self.expected(), output.getvalue())
+                self.assertFalse(output.closed)
+
+    def test_writer_qid_zero_based(self):
+        output = io.StringIO()
+        with features.SvmlightWriter(output, zero_based=True) as writer:
+            writer.write('+', {3: 1, 1: 2}, qid=8)
+            writer.write('-', {2: 1})
+        self.assertEqual('+ qid:8 0:2 2:1\n- 1:1\n', output.getvalue())
+
+    def test_writer_gzip(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = pathlib.Path(tmp_dir) / 'fvs.svml.gz'
+            with features.SvmlightWriter(filename) as writer:
+                for (label, fv) in self.vectors:
+                    writer.write(label, fv)
+            self.assertEqual(self.expected(), gzip.decompress(
+                filename.read_bytes()).decode())
@@ -1,13 +1,19 @@
 """Tests `records.py`"""
 
-# Copyright (c) 2019 Aubrey Barnard.
+# Copyright (c) 2019, 2026 Aubrey Barnard.
 #
 # This is free, open software licensed under the [MIT License](
 # https://choosealicense.com/licenses/mit/).
 
 
+import csv
+import datetime
+import gzip
 import io
+import os
+import pathlib
 import re
+import tempfile
 import unittest
 
 from .. import events
@@ -93,6 +99,79 @@ class ReadCsvTest(unittest.TestCase):
                 self.assertEqual([self.records1[2]], list(recs))
 
 
+class WriteCsvTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        header = events.header(str)
+        recs = [[1, None, None, 'bx', 'gndr', 'F', None],
+                [1, '3', '4', 'dx', '250', 'a|b', '{"n": 1}']]
+        file = io.StringIO()
+        self.assertEqual(2, records.write_csv(
+            recs, file, events.csv_format, header))
+        file.seek(0)
+        self.assertEqual([['1', '', '', 'bx', 'gndr', 'F', ''],
+                          ['1', '3', '4', 'dx', '250', 'a|b', '{"n": 1}']],
+                         list(records.read_csv(file, events.csv_format,
+                                               header, parser=False)))
+
+    def test_compressed(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = pathlib.Path(tmp_dir) / 'recs.csv.gz'
+            records.write_csv([[1, 2]], path, events.csv_format,
+                              [('a', int), ('b', int)],
+                              lambda rec: [x * 10 for x in rec])
+            with gzip.open(path, 'rt') as file:
+                self.assertEqual('a|b\n10|20\n', file.read())
+
+
+class MkParserTest(unittest.TestCase):
+
+    header = (
+        ('id', int),
+        ('lo', datetime.date.fromisoformat),
+        ('cat', str),
+        ('val', float),
+        ('jsn', str),
+    )
+
+    raw_records = [
+        ['1', '2019-04-09', 'dx', '1.5', '{}'],
+        ['2', '', '', '', ''],
+        ['3', '2019-04-09', 'NA', '-0.25', 'NA'],
+        ['4', '2019-04-09'],
+        ['5', '2019-04-09', 'dx', '1.5', '{}', 'extra'],
+        [],
+    ]
+
+    def test_same_as_generic(self):
+        for null_values in (('',), ('', 'NA'), ()):
+            generic = records._mk_generic_parser(self.header, null_values)
+            parser = records.mk_parser(self.header, null_values)
+            for raw_record in self.raw_records:
+                with self.subTest((null_values, raw_record)):
+                    if null_values == () and '' in raw_record[1:4]:
+                        with self.assertRaises(ValueError):
+                            generic(raw_record)
+                        with self.assertRaises(ValueError):
+                            parser(raw_record)
+                        continue
+                    self.assertEqual(
+                        generic(raw_record), parser(raw_record))
+
+    def test_parse(self):
+        parser = records.mk_parser(self.header, ('', 'NA'))
+        self.assertEqual(
+            [1, datetime.date(2019, 4, 9), 'dx', 1.5, '{}'],
+            parser(self.raw_records[0]))
+        self.assertEqual([2, None, None, None, None],
+                         parser(self.raw_records[1]))
+        self.assertEqual([3, datetime.date(2019, 4, 9), None, -0.25, None],
+                         parser(self.raw_records[2]))
+
+    def test_empty_header(self):
+        self.assertEqual([], records.mk_parser(())(['1', '2']))
+
+
 class IsHeaderTest(unittest.TestCase):
 
     def test_is_header_if_first_n_lines(self):
@@ -144,3 +223,166 @@ class IsHeaderTest(unittest.TestCase):
         self.assertTrue(is_header(1, ('x_0', 'x-0', 'x+0', 'x.0')))
         self.assertFalse(is_header(2, ('x_0', 'x-0', 'x+0', 'x.0')))
         self.assertFalse(is_header(1, ('_0', '-0', '+0', '.0')))
+
+
+class IndexTest(unittest.TestCase):
+
+    lines = [
+        'id|lo|hi|cat|typ|val|jsn\n',
+        '1|||bx|gndr|F|\n',
+        '1|2019-04-09|2019-04-10|dx|250||\n',
+        '2|2019-04-09|2019-04-10|dx|250||"{""a"":\n1}"\n',
+        '2|2019-04-11|2019-04-12|rx|7|ünï|\n',
+        '10|||bx|gndr|M|\n',
+    ]
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filename = pathlib.Path(self.tmp_dir.name) / 'evs.csv'
+        with open(self.filename, 'wt', encoding='utf-8') as file:
+            file.writelines(self.lines)
+        self.csv_format = dict(events.csv_format, doublequote=True)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_build_index(self):
+        idx_filename = records.build_index(self.filename, self.csv_format)
+        self.assertEqual(
+            records.sidecar_index_filename(self.filename), idx_filename)
+        lens = [len(line.encode()) for line in self.lines]
+        expected = [
+            ['1', lens[0], sum(lens[1:3])],
+            ['2', sum(lens[:3]), sum(lens[3:5])],
+            ['10', sum(lens[:5]), lens[5]],
+        ]
+        self.assertEqual([tuple(rec) for rec in expected],
+                         records.read_index(idx_filename))
+
+    def test_not_grouped(self):
+        with open(self.filename, 'at', encoding='utf-8') as file:
+            file.write(self.lines[1])
+        with self.assertRaises(ValueError):
+            records.build_index(self.filename, self.csv_format)
+        self.assertFalse(os.path.exists(
+            records.sidecar_index_filename(self.filename)))
+
+    def test_index_is_current(self):
+        self.assertFalse(records.index_is_current(self.filename))
+        records.build_index(self.filename, self.csv_format)
+        self.assertTrue(records.index_is_current(self.filename))
+        # Same size, different modification time
+        stat = self.filename.stat()
+        os.utime(self.filename,
+                 ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertFalse(records.index_is_current(self.filename))
+        # Index without a stamp
+        idx_filename = records.build_index(self.filename, self.csv_format)
+        idx_path = pathlib.Path(idx_filename)
+        idx_path.write_text(idx_path.read_text().split('\n', 1)[1])
+        self.assertFalse(records.index_is_current(self.filename))
+        self.assertEqual(3, len(records.read_index(idx_filename)))
+
+    def test_groups(self):
+        records.build_index(self.filename, self.csv_format)
+        csv = records.IndexedCsv(self.filename, self.csv_format)
+        self.assertEqual([1, 2, 10], csv.ids())
+        groups = list(csv.groups({2, 10, 11}))
+        self.assertEqual([2, 10], [id for (id, _) in groups])
+        self.assertEqual(
+            [['2', '2019-04-09', '2019-04-10', 'dx', '250', '',
+              '{"a":\n1}'],
+             ['2', '2019-04-11', '2019-04-12', 'rx', '7', 'ünï', '']],
+            groups[0][1])
+        self.assertEqual(
+            [['10', '', '', 'bx', 'gndr', 'M', '']], csv.records(10))
+        self.assertEqual([], csv.records(3))
+
+    def test_line_separators(self):
+        # Characters that `str.splitlines` treats as line breaks are
+        # field text, as with `read_csv`
+        with open(self.filename, 'at', encoding='utf-8') as file:
+            file.write('11|||bx|note|a\x1cb|{"t": "c\u2028d\x85"}\n')
+        records.build_index(self.filename, self.csv_format)
+        csv = records.IndexedCsv(self.filename, self.csv_format)
+        self.assertEqual(
+            list(records.read_csv(self.filename, self.csv_format,
+                                  events.header(str), parser=False)),
+            [rec for (_, recs) in csv.groups() for rec in recs])
+        self.assertEqual(
+            [['11', '', '', 'bx', 'note', 'a\x1cb',
+              '{"t": "c\u2028d\x85"}']], csv.records(11))
+
+    def test_read_sequences(self):
+        records.build_index(self.filename, self.csv_format)
+        csv = records.IndexedCsv(self.filename, self.csv_format)
+        seqs = list(events.read_sequences(
+            csv, include_ids={1, 10},
+            parse_record=records.mk_parser(events.header(str))))
+        self.assertEqual([1, 10], [seq.id for seq in seqs])
+        self.assertEqual('M', seqs[1].fact(('bx', 'gndr')))
+
+
+class ShardCsvTest(unittest.TestCase):
+
+    def test_shard_csv(self):
+        lines = ['id|lo\n'] + [
+            '{}|{}\n'.format(id, lo) for id in range(1, 30)
+            for lo in range(id % 4)]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = pathlib.Path(tmp_dir) / 'evs.csv'
+            filename.write_text(''.join(lines))
+            for shard_size in (1, 7, 20, 100, 1000):
+                with self.subTest(shard_size):
+                    shards = records.shard_csv(
+                        filename, shard_size, events.csv_format)
+                    # Shards partition the file
+                    self.assertEqual(0, shards[0][0])
+                    self.assertIsNone(shards[0][2])
+                    for ((o1, l1, _), (o2, _, _)) in zip(
+                            shards, shards[1:]):
+                        self.assertEqual(o1 + l1, o2)
+                    self.assertEqual(filename.stat().st_size,
+                                     shards[-1][0] + shards[-1][1])
+                    # Shards start on ID boundaries
+                    text = filename.read_bytes()
+                    for (offset, _, first_id) in shards[1:]:
+                        self.assertEqual(b'\n', text[offset - 1:offset])
+                        prev_line = text[:offset - 1].rsplit(b'\n', 1)[-1]
+                        line = text[offset:].split(b'\n', 1)[0]
+                        self.assertEqual(first_id.encode(),
+                                         line.split(b'|')[0])
+                        self.assertNotEqual(first_id.encode(),
+                                            prev_line.split(b'|')[0])
+
+    def test_spanning_records(self):
+        # Continuation lines look like records of other IDs
+        lines = ['id|lo|jsn\n'] + [
+            '{}|{}|"{{\n{}|{}\n}}"\n'.format(id, lo, id + 5, lo)
+            for id in range(1, 30) for lo in range(id % 4)]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = pathlib.Path(tmp_dir) / 'evs.csv'
+            filename.write_text(''.join(lines))
+            text = filename.read_bytes().decode()
+            for shard_size in (1, 7, 20, 100, 1000):
+                with self.subTest(shard_size):
+                    shards = records.shard_csv(
+                        filename, shard_size, events.csv_format)
+                    self.assertEqual(filename.stat().st_size,
+                                     sum(lng for (_, lng, _) in shards))
+                    # Shards are whole groups of records
+                    recs = [list(csv.reader(
+                        io.StringIO(text[off:off + lng], newline=''),
+                        **events.csv_format))
+                            for (off, lng, _) in shards]
+                    self.assertEqual(
+                        list(csv.reader(io.StringIO(text, newline=''),
+                                        **events.csv_format)),
+                        [rec for shard in recs for rec in shard])
+                    for (prev, shard, (_, _, first_id)) in zip(
+                            recs, recs[1:], shards[1:]):
+                        self.assertEqual(first_id, shard[0][0])
+                        self.assertNotEqual(first_id, prev[-1][0])
+                    if shard_size < 100:
+                        self.assertLess(1, len(shards))
+
@@ -55,6 +55,10 @@ setuptools.setup(
     install_requires=[
         'esal ~= 0.4',
     ],
+    extras_require={
+        'lz4': ['lz4'],
+        'numpy': ['numpy'],
+    },
 
     # API
     packages=setuptools.find_packages(),
@@ -1,17 +1,24 @@
 # Summarize the data in a SQLite DB given the table definitions
 
-# Copyright (c) 2018 Aubrey Barnard.  This is free software released
-# under the MIT License.  See `LICENSE.txt` for details.
+# Copyright (c) 2018, 2026 Aubrey Barnard.  This is free software
+# released under the MIT License.  See `LICENSE.txt` for details.
 
 
 import argparse
 import collections
+import concurrent.futures
+import heapq
 import io
+import itertools
 import logging
+import math
+import multiprocessing
 import pathlib
 import re
 import sqlite3
 import sys
+import threading
+import time
 
 import yaml
 
@@ -159,6 +166,7 @@ def generate_summary_queries(
         tab_info=('n_rows',),
         col_info=('n_vals', 'top_k_vals'),
         top_k=10,
+        col_info_of=None,
 ):
     glbls = globals()
     for tbl_nm, col_nms in table_definitions:
@@ -168,8 +176,13 @@ def generate_summary_queries(
             yield (tbl_nm, None, info_nm, glbls[q_nm](tbl_nm))
         for col_nm in col_nms:
             # Query column summary information in the order requested
-            for info_nm in col_info:
+            for info_nm in column_infos(
+                    tbl_nm, col_nm, col_info, col_info_of):
                 q_nm = 'q_' + info_nm
+                if q_nm not in glbls:
+                    # E.g. sketches, which need profiling
+                    raise ValueError('No query for column info: {!r}'
+                                     .format(info_nm))
                 yield (tbl_nm, col_nm, info_nm, glbls[q_nm](
                     tbl_nm, col_nm, top_k=top_k))
 
@@ -212,22 +225,55 @@ def print_queries(
         print("\n.shell date +'%FT%T sqlite3: Done'", file=file)
 
 
+def _add_summary(summaries, tbl_nm, col_nm, info_nm, value):
+    # Get the right part of the summaries for attaching this
+    # information.  Using `setdefault` is a very wasteful way of
+    # querying and building structure in this case, but creating an
+    # "ordered default dict" is too complicated.
+    summary = summaries
+    if tbl_nm:
+        summary = summary.setdefault(tbl_nm, collections.OrderedDict())
+    if col_nm:
+        summary = summary.setdefault(col_nm, collections.OrderedDict())
+    summary[info_nm] = value
+
+
+def _add_result(summaries, q_def, rows, secs, timings):
+    tbl_nm, col_nm, info_nm, _ = q_def
+    _add_summary(summaries, tbl_nm, col_nm, info_nm, unpack_scalars(rows))
+    if timings:
+        _add_summary(summaries, tbl_nm, col_nm, info_nm + '_secs',
+                     round(secs, 3))
+
+
+def run_setup_queries(db, setup_queries):
+    logger = logging.getLogger(__name__)
+    logger.info('Running setup queries')
+    for msg, q in setup_queries:
+        rows = run_query(db, q).fetchall()
+        if msg:
+            logger.info('{}: {}'.format(msg, unpack_scalars(rows)))
+
+
 def execute_queries(
         db_filename,
         setup_queries,
         summary_queries,
+        timings=False,
 ):
+    """
+    Run the given queries serially on a single connection and return
+    the summaries as nested ordered dictionaries of tables, columns,
+    and infos.  If `timings`, also include the time each query took
+    (in seconds) as info "<info>_secs".
+    """
     # Create a dictionary with 3 levels: tables, columns, and infos
     summaries = collections.OrderedDict()
     # Connect to the SQLite DB
     logger = logging.getLogger(__name__)
     logger.info('Connecting to SQLite DB: {!r}'.format(db_filename))
     with sqlite3.connect(db_filename) as db:
-        logger.info('Running setup queries')
-        for msg, q in setup_queries:
-            rows = run_query(db, q).fetchall()
-            if msg:
-                logger.info('{}: {}'.format(msg, unpack_scalars(rows)))
+        run_setup_queries(db, setup_queries)
         logger.info('Running summary queries')
         prev_tbl_nm = None
         for q_def in summary_queries:
@@ -235,23 +281,657 @@ def execute_queries(
             if tbl_nm != prev_tbl_nm:
                 logger.info('Summarizing table: {}'.format(tbl_nm))
                 prev_tbl_nm = tbl_nm
+            start = time.perf_counter()
             rows = run_query(db, q, p).fetchall()
-            # Get the right part of the summaries for attaching this
-            # information.  Using `setdefault` is a very wasteful way of
-            # querying and building structure in this case, but
-            # creatingi an "ordered default dict" is too complicated.
-            summary = summaries
-            if tbl_nm:
-                summary = summary.setdefault(
-                    tbl_nm, collections.OrderedDict())
-            if col_nm:
-                summary = summary.setdefault(
-                    col_nm, collections.OrderedDict())
-            summary[info_nm] = unpack_scalars(rows)
+            _add_result(summaries, q_def, rows,
+                        time.perf_counter() - start, timings)
         logger.info('Done executing queries')
     return summaries
 
 
+def connect_read_only(db_filename, check_same_thread=True):
+    """Open the given SQLite DB read-only."""
+    uri = pathlib.Path(db_filename).resolve().as_uri() + '?mode=ro'
+    return sqlite3.connect(
+        uri, uri=True, check_same_thread=check_same_thread)
+
+
+def estimate_n_rows(db, tbl_nm):
+    """
+    Return a quick estimate of the number of rows in the given table
+    (its largest row ID), or 0 if no estimate is available (e.g. for
+    tables without row IDs).
+    """
+    try:
+        n_rows = db.execute(
+            'select max(rowid) from {};'.format(tbl_nm)).fetchone()[0]
+    except sqlite3.Error:
+        return 0
+    return n_rows or 0
+
+
+def _map_parallel(
+        db_filename, setup_queries, func, items, order, n_workers,
+        describe=str):
+    """
+    Return `[func(db, item) for item in items]`, calling `func` on a
+    pool of `n_workers` threads in the given order of item indices.
+
+    Each thread opens its own read-only connection and runs the setup
+    queries on it.  (SQLite releases the GIL while it runs a query, so
+    threads give real parallelism.)  If a call fails, the items that
+    have not started are cancelled and the queries that are running are
+    interrupted, so the error is raised without waiting for them to
+    finish.
+    """
+    logger = logging.getLogger(__name__)
+    # One connection per worker thread
+    local = threading.local()
+    conns = []
+    conns_lock = threading.Lock()
+
+    def init_worker():
+        local.db = connect_read_only(db_filename, check_same_thread=False)
+        with conns_lock:
+            conns.append(local.db)
+        run_setup_queries(local.db, setup_queries)
+
+    def run(item):
+        start = time.perf_counter()
+        result = func(local.db, item)
+        return (result, time.perf_counter() - start)
+
+    results = [None] * len(items)
+    pool = concurrent.futures.ThreadPoolExecutor(
+        max_workers=n_workers, initializer=init_worker)
+    try:
+        futures = {pool.submit(run, items[idx]): idx for idx in order}
+        for future in concurrent.futures.as_completed(futures):
+            idx = futures[future]
+            results[idx], secs = future.result()
+            logger.info('Done: {} ({:.3f} s)'.format(
+                describe(items[idx]), secs))
+    except BaseException:
+        # Fail without waiting for the remaining items.  Cancel those
+        # not yet started and interrupt the running queries, which then
+        # raise in their threads.
+        pool.shutdown(wait=False, cancel_futures=True)
+        with conns_lock:
+            for db in conns:
+                db.interrupt()
+        raise
+    finally:
+        # The threads are done or soon will be.  Wait for them before
+        # closing the connections they use.
+        pool.shutdown()
+        for db in conns:
+            db.close()
+    return results
+
+
+def _estimate_tables_n_rows(db_filename, tbl_nms):
+    with connect_read_only(db_filename) as db:
+        tbl_n_rows = {tbl_nm: estimate_n_rows(db, tbl_nm)
+                      for tbl_nm in tbl_nms}
+    db.close()
+    return tbl_n_rows
+
+
+def execute_queries_parallel(
+        db_filename,
+        setup_queries,
+        summary_queries,
+        n_workers=4,
+        timings=False,
+):
+    """
+    Run the given queries in parallel and return the same summaries
+    as `execute_queries`, in the same order.
+
+    Each of `n_workers` threads has its own read-only connection (see
+    `_map_parallel`).  Queries are scheduled largest table first, as
+    estimated by `estimate_n_rows`, so that the longest queries do not
+    start last and leave the other workers idle at the end.
+    """
+    summary_queries = list(summary_queries)
+    logger = logging.getLogger(__name__)
+    logger.info('Connecting to SQLite DB: {!r}'.format(db_filename))
+    # Estimate table sizes for scheduling
+    tbl_n_rows = _estimate_tables_n_rows(
+        db_filename, {q_def[0] for q_def in summary_queries if q_def[0]})
+    order = sorted(
+        range(len(summary_queries)),
+        key=lambda idx: -tbl_n_rows.get(summary_queries[idx][0], 0))
+
+    def run(db, q_def):
+        _, _, _, (q, p) = q_def
+        start = time.perf_counter()
+        rows = run_query(db, q, p).fetchall()
+        return (rows, time.perf_counter() - start)
+
+    logger.info('Running {} summary queries with {} workers'
+                .format(len(summary_queries), n_workers))
+    results = _map_parallel(
+        db_filename, setup_queries, run, summary_queries, order,
+        n_workers, describe=lambda q_def: ' '.join(map(str, q_def[:3])))
+    # Assemble the summaries in the original order
+    summaries = collections.OrderedDict()
+    for q_def, (rows, secs) in zip(summary_queries, results):
+        _add_result(summaries, q_def, rows, secs, timings)
+    logger.info('Done executing queries')
+    return summaries
+
+
+# Sketches
+
+
+_hash_mult1 = 0x9e3779b97f4a7c15
+_hash_mult2 = 0xd6e8feb86659fd93
+_mask64 = 2 ** 64 - 1
+
+
+class HyperLogLog:
+    """
+    HyperLogLog sketch of the number of distinct values.
+
+    Uses 2^`precision` registers of one small integer each.  The
+    relative standard error of the estimate is about
+    1.04 / sqrt(2^`precision`) (0.8% for the default precision of 14).
+    Values are hashed with Python's `hash`, so sketches are only
+    comparable within a process.
+    """
+
+    def __init__(self, precision=14):
+        if not 4 <= precision <= 18:
+            raise ValueError('Precision not in [4, 18]: {}'
+                             .format(precision))
+        self.precision = precision
+        self._n_bits = 64 - precision
+        self._registers = [0] * (2 ** precision)
+
+    def add(self, values):
+        """Add the given iterable of values."""
+        registers = self._registers
+        n_bits = self._n_bits
+        mask = (1 << n_bits) - 1
+        # Duplicates within a batch do not change the sketch
+        for value in set(values):
+            # Spread the bits of Python's hash (which is the identity
+            # for small integers) over 64 bits.  (Inlined for speed.)
+            hsh = (hash(value) * _hash_mult1) & _mask64
+            hsh ^= hsh >> 32
+            hsh = (hsh * _hash_mult2) & _mask64
+            hsh ^= hsh >> 29
+            idx = hsh >> n_bits
+            rank = n_bits - (hsh & mask).bit_length() + 1
+            if rank > registers[idx]:
+                registers[idx] = rank
+
+    def std_err(self):
+        """Return the relative standard error of the estimate."""
+        return 1.04 / math.sqrt(len(self._registers))
+
+    def estimate(self):
+        """
+        Return the estimated number of distinct values.
+
+        Uses the improved estimator of Ertl ("New cardinality
+        estimation algorithms for HyperLogLog sketches", 2017), which
+        corrects the bias of the raw estimate over the whole range of
+        counts.  (Switching to linear counting at 2.5 times the number
+        of registers, as in the original HyperLogLog, overestimates by
+        a few percent just above the switch.)
+        """
+        n_regs = len(self._registers)
+        max_rank = self._n_bits + 1
+        # Histogram of register values
+        hist = [0] * (max_rank + 1)
+        for rank in self._registers:
+            hist[rank] += 1
+        if hist[0] == n_regs:
+            return 0
+        z = n_regs * _hll_tau(1 - hist[max_rank] / n_regs)
+        for rank in range(max_rank - 1, 0, -1):
+            z = 0.5 * (z + hist[rank])
+        z += n_regs * _hll_sigma(hist[0] / n_regs)
+        return round(n_regs ** 2 / (2 * math.log(2)) / z)
+
+
+def _hll_sigma(x):
+    # Return x + sum_{k >= 1} x^(2^k) 2^(k - 1) for 0 <= x < 1 (from
+    # Ertl's estimator)
+    y = 1.0
+    z = x
+    while True:
+        x *= x
+        prev_z = z
+        z += x * y
+        y += y
+        if z == prev_z:
+            return z
+
+
+def _hll_tau(x):
+    # Return (1 - x - sum_{k >= 1} (1 - x^(2^-k))^2 2^-k) / 3 for
+    # 0 <= x <= 1 (from Ertl's estimator)
+    if x == 0 or x == 1:
+        return 0.0
+    y = 1.0
+    z = 1 - x
+    while True:
+        x = math.sqrt(x)
+        prev_z = z
+        y *= 0.5
+        z -= (1 - x) ** 2 * y
+        if z == prev_z:
+            return z / 3
+
+
+class SpaceSaving:
+    """
+    SpaceSaving (equivalently Misra-Gries) summary of the most frequent
+    values in at most `n_counters` counters.
+
+    Batches of values are counted exactly and merged into the summary
+    as mergeable Misra-Gries summaries are: when there are more than
+    `n_counters` counters, the (`n_counters` + 1)-th largest count is
+    subtracted from every counter and the counters that are not
+    positive are dropped.  Each count is thus at most `max_err` below
+    the true count, where `max_err` is the total subtracted and is at
+    most n / (`n_counters` + 1) for n values.  Every value occurring
+    more than `max_err` times is in the summary.
+
+    Only counts above `max_err` are meaningful.  When there are many
+    values that are each infrequent, `max_err` can exceed all the
+    counts.  Then the values left in the summary are just those seen
+    last, not the most frequent, and their order means nothing.
+    """
+
+    def __init__(self, n_counters=1000):
+        if n_counters < 1:
+            raise ValueError('Not a positive number of counters: {}'
+                             .format(n_counters))
+        self.n_counters = n_counters
+        self.max_err = 0
+        self._counts = collections.Counter()
+
+    def add(self, values):
+        """
+        Add the given sequence of values (or mapping of values to their
+        counts, such as a `collections.Counter`).
+        """
+        counts = self._counts
+        counts.update(values)
+        if len(counts) > self.n_counters:
+            cut = heapq.nlargest(self.n_counters + 1, counts.values())[-1]
+            self.max_err += cut
+            self._counts = collections.Counter(
+                {val: cnt - cut for (val, cnt) in counts.items()
+                 if cnt > cut})
+
+    def most_common(self, n=None):
+        """
+        Return the `n` most frequent values and their (under)counts as
+        in `collections.Counter.most_common`.
+        """
+        return self._counts.most_common(n)
+
+
+# Single-scan profiling
+
+
+def _sqlite_sort_key(value):
+    # Order values as SQLite does: NULL, numbers, text, blobs
+    if value is None:
+        return (0, 0)
+    elif isinstance(value, (int, float)):
+        return (1, value)
+    elif isinstance(value, str):
+        return (2, value)
+    else:
+        return (3, value)
+
+
+class ColumnProfile:
+    """
+    Statistics of a column accumulated in a single pass over batches of
+    its values.
+
+    Only the statistics needed for the requested information are kept.
+    The exact infos ("n_vals", "top_k_vals") count values in a
+    `collections.Counter` until there are more than `max_vals` distinct
+    values (`None` or 0 for no limit).  Then the counts are discarded
+    to bound memory, those infos become `None`, and they are estimated
+    with the sketches instead, which use fixed memory: "n_vals" by
+    "n_vals_hll" (see `HyperLogLog`) and "top_k_vals" by
+    "top_k_vals_ss" (see `SpaceSaving`).  The names of the estimating
+    infos are then in `estimated_infos`.  The number of NULLs and the
+    minimum and maximum values are always exact.
+    """
+
+    exact_infos = ('n_vals', 'top_k_vals', 'n_nulls', 'min_val',
+                    'max_val')
+    sketch_infos = ('n_vals_hll', 'top_k_vals_ss')
+    infos = exact_infos + sketch_infos
+    # Sketch infos that estimate exact infos
+    exact2sketch = {
+        'n_vals': 'n_vals_hll',
+        'top_k_vals': 'top_k_vals_ss',
+    }
+
+    def __init__(
+            self,
+            name,
+            infos=exact_infos,
+            max_vals=2 ** 20,
+            hll_precision=14,
+            ss_n_counters=1000,
+    ):
+        for info_nm in infos:
+            if info_nm not in self.infos:
+                raise ValueError('Unknown column info: {!r}'
+                                 .format(info_nm))
+        self.name = name
+        self.max_vals = max_vals or None
+        self.hll_precision = hll_precision
+        self.ss_n_counters = ss_n_counters
+        self._infos = frozenset(infos)
+        self.estimated_infos = ()
+        self._counts = (collections.Counter()
+                        if 'n_vals' in infos or 'top_k_vals' in infos
+                        else None)
+        self._hll = (HyperLogLog(hll_precision)
+                     if 'n_vals_hll' in infos else None)
+        self._ss = (SpaceSaving(ss_n_counters)
+                    if 'top_k_vals_ss' in infos else None)
+        self._n_nulls = 0
+        self._min_val = None
+        self._max_val = None
+        self._track_min_max = 'min_val' in infos or 'max_val' in infos
+
+    def add(self, values):
+        """Add the given sequence of values."""
+        if self._hll is not None:
+            self._hll.add(values)
+        if self._ss is not None:
+            self._ss.add(values)
+        if self._counts is None:
+            self._n_nulls += values.count(None)
+            if self._track_min_max:
+                self._update_min_max(values)
+            return
+        self._counts.update(values)
+        if self.max_vals is not None and len(self._counts) > self.max_vals:
+            logging.getLogger(__name__).warning(
+                'Column {!r} has over {} distinct values.  Estimating '
+                'its values with sketches.'.format(
+                    self.name, self.max_vals))
+            self._finish_counts()
+            # Start the sketches that are missing from the counts so far
+            if self._hll is None and 'n_vals' in self._infos:
+                self._hll = HyperLogLog(self.hll_precision)
+                self._hll.add(self._counts)
+            if self._ss is None and 'top_k_vals' in self._infos:
+                self._ss = SpaceSaving(self.ss_n_counters)
+                self._ss.add(self._counts)
+            self._counts = None
+            self.estimated_infos = tuple(
+                self.exact2sketch[info_nm]
+                for info_nm in ('n_vals', 'top_k_vals')
+                if info_nm in self._infos)
+
+    def _update_min_max(self, values):
+        vals = [val for val in values if val is not None]
+        if self._min_val is not None:
+            vals.append(self._min_val)
+            vals.append(self._max_val)
+        if vals:
+            self._min_val = min(vals, key=_sqlite_sort_key)
+            self._max_val = max(vals, key=_sqlite_sort_key)
+
+    def _finish_counts(self):
+        self._n_nulls = self._counts.get(None, 0)
+        if self._track_min_max:
+            self._update_min_max(self._counts)
+
+    def finish(self):
+        """Finish the statistics after the last values were added."""
+        if self._counts is not None:
+            self._finish_counts()
+
+    # Statistics by info name
+
+    def n_vals(self, **kwargs):
+        # As in `q_n_vals`, NULL counts as a value.  Unknown if there
+        # were too many values to count.
+        if self._counts is None:
+            return None
+        return len(self._counts)
+
+    def top_k_vals(self, top_k=10, **kwargs):
+        # Rows as from `q_top_k_vals`.  Unknown if there were too many
+        # values to count.
+        if self._counts is None:
+            return None
+        return unpack_scalars([(cnt, val) for (val, cnt)
+                               in self._counts.most_common(top_k)])
+
+    def n_nulls(self, **kwargs):
+        return self._n_nulls
+
+    def min_val(self, **kwargs):
+        return self._min_val
+
+    def max_val(self, **kwargs):
+        return self._max_val
+
+    def n_vals_hll(self, **kwargs):
+        return collections.OrderedDict((
+            ('estimate', self._hll.estimate()),
+            ('rel_std_err', round(self._hll.std_err(), 4)),
+        ))
+
+    def top_k_vals_ss(self, top_k=10, **kwargs):
+        # Rows of (lower-bound, upper-bound, value), because the counts
+        # are at most `max_err` too low.  Rows are ranked by their lower
+        # bounds, which is only meaningful for lower bounds above
+        # `max_err` (see `SpaceSaving`).
+        max_err = self._ss.max_err
+        return collections.OrderedDict((
+            ('max_err', max_err),
+            ('rows', [(cnt, cnt + max_err, val) for (val, cnt)
+                      in self._ss.most_common(top_k)]),
+        ))
+
+
+def column_infos(tbl_nm, col_nm, col_info, col_info_of=None):
+    """
+    Return the information to summarize for the given column: the
+    value of `col_info_of` for "<table>.<column>", if any, otherwise
+    `col_info`.
+    """
+    if col_info_of:
+        return col_info_of.get('{}.{}'.format(tbl_nm, col_nm), col_info)
+    return col_info
+
+
+def profile_table(
+        db,
+        tbl_nm,
+        col_nms,
+        col_info=ColumnProfile.exact_infos,
+        top_k=10,
+        max_vals=2 ** 20,
+        batch_size=2 ** 16,
+        col_info_of=None,
+        hll_precision=14,
+        ss_n_counters=1000,
+):
+    """
+    Scan the given table once and return (n-rows, column-summaries),
+    where the column summaries are a list of ordered dictionaries of
+    the requested information (see `column_infos`).  The column
+    information is the names of methods of `ColumnProfile`.  Columns
+    with no requested information are not read.  Columns with too many
+    values to count exactly also have the information that estimates
+    the counts (see `ColumnProfile`).
+
+    The table is read in batches of `batch_size` rows, and each batch is
+    transposed into columns so that counting happens in bulk.
+    """
+    col_infos = [column_infos(tbl_nm, col_nm, col_info, col_info_of)
+                 for col_nm in col_nms]
+    profiles = [(ColumnProfile(col_nm, infos, max_vals, hll_precision,
+                               ss_n_counters) if infos else None)
+                for (col_nm, infos) in zip(col_nms, col_infos)]
+    read_nms = [col_nm for (col_nm, profile) in zip(col_nms, profiles)
+                if profile is not None]
+    read_profiles = [profile for profile in profiles
+                     if profile is not None]
+    if read_nms:
+        cursor = run_query(db, 'select {} from {};'.format(
+            ', '.join(read_nms), tbl_nm))
+        cursor.arraysize = batch_size
+        n_rows = 0
+        rows = cursor.fetchmany()
+        while rows:
+            n_rows += len(rows)
+            for profile, values in zip(read_profiles, zip(*rows)):
+                profile.add(values)
+            rows = cursor.fetchmany()
+    else:
+        n_rows = run_query(db, q_n_rows(tbl_nm)[0]).fetchone()[0]
+    col_summaries = []
+    for profile, infos in zip(profiles, col_infos):
+        if profile is None:
+            col_summaries.append(None)
+            continue
+        profile.finish()
+        col_summaries.append(collections.OrderedDict(
+            (info_nm, getattr(profile, info_nm)(top_k=top_k))
+            for info_nm in itertools.chain(
+                infos, (info_nm for info_nm in profile.estimated_infos
+                        if info_nm not in infos))))
+    return (n_rows, col_summaries)
+
+
+def profile_tables(
+        db_filename,
+        setup_queries,
+        table_definitions,
+        tab_info=('n_rows',),
+        col_info=ColumnProfile.exact_infos,
+        top_k=10,
+        max_vals=2 ** 20,
+        batch_size=2 ** 16,
+        n_workers=1,
+        timings=False,
+        col_info_of=None,
+        hll_precision=14,
+        ss_n_counters=1000,
+):
+    """
+    Summarize the given tables by scanning each one once (see
+    `profile_table`) instead of querying each column separately.
+    Return the summaries as nested ordered dictionaries of tables,
+    columns, and infos, in the order of the table definitions and the
+    requested information, as from `execute_queries`.
+
+    If `n_workers` is more than 1, tables are profiled in parallel,
+    largest first (see `execute_queries_parallel`), by a pool of worker
+    processes, each with its own read-only connection.  (Profiling
+    counts values in Python, which holds the GIL, so threads would not
+    run in parallel.)  If `timings`, the time each table took (in
+    seconds) is included as table info "profile_secs".
+    """
+    logger = logging.getLogger(__name__)
+    for info_nm in tab_info:
+        if info_nm != 'n_rows':
+            raise ValueError('Unknown table info: {!r}'.format(info_nm))
+    for infos in itertools.chain(
+            [col_info], (col_info_of or {}).values()):
+        for info_nm in infos:
+            if info_nm not in ColumnProfile.infos:
+                raise ValueError('Unknown column info: {!r}'
+                                 .format(info_nm))
+
+    profile_kwargs = dict(
+        col_info=col_info, top_k=top_k, max_vals=max_vals,
+        batch_size=batch_size, col_info_of=col_info_of,
+        hll_precision=hll_precision, ss_n_counters=ss_n_counters)
+    table_definitions = list(table_definitions)
+    logger.info('Connecting to SQLite DB: {!r}'.format(db_filename))
+    if n_workers > 1:
+        tbl_n_rows = _estimate_tables_n_rows(
+            db_filename, [tbl_nm for (tbl_nm, _) in table_definitions])
+        order = sorted(range(len(table_definitions)),
+                       key=lambda idx: -tbl_n_rows[table_definitions[idx][0]])
+        logger.info('Profiling {} tables with {} workers'
+                    .format(len(table_definitions), n_workers))
+        results = [None] * len(table_definitions)
+        # Leaving the pool terminates the workers, so an error is raised
+        # without waiting for the other tables
+        with multiprocessing.Pool(
+                n_workers, initializer=_init_profile_worker,
+                initargs=(db_filename, setup_queries,
+                          profile_kwargs)) as pool:
+            for (idx, result) in pool.imap_unordered(
+                    _profile_in_worker,
+                    [(idx, table_definitions[idx]) for idx in order]):
+                results[idx] = result
+                logger.info('Done: {} ({:.3f} s)'.format(
+                    table_definitions[idx][0], result[1]))
+    else:
+        with sqlite3.connect(db_filename) as db:
+            run_setup_queries(db, setup_queries)
+            results = []
+            for (tbl_nm, col_nms) in table_definitions:
+                logger.info('Profiling table: {}'.format(tbl_nm))
+                results.append(_timed(
+                    profile_table, db, tbl_nm, col_nms, **profile_kwargs))
+        db.close()
+    # Assemble the summaries
+    summaries = collections.OrderedDict()
+    for (tbl_nm, col_nms), ((n_rows, col_summaries), secs) in zip(
+            table_definitions, results):
+        summary = summaries[tbl_nm] = collections.OrderedDict()
+        if 'n_rows' in tab_info:
+            summary['n_rows'] = n_rows
+        if timings:
+            summary['profile_secs'] = round(secs, 3)
+        for col_nm, col_summary in zip(col_nms, col_summaries):
+            if col_summary is not None:
+                summary[col_nm] = col_summary
+    logger.info('Done profiling tables')
+    return summaries
+
+
+# Connection and arguments of a profiling worker process
+_profile_worker = None
+
+
+def _init_profile_worker(db_filename, setup_queries, profile_kwargs):
+    global _profile_worker
+    db = connect_read_only(db_filename)
+    run_setup_queries(db, setup_queries)
+    _profile_worker = (db, profile_kwargs)
+
+
+def _profile_in_worker(idx_tbl_def):
+    # Profile a table in a worker process.  Return its index with the
+    # result so that results can be returned in any order.
+    idx, (tbl_nm, col_nms) = idx_tbl_def
+    db, profile_kwargs = _profile_worker
+    return (idx, _timed(
+        profile_table, db, tbl_nm, col_nms, **profile_kwargs))
+
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return (result, time.perf_counter() - start)
+
+
 def _odict_repr(dumper, odict):
     return dumper.represent_dict(odict.items())
 yaml.add_representer(collections.OrderedDict, _odict_repr)
@@ -287,9 +967,23 @@ def main_api(
 
         # Mode
         print_mode=False,
+        profile_mode=False,
 
         # Reporting control
         top_k=10,
+        timings=False,
+
+        col_info=None,
+        col_info_of=None,
+
+        # Profiling control
+        max_vals=2 ** 20,
+        batch_size=2 ** 16,
+        hll_precision=14,
+        ss_n_counters=1000,
+
+        # Parallelism
+        n_workers=1,
 
         # SQLite control
         sqlite3_n_threads=4,
@@ -313,12 +1007,23 @@ def main_api(
     # Read the table definitions
     tbl_defs = read_table_definitions(sql_filename)
     # Generate queries for all summary information
+    # The page cache is per connection, so share it among the workers
+    # (when not just printing the queries)
     init_qs = list(generate_setup_queries(
         n_threads=sqlite3_n_threads,
         mmap_size=sqlite3_mmap_size,
-        cache_size=sqlite3_cache_size,
+        cache_size=(sqlite3_cache_size if print_mode or n_workers <= 1
+                    else sqlite3_cache_size // n_workers),
     ))
-    main_qs = list(generate_summary_queries(tbl_defs, top_k=top_k))
+    # Profiling (and not printing) is done without queries
+    profile_mode = profile_mode and not print_mode
+    if col_info is None:
+        col_info = (ColumnProfile.exact_infos if profile_mode
+                    else ('n_vals', 'top_k_vals'))
+    if not profile_mode:
+        main_qs = list(generate_summary_queries(
+            tbl_defs, col_info=col_info, top_k=top_k,
+            col_info_of=col_info_of))
     # Output queries or execute them and collect the results ourselves?
     if print_mode:
         header = """
@@ -336,13 +1041,50 @@ def main_api(
             file=stdout,
         )
     else:
-        table_summaries = execute_queries(db_filename, init_qs, main_qs)
+        if profile_mode:
+            table_summaries = profile_tables(
+                db_filename, init_qs, tbl_defs, col_info=col_info,
+                top_k=top_k, max_vals=max_vals, batch_size=batch_size,
+                n_workers=n_workers, timings=timings,
+                col_info_of=col_info_of, hll_precision=hll_precision,
+                ss_n_counters=ss_n_counters)
+        elif n_workers > 1:
+            table_summaries = execute_queries_parallel(
+                db_filename, init_qs, main_qs, n_workers, timings)
+        else:
+            table_summaries = execute_queries(
+                db_filename, init_qs, main_qs, timings)
         # Print report
         logger.info('Printing report')
         print_table_summaries_as_yaml(table_summaries, file=stdout)
     logger.info('Done')
 
 
+def _parse_infos(text):
+    return tuple(info_nm.strip() for info_nm in text.split(',')
+                 if info_nm.strip())
+
+
+def _parse_column_infos(text):
+    column, sep, infos = text.partition('=')
+    if not sep or '.' not in column:
+        raise argparse.ArgumentTypeError(
+            'Not of the form TBL.COL=INFO[,INFO...]: {!r}'.format(text))
+    return (column.strip(), _parse_infos(infos))
+
+
+def _parse_max_vals(text):
+    # "none" and 0 mean no limit.  No limit is 0 rather than `None` so
+    # that it is not mistaken for an unset argument.
+    if text.strip().lower() == 'none':
+        return 0
+    max_vals = int(text)
+    if max_vals < 0:
+        raise argparse.ArgumentTypeError(
+            'Not a nonnegative integer or "none": {!r}'.format(text))
+    return max_vals
+
+
 def main_cli(prog_name, *args):
     # Use basename for program name
     prog_name = pathlib.Path(prog_name).name
@@ -355,8 +1097,27 @@ def main_cli(prog_name, *args):
     arg_prsr.add_argument('db_filename', metavar='DB-FILE')
     arg_prsr.add_argument('--print', action='store_true',
                           dest='print_mode')
+    arg_prsr.add_argument('--profile', action='store_true',
+                          default=None, dest='profile_mode')
     arg_prsr.add_argument('--top-k', type=int, metavar='N',
                           dest='top_k')
+    arg_prsr.add_argument('--col-info', type=_parse_infos,
+                          metavar='INFO[,INFO...]', dest='col_info')
+    arg_prsr.add_argument('--col-info-of', type=_parse_column_infos,
+                          action='append', metavar='TBL.COL=INFO[,...]',
+                          dest='col_info_of')
+    arg_prsr.add_argument('--max-vals', type=_parse_max_vals,
+                          metavar='N', dest='max_vals')
+    arg_prsr.add_argument('--hll-precision', type=int, metavar='P',
+                          dest='hll_precision')
+    arg_prsr.add_argument('--ss-n-counters', type=int, metavar='N',
+                          dest='ss_n_counters')
+    arg_prsr.add_argument('--batch-size', type=int, metavar='N',
+                          dest='batch_size')
+    arg_prsr.add_argument('--n-workers', type=int, metavar='N',
+                          dest='n_workers')
+    arg_prsr.add_argument('--timings', action='store_true',
+                          default=None, dest='timings')
     arg_prsr.add_argument('--sqlite3-n-threads', type=int, metavar='N',
                           dest='sqlite3_n_threads')
     arg_prsr.add_argument('--sqlite3-mmap-size', type=int, metavar='SZ',
@@ -370,6 +1131,8 @@ def main_cli(prog_name, *args):
     # Convert argument parser namespace to a dictionary.  Remove unset
     # values to avoid overwriting defaults.
     env = {k: v for (k, v) in vars(nmspc).items() if v is not None}
+    if 'col_info_of' in env:
+        env['col_info_of'] = dict(env['col_info_of'])
     # Run
     main_api(prog_name=prog_name, **env)
     return 0
@@ -0,0 +1,190 @@
+"""Tests `summarize_data.py`"""
+
+# Copyright (c) 2026 Aubrey Barnard.  This is free software released
+# under the MIT License.  See `LICENSE.txt` for details.
+
+
+import argparse
+import logging
+import pathlib
+import sqlite3
+import tempfile
+import time
+import unittest
+
+import summarize_data
+
+
+class SummarizeDataTest(unittest.TestCase):
+
+    table_definitions = [
+        ('people', ('id', 'sex', 'yob')),
+        ('events', ('id', 'cat', 'typ', 'val')),
+    ]
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_filename = pathlib.Path(self.tmp_dir.name) / 'db.sqlite'
+        db = sqlite3.connect(self.db_filename)
+        with db:
+            db.execute('create table people (id int, sex text, yob int);')
+            db.execute('create table events '
+                       '(id int, cat text, typ text, val text);')
+            db.executemany(
+                'insert into people values (?, ?, ?);',
+                [(id, 'FM'[id % 2], 1940 + id % 7) for id in range(50)])
+            db.executemany(
+                'insert into events values (?, ?, ?, ?);',
+                [(idx % 50, ('dx', 'rx', 'px')[idx % 3],
+                  str(idx % 11), None if idx % 4 else str(idx))
+                 for idx in range(500)])
+        db.close()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+        logging.disable(logging.NOTSET)
+
+    def summary_queries(self, col_info=('n_vals', 'top_k_vals')):
+        return list(summarize_data.generate_summary_queries(
+            self.table_definitions, col_info=col_info, top_k=3))
+
+    def test_serial_parallel(self):
+        serial = summarize_data.execute_queries(
+            self.db_filename, [], self.summary_queries())
+        self.assertEqual(50, serial['people']['n_rows'])
+        self.assertEqual(11, serial['events']['typ']['n_vals'])
+        parallel = summarize_data.execute_queries_parallel(
+            self.db_filename, [], self.summary_queries(), n_workers=3)
+        self.assertEqual(serial, parallel)
+        self.assertEqual(list(serial['events']),
+                         list(parallel['events']))
+
+    def test_profile(self):
+        # Include all the values so that ties are not an issue
+        serial = summarize_data.execute_queries(
+            self.db_filename, [], list(
+                summarize_data.generate_summary_queries(
+                    self.table_definitions, top_k=1000)))
+        for n_workers in (1, 2):
+            with self.subTest(n_workers=n_workers):
+                profiled = summarize_data.profile_tables(
+                    self.db_filename, [], self.table_definitions,
+                    col_info=('n_vals', 'top_k_vals'), top_k=1000,
+                    n_workers=n_workers)
+                self.assertEqual(list(serial), list(profiled))
+                for (tbl_nm, summary) in serial.items():
+                    self.assertEqual(list(summary), list(profiled[tbl_nm]))
+                    self.assertEqual(summary['n_rows'],
+                                     profiled[tbl_nm]['n_rows'])
+                    for col_nm in dict(self.table_definitions)[tbl_nm]:
+                        expected = summary[col_nm]
+                        actual = profiled[tbl_nm][col_nm]
+                        self.assertEqual(expected['n_vals'],
+                                         actual['n_vals'])
+                        self.assertEqual(
+                            sorted(expected['top_k_vals'], key=repr),
+                            sorted(actual['top_k_vals'], key=repr))
+
+    def test_max_vals(self):
+        profile = summarize_data.ColumnProfile(
+            'x', ('n_vals', 'top_k_vals', 'n_nulls'), max_vals=20)
+        profile.add([1] * 50 + [None] * 3 + list(range(100, 110)))
+        self.assertEqual((), profile.estimated_infos)
+        self.assertEqual(12, profile.n_vals())
+        profile.add(list(range(200, 300)))
+        profile.finish()
+        # The exact infos are unknown and the values counted before the
+        # limit are in the sketches
+        self.assertIsNone(profile.n_vals())
+        self.assertIsNone(profile.top_k_vals())
+        self.assertEqual(('n_vals_hll', 'top_k_vals_ss'),
+                         profile.estimated_infos)
+        n_vals = profile.n_vals_hll()
+        self.assertAlmostEqual(112, n_vals['estimate'], delta=2)
+        top_k_vals = profile.top_k_vals_ss(top_k=2)
+        self.assertEqual(0, top_k_vals['max_err'])
+        self.assertEqual([(50, 50, 1), (3, 3, None)], top_k_vals['rows'])
+        self.assertEqual(3, profile.n_nulls())
+
+    def test_max_vals_profile(self):
+        for max_vals in (8, 0, None):
+            with self.subTest(max_vals=max_vals):
+                summary = summarize_data.profile_tables(
+                    self.db_filename, [], self.table_definitions,
+                    col_info=('n_vals', 'n_nulls'), max_vals=max_vals)
+                yob = summary['people']['yob']
+                typ = summary['events']['typ']
+                self.assertEqual(7, yob['n_vals'])
+                self.assertEqual(['n_vals', 'n_nulls'], list(yob))
+                if max_vals:
+                    self.assertIsNone(typ['n_vals'])
+                    self.assertEqual(['n_vals', 'n_nulls', 'n_vals_hll'],
+                                     list(typ))
+                    self.assertAlmostEqual(
+                        11, typ['n_vals_hll']['estimate'], delta=1)
+                else:
+                    self.assertEqual(11, typ['n_vals'])
+                    self.assertEqual(['n_vals', 'n_nulls'], list(typ))
+
+    def test_max_vals_cli(self):
+        for (text, max_vals) in (('5', 5), ('0', 0), ('none', 0),
+                                 ('None', 0)):
+            with self.subTest(text):
+                self.assertEqual(
+                    max_vals, summarize_data._parse_max_vals(text))
+        with self.assertRaises(argparse.ArgumentTypeError):
+            summarize_data._parse_max_vals('-1')
+
+    def test_hll_near_linear_counting_switch(self):
+        # The original estimator overestimates by about 2.5% here, which
+        # is much more than the bias the standard error allows
+        precision = 12
+        n_vals = 11000
+        errors = []
+        for trial in range(10):
+            hll = summarize_data.HyperLogLog(precision)
+            hll.add(range(trial * 10 ** 9, trial * 10 ** 9 + n_vals))
+            errors.append(hll.estimate() / n_vals - 1)
+        self.assertLess(abs(sum(errors) / len(errors)), hll.std_err() / 2)
+        self.assertEqual(0, summarize_data.HyperLogLog().estimate())
+
+    def test_space_saving_bounds(self):
+        profile = summarize_data.ColumnProfile(
+            'x', ('top_k_vals_ss',), ss_n_counters=10)
+        values = [val for val in range(1, 30) for _ in range(val)]
+        profile.add(values[::2])
+        profile.add(values[1::2])
+        top_k_vals = profile.top_k_vals_ss(top_k=5)
+        self.assertGreater(top_k_vals['max_err'], 0)
+        self.assertEqual(5, len(top_k_vals['rows']))
+        for (lower, upper, val) in top_k_vals['rows']:
+            self.assertLessEqual(lower, val)
+            self.assertLessEqual(val, upper)
+
+    def test_profile_parallel_error(self):
+        with self.assertRaises(sqlite3.OperationalError):
+            summarize_data.profile_tables(
+                self.db_filename, [],
+                self.table_definitions + [('nothing', ('id',))],
+                n_workers=2)
+
+    def test_parallel_fails_fast(self):
+        def run(db, item):
+            if item == 'fail':
+                time.sleep(0.2)
+                raise ValueError(item)
+            # Takes minutes unless interrupted
+            return db.execute(
+                'with recursive c(x) as (select 1 union all '
+                'select x + 1 from c where x < 10000000000) '
+                'select count(*) from c;').fetchall()
+        start = time.perf_counter()
+        with self.assertRaises(ValueError):
+            summarize_data._map_parallel(
+                self.db_filename, [], run, ['slow', 'fail'], [0, 1], 2)
+        self.assertLess(time.perf_counter() - start, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()